@@ -2,26 +2,30 @@
 
 import secrets
 import string
-from argon2 import PasswordHasher
 import psycopg2
+import psycopg2.extras
 from psycopg2 import sql
 import dbconnection as dbc
 import eventlog as log
+import hashing
 import notification
+import sessions
 
 RED = '\033[91m' # Erorr Messages
 GREEN = '\033[92m' # Success Messages
 YELLOW = '\033[93m' # Notices to User
 
+USERNAME_CONSTRAINT = 'users_username_key' # UNIQUE constraint on users.username
+USERNAME_ATTEMPTS = 5 # usernames tried if concurrent registrations take the generated one
+
 def register_new_user(first_name:str,last_name:str,dob:str,email:str,role:int,admin_id:int) -> bool: #pylint: disable=too-many-arguments, disable=too-many-locals
     '''
     Function to sign up a new user. Takes user information as arg to sign up accordingly.
     Takes Admin's id as argument to create log in the eventlog database.
     If sign-up is successful, triggers notification email.
+    If the generated username is taken by a concurrent registration in the meantime,
+    the UNIQUE constraint rejects it and the next free username is allocated.
     '''
-    conn = dbc.establish_connection('authentication')
-    cursor = conn.cursor() # Connect Cursor to Authentication DB
-    username = generate_username(first_name, last_name)
     password = generate_password(12)
     clear_pswd = password[0]
     hash_pswd = password[1]
@@ -36,25 +40,39 @@ def register_new_user(first_name:str,last_name:str,dob:str,email:str,role:int,ad
         'last_name':last_name,
         'dob':dob,
         'role':role,
-        'uname':username,
+        'uname':None,
         'pw':hash_pswd,
         'stat':1,
         'email':email
         }
-    try:
-        cursor.execute(psql, val)
-        conn.commit()
-    except psycopg2.OperationalError as error:
-        print(RED + 'Issue with registering new user on database. Error:', error)
-        print(YELLOW + 'Error TYPE:', type(error))
-        return False
-    except psycopg2.errors.DatetimeFieldOverflow: #pylint: disable=no-member
-        print(RED + 'Issue with the given Date of Birth. Please check your input and try again.')
-        return False
+    for _ in range(USERNAME_ATTEMPTS):
+        username = generate_username(first_name, last_name)
+        val['uname'] = username
+        with dbc.connection('authentication') as conn:
+            cursor = conn.cursor() # Connect Cursor to Authentication DB
+            try:
+                cursor.execute(psql, val)
+                created_user_id = cursor.fetchone()[0]
+                conn.commit()
+            except psycopg2.errors.UniqueViolation as error: #pylint: disable=no-member
+                if error.diag.constraint_name == USERNAME_CONSTRAINT:
+                    continue # username was taken concurrently, allocate the next one
+                print(RED + 'Issue with registering new user on database. Error:', error)
+                return False
+            except psycopg2.OperationalError as error:
+                print(RED + 'Issue with registering new user on database. Error:', error)
+                print(YELLOW + 'Error TYPE:', type(error))
+                return False
+            except psycopg2.errors.DatetimeFieldOverflow: #pylint: disable=no-member
+                print(RED + 'Issue with the given Date of Birth. ', end='')
+                print('Please check your input and try again.')
+                return False
+        break
     else:
-        created_user_id = cursor.fetchone()[0]
-        log.admin_log('Create User', admin_id, created_user_id) # logging event in logs
-        print(GREEN + f'User successfully created. Sending Registration email to {email}...')
+        print(RED + 'Issue with registering new user: no unique username could be allocated.')
+        return False
+    log.admin_log('Create User', admin_id, created_user_id) # logging event in logs
+    print(GREEN + f'User successfully created. Sending Registration email to {email}...')
     sent_email = notification.registration_email(first_name, email, username, clear_pswd)
     if sent_email:
         print(GREEN + 'Email sent successfully!')
@@ -63,40 +81,109 @@ def register_new_user(first_name:str,last_name:str,dob:str,email:str,role:int,ad
     return True
 
 
+def register_users_bulk(users:list, admin_id:int) -> list: #pylint: disable=too-many-locals
+    '''
+    Bulk version of register_new_user to provision many users at once.
+    Takes a list of user dicts with first_name, last_name, dob, email and role, which must have
+    passed validation, and the Admin's id for the eventlog.
+    The passwords are hashed in parallel on the hashing pool, all users are inserted with a single
+    multi-row INSERT in one transaction, the 'Create User' logs are queued as one batch and the
+    registration emails are sent over one SMTP session.
+    Returns a list of dicts (id, email, username, email_sent) of the created users,
+    or None if the passwords could not be hashed or the transaction failed (no user is created).
+    '''
+    if not users:
+        return []
+    clear_pswds = [random_password(12) for _ in users]
+    try:
+        hash_pswds = hashing.hash_passwords(clear_pswds)
+    except hashing.PoolBusyError as error:
+        print(RED + 'Issue with hashing the passwords of the users. Error:', error)
+        return None
+    psql = """
+          INSERT INTO users 
+          (first_name, last_name, dob, user_role, username, password, status, email)
+          VALUES %s
+          RETURNING id, username
+          """
+    for _ in range(USERNAME_ATTEMPTS):
+        usernames = allocate_usernames(users)
+        rows = [
+            (user['first_name'], user['last_name'], user['dob'], user['role'], username, pswd, 1,
+             user['email'])
+            for user, username, pswd in zip(users, usernames, hash_pswds)
+        ]
+        with dbc.connection('authentication') as conn:
+            cursor = conn.cursor() # Connect Cursor to Authentication DB
+            try:
+                created = psycopg2.extras.execute_values(
+                    cursor, psql, rows, page_size=len(rows), fetch=True
+                )
+                conn.commit()
+            except psycopg2.errors.UniqueViolation as error: #pylint: disable=no-member
+                if error.diag.constraint_name == USERNAME_CONSTRAINT:
+                    continue # a username was taken concurrently, allocate the usernames again
+                print(RED + 'Issue with registering the users on database. Error:', error)
+                return None
+            except (psycopg2.OperationalError, psycopg2.DataError) as error:
+                print(RED + 'Issue with registering the users on database. Error:', error)
+                print(YELLOW + 'Error TYPE:', type(error))
+                return None
+        break
+    else:
+        print(RED + 'Issue with registering the users: no unique usernames could be allocated.')
+        return None
+
+    created_ids = dict((username, uid) for uid, username in created)
+    messages = []
+    for user, username, clear_pswd in zip(users, usernames, clear_pswds):
+        log.admin_log('Create User', admin_id, created_ids[username]) # queued as one batch
+        messages.append((user['email'], notification.registration_message(
+            user['first_name'], user['email'], username, clear_pswd
+        )))
+    with notification.SMTPTransport() as transport: # one SMTP session for all emails
+        sent = transport.send_bulk(messages)
+    return [
+        {'id':created_ids[username], 'email':user['email'], 'username':username,
+         'email_sent':sent[user['email']]}
+        for user, username in zip(users, usernames)
+    ]
+
+
 def modify_user(uid:int, attribute:str, new_value:str, admin_id:int) -> bool:
     '''
     Function to modify an existing user. Takes the user id as input to execute upon.
     The attribute sets the field to be modified, the new_value denotes the value after modification.
     '''
-    conn = dbc.establish_connection('authentication')
-    cursor = conn.cursor() # Connect Cursor to Authentication DB
-
-    stmt = sql.SQL("SELECT {attribute} FROM users WHERE id = {uid}").format(
-            attribute = sql.Identifier(attribute),
-            uid = sql.Literal(uid),
-    )
-    cursor.execute(stmt)
-
-    curr_val = cursor.fetchall()[0][0]
     if attribute == 'user_role':
         new_value = int(new_value) # change new value to int type if the user role is being changed
 
-    stmt = sql.SQL("UPDATE users SET {attribute} = {value} WHERE id = {uid}").format(
-            attribute = sql.Identifier(attribute),
-            uid = sql.Literal(uid),
-            value = sql.Literal(new_value),
-    )
-
-    try:
+    with dbc.connection('authentication') as conn:
+        cursor = conn.cursor() # Connect Cursor to Authentication DB
+        stmt = sql.SQL("SELECT {attribute} FROM users WHERE id = {uid}").format(
+                attribute = sql.Identifier(attribute),
+                uid = sql.Literal(uid),
+        )
         cursor.execute(stmt)
-        conn.commit()
-    except psycopg2.OperationalError as error:
-        print(RED + 'Issue with modifying user on database. Error:', error)
-        print(YELLOW + 'Error TYPE:', type(error))
-        return False
-    except psycopg2.errors.DatetimeFieldOverflow: #pylint: disable=no-member
-        print(RED + 'Issue with the given Date of Birth. Please check your input and try again.')
-        return False
+        curr_val = cursor.fetchall()[0][0]
+
+        stmt = sql.SQL("UPDATE users SET {attribute} = {value} WHERE id = {uid}").format(
+                attribute = sql.Identifier(attribute),
+                uid = sql.Literal(uid),
+                value = sql.Literal(new_value),
+        )
+
+        try:
+            cursor.execute(stmt)
+            conn.commit()
+        except psycopg2.OperationalError as error:
+            print(RED + 'Issue with modifying user on database. Error:', error)
+            print(YELLOW + 'Error TYPE:', type(error))
+            return False
+        except psycopg2.errors.DatetimeFieldOverflow: #pylint: disable=no-member
+            print(RED + 'Issue with the given Date of Birth. ', end='')
+            print('Please check your input and try again.')
+            return False
     log.admin_log(
         'Edit User',
         admin_id,
@@ -113,17 +200,17 @@ def unlock_user(uid:int, admin_id:int) -> bool:
     Function to unlock an already locked user. Input: admin's id and the id of the user to unlock.
     If unlock was successful, will return bool 'True'. If there was an error, returns bool 'False'.
     '''
-    conn = dbc.establish_connection('authentication')
-    cursor = conn.cursor() # Connect Cursor to Authentication DB
     psql = "UPDATE users SET status=1 WHERE id=%(uid)s"
     val = {'uid':uid}
-    try:
-        cursor.execute(psql,val)
-        conn.commit()
-    except psycopg2.OperationalError as error:
-        print(RED + 'Issue with unlocking user on database. Error:', error)
-        print(YELLOW + 'Error TYPE:', type(error))
-        return False
+    with dbc.connection('authentication') as conn:
+        cursor = conn.cursor() # Connect Cursor to Authentication DB
+        try:
+            cursor.execute(psql,val)
+            conn.commit()
+        except psycopg2.OperationalError as error:
+            print(RED + 'Issue with unlocking user on database. Error:', error)
+            print(YELLOW + 'Error TYPE:', type(error))
+            return False
     log.admin_log('Unlock User', admin_id, uid, modified='status', old_val='3', new_val='1')
     return True
 
@@ -133,18 +220,19 @@ def lock_user(uid:int) -> bool:
     Function to lock a user if there are more than three failed login attempts. Input: User's ID.
     If lock was successful, will return bool 'True'. If there unsuccessful, returns bool 'False'.
     '''
-    conn = dbc.establish_connection('authentication')
-    cursor = conn.cursor() # Connect Cursor to Authentication DB
     psql = "UPDATE users SET status=3 WHERE id=%(uid)s;"
     val = {'uid':uid}
-    try:
-        cursor.execute(psql,val)
-        conn.commit()
-    except psycopg2.OperationalError as error:
-        print(RED + 'Issue with locking user on database. Error:', error)
-        print(YELLOW + 'Error TYPE:', type(error))
-        return False
+    with dbc.connection('authentication') as conn:
+        cursor = conn.cursor() # Connect Cursor to Authentication DB
+        try:
+            cursor.execute(psql,val)
+            conn.commit()
+        except psycopg2.OperationalError as error:
+            print(RED + 'Issue with locking user on database. Error:', error)
+            print(YELLOW + 'Error TYPE:', type(error))
+            return False
     log.auth_log("Account Locked", uid) # log locked account event
+    sessions.revoke_user(uid)
     return True
 
 
@@ -153,17 +241,17 @@ def deactivate_user(uid:int, admin_id:int, curr_status:int) -> bool:
     Function to deactivate a user if the access is no longer needed. Input: User's ID.
     If deactivation was successful, will return bool 'True'. If not, returns bool 'False'.
     '''
-    conn = dbc.establish_connection('authentication')
-    cursor = conn.cursor() # Connect Cursor to Authentication DB
     psql = "UPDATE users SET status=2 WHERE id=%(uid)s;"
     val = {'uid':uid}
-    try:
-        cursor.execute(psql,val)
-        conn.commit()
-    except psycopg2.OperationalError as error:
-        print(RED + 'Issue with deactivating user on database. Error:', error)
-        print(YELLOW + 'Error TYPE:', type(error))
-        return False
+    with dbc.connection('authentication') as conn:
+        cursor = conn.cursor() # Connect Cursor to Authentication DB
+        try:
+            cursor.execute(psql,val)
+            conn.commit()
+        except psycopg2.OperationalError as error:
+            print(RED + 'Issue with deactivating user on database. Error:', error)
+            print(YELLOW + 'Error TYPE:', type(error))
+            return False
     log.admin_log(
         'Deactivate User',
         admin_id, uid,
@@ -171,44 +259,35 @@ def deactivate_user(uid:int, admin_id:int, curr_status:int) -> bool:
         old_val=str(curr_status),
         new_val='2'
         ) # log deactivation event
+    sessions.revoke_user(uid)
     return True
 
 
-def fetch_user_info(uid=None, email=None, username=None) -> tuple: #pylint: disable=too-many-return-statements
+def fetch_user_info(uid=None, email=None, username=None) -> tuple:
     '''
     Queries user information based on the given email, username or uid.
     Returns a tuple of user id, first name, last name, email, dob and status if user was found.
     Returns None if user was not found.
     '''
-    cursor = dbc.establish_connection('authentication').cursor() # Connect Cursor to Auth DB
     if uid is not None:
         psql = "SELECT * FROM users WHERE id=%(val)s"
         val = {'val':uid}
-        try:
-            cursor.execute(psql,val)
-            result = cursor.fetchall()[0]
-        except IndexError:
-            return None
-        return (result[0], result[1], result[2], result[9], result[3], result[8])
-    if email is not None:
+    elif email is not None:
         psql = "SELECT * FROM users WHERE email=%(val)s"
         val = {'val':email}
-        try:
-            cursor.execute(psql,val)
-            result = cursor.fetchall()[0]
-        except IndexError:
-            return None
-        return (result[0], result[1], result[2], result[9], result[3], result[8])
-    if username is not None:
+    elif username is not None:
         psql = "SELECT * FROM users WHERE username=%(val)s"
         val = {'val':username}
+    else:
+        return None
+    with dbc.connection('authentication') as conn:
+        cursor = conn.cursor() # Connect Cursor to Auth DB
         try:
             cursor.execute(psql,val)
             result = cursor.fetchall()[0]
         except IndexError:
             return None
-        return (result[0], result[1], result[2], result[9], result[3], result[8])
-    return None
+    return (result[0], result[1], result[2], result[9], result[3], result[8])
 
 
 def fetch_all_authorities() -> list:
@@ -217,10 +296,11 @@ def fetch_all_authorities() -> list:
     Returns a list of tuples containing pairs of emails and first_names
     to be used by the source notification email.
     '''
-    cursor = dbc.establish_connection('authentication').cursor() # Connect Cursor to Auth DB
     psql = "SELECT * FROM users WHERE user_role=3"
-    cursor.execute(psql)
-    result = cursor.fetchall()
+    with dbc.connection('authentication') as conn:
+        cursor = conn.cursor() # Connect Cursor to Auth DB
+        cursor.execute(psql)
+        result = cursor.fetchall()
     output = []
     for item in result:
         output.append((item[9], item[1]))
@@ -232,39 +312,82 @@ def generate_password(length:int) -> tuple:
     Function to generate a random, secure password with the given length.
     Returns the clear password, as well as the argon2 hash of the password.
     '''
-    password = ''.join((secrets.choice(string.ascii_letters + string.digits + string.punctuation)
-                        for i in range(length)))
-    a2_ph = PasswordHasher() # set password hasher for Argon2
-    hashed = a2_ph.hash(password)
+    password = random_password(length)
+    hashed = hashing.hash_password(password) # Argon2 hash computed on the hashing pool
     return (password, hashed)
 
 
+def random_password(length:int) -> str:
+    '''Returns a random, secure clear text password with the given length.'''
+    return ''.join((secrets.choice(string.ascii_letters + string.digits + string.punctuation)
+                    for i in range(length)))
+
+
 def generate_username(first_name, last_name) -> str:
     '''
     Function to return a valid username for the given first and last name.
     If combination is taken already, will add a running number to the end of the username.
+    All taken usernames of the combination are fetched in a single query and the lowest
+    free running number is picked.
+    '''
+    user_comb = username_combination(first_name, last_name)
+    return next_free_username(user_comb, taken_usernames([user_comb]))
+
+
+def allocate_usernames(users:list) -> list:
+    '''
+    Allocates the usernames for a list of user dicts (with first_name and last_name) at once.
+    Usernames are unique within the list as well as against the users table.
     '''
+    combinations = [username_combination(user['first_name'], user['last_name']) for user in users]
+    taken = taken_usernames(set(combinations))
+    usernames = []
+    for user_comb in combinations:
+        username = next_free_username(user_comb, taken)
+        taken.add(username) # reserve the username for the rest of the list
+        usernames.append(username)
+    return usernames
+
+
+def username_combination(first_name:str, last_name:str) -> str:
+    '''Returns the username without running number: first letter of first name + '.' + last name'''
     user_comb = first_name[0] + '.' + last_name
-    user_comb = user_comb.lower()
-    if not username_exists(user_comb):
+    return user_comb.lower()
+
+
+def next_free_username(user_comb:str, taken:set) -> str:
+    '''Returns the combination, or with the lowest running number that is not in taken.'''
+    if user_comb not in taken:
         return user_comb
     running_number = 1
-    while True:
-        if not username_exists(user_comb+str(running_number)):
-            return user_comb+str(running_number)
+    while user_comb+str(running_number) in taken:
         running_number += 1
+    return user_comb+str(running_number)
 
 
-def username_exists(username:str) -> bool:
+def taken_usernames(combinations) -> set:
     '''
-    Checks the users database if a given username exists in the DB already.
-    If not, returns bool 'False', if it exists returns bool 'True'.
+    Returns the set of all existing usernames starting with one of the given combinations.
+    Fetched in a single query.
     '''
-    cursor = dbc.establish_connection('authentication').cursor() # Connect Cursor to Auth DB
-    psql = "SELECT count(*) FROM users WHERE username=%(val)s"
-    val = {'val':username}
-    cursor.execute(psql,val)
-    result = cursor.fetchone()[0]
-    if result == 0:
-        return False
-    return True
+    # escape the LIKE wildcards of the combinations and match any suffix
+    patterns = [
+        comb.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        for comb in combinations
+    ]
+    psql = "SELECT username FROM users WHERE username LIKE ANY(%(val)s)"
+    val = {'val':patterns}
+    with dbc.connection('authentication') as conn:
+        cursor = conn.cursor() # Connect Cursor to Auth DB
+        cursor.execute(psql,val)
+        return {row[0] for row in cursor.fetchall()}
+
+
+def existing_emails(emails:list) -> set:
+    '''Returns the subset of the given email addresses that are tied to a user already.'''
+    psql = "SELECT email FROM users WHERE email = ANY(%(val)s)"
+    val = {'val':list(emails)}
+    with dbc.connection('authentication') as conn:
+        cursor = conn.cursor() # Connect Cursor to Auth DB
+        cursor.execute(psql,val)
+        return {row[0] for row in cursor.fetchall()}
@@ -0,0 +1,446 @@
+"""
+Module providing the HTTP/JSON API of the System for integrations (e.g. SIEM enrichment).
+The server runs on asyncio; the blocking operations run on a thread pool sharing the database
+connection pools. Clients log in once via POST /login and send the returned session token as
+"Authorization: Bearer <token>", so Argon2 only runs at login. The operations and role checks
+are the ones of the command mode (commands.py).
+Start with: python api.py [--host HOST] [--port PORT]
+
+Endpoints (roles: 1 = Administrator, 2 = Specialist, 3 = Authority):
+    POST  /login                {"username", "password"}  -> {"token", "expires_in", "role"}
+    POST  /logout
+    GET   /metrics              Prometheus text format, no token required
+    GET   /sources/search       ?field=url&term=...&after_id=&limit=    (2, 3)
+    GET   /sources/lookup       ?url=...&url=...  or POST {"urls": [...]}  (2, 3)
+    GET   /sources/stats        ?by=threat_level|creation_month|both   (1, 2, 3)
+    GET   /sources/<id>                                                  (2, 3)
+    POST  /sources              {"name", "url", "threat_level", "description"}  (2)
+    PATCH /sources/<id>         {"field", "value"}                       (2)
+    POST  /users                {"first_name", "last_name", "email", "dob", "role"}  (1)
+    POST  /users/unlock         {"email"}                                (1)
+    POST  /users/deactivate     {"email"}                                (1)
+"""
+
+import argparse
+import asyncio
+import json
+import re
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+import psycopg2
+import psycopg2.pool
+import authentication as auth
+import commands
+import eventlog as log
+import hashing
+import metrics
+import sessions
+import settings
+
+RED = '\033[91m' # Error Messages
+GREEN = '\033[92m' # Success Messages
+
+
+COMMAND_SECONDS = metrics.histogram(
+    'sss_api_command_seconds', 'Duration of the API commands (incl. waiting for a worker thread)'
+)
+# Errors after which the request may succeed later (answered with 503 Service Unavailable)
+UNAVAILABLE_ERRORS = (
+    hashing.PoolBusyError, psycopg2.pool.PoolError, psycopg2.OperationalError,
+    psycopg2.InterfaceError
+)
+
+
+class HTTPError(Exception):
+    """Raised to answer a request with an error status and message."""
+
+    def __init__(self, status:int, message:str):
+        super().__init__(message)
+        self.status = status
+
+
+def client_address(peer_address:str, headers:dict) -> str:
+    '''
+    Returns the address of the client of a request. If the peer is a trusted reverse proxy,
+    the address is taken from X-Forwarded-For, skipping the trusted proxies from the right.
+    '''
+    address = peer_address
+    forwarded = [part.strip() for part in headers.get('x-forwarded-for', '').split(',')]
+    forwarded = [part for part in forwarded if part]
+    while address in settings.API_TRUSTED_PROXIES and forwarded:
+        address = forwarded.pop()
+    return address
+
+
+def single(query:dict, key:str, default=None, required:bool=False) -> str:
+    '''Returns a single query parameter value.'''
+    if key not in query:
+        if required:
+            raise HTTPError(400, f"missing parameter '{key}'")
+        return default
+    return query[key][0]
+
+
+def number(value, name:str) -> int:
+    '''Converts a parameter to int, answering 400 if it is not a number.'''
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise HTTPError(400, f"'{name}' must be a number") from None
+
+
+def fields(body:dict, *names) -> dict:
+    '''Returns the required fields of a JSON body, answering 400 if one is missing.'''
+    missing = [name for name in names if body.get(name) in (None, '')]
+    if missing:
+        raise HTTPError(400, f"missing field(s): {', '.join(missing)}")
+    return {name: body[name] for name in names}
+
+
+def text(body:dict, *names) -> dict:
+    '''Returns the required text fields of a JSON body, answering 400 if one is not a string.'''
+    values = fields(body, *names)
+    wrong = [name for name in names if not isinstance(values[name], str)]
+    if wrong:
+        raise HTTPError(400, f"field(s) must be strings: {', '.join(wrong)}")
+    return values
+
+
+def choice(value, choices:tuple, name:str):
+    '''Checks a value against its allowed choices, answering 400 otherwise.'''
+    if value not in choices:
+        raise HTTPError(400, f"'{name}' must be one of: {', '.join(map(str, choices))}")
+    return value
+
+
+# the argument builders all take (path match, query parameters, JSON body)
+#pylint: disable=unused-argument
+def search_args(match, query:dict, body:dict) -> argparse.Namespace:
+    '''Arguments of GET /sources/search.'''
+    limit = number(single(query, 'limit', settings.SEARCH_PAGE_SIZE), 'limit')
+    return argparse.Namespace(
+        field=choice(single(query, 'field', required=True), commands.SEARCH_FIELDS, 'field'),
+        term=single(query, 'term', required=True),
+        after_id=number(single(query, 'after_id'), 'after_id'),
+        limit=min(max(limit, 1), commands.MAX_LIMIT),
+    )
+
+
+def lookup_args(match, query:dict, body:dict) -> argparse.Namespace:
+    '''Arguments of GET/POST /sources/lookup.'''
+    urls = body.get('urls') if body else query.get('url')
+    if not isinstance(urls, list) or not urls or not all(isinstance(url, str) for url in urls):
+        raise HTTPError(400, "expected a list of urls")
+    if len(urls) > settings.API_MAX_LOOKUP_URLS:
+        raise HTTPError(413, f"at most {settings.API_MAX_LOOKUP_URLS} urls per request")
+    return argparse.Namespace(url=urls)
+
+
+def stats_args(match, query:dict, body:dict) -> argparse.Namespace:
+    '''Arguments of GET /sources/stats.'''
+    group_by = single(query, 'by', 'threat_level')
+    return argparse.Namespace(by=choice(group_by, ('threat_level', 'creation_month', 'both'), 'by'))
+
+
+def source_id_args(match, query:dict, body:dict) -> argparse.Namespace:
+    '''Arguments of GET /sources/<id>.'''
+    return argparse.Namespace(id=int(match.group(1)))
+
+
+def create_source_args(match, query:dict, body:dict) -> argparse.Namespace:
+    '''Arguments of POST /sources.'''
+    values = text(body, 'name', 'url', 'description')
+    values['threat_level'] = number(fields(body, 'threat_level')['threat_level'], 'threat_level')
+    return argparse.Namespace(**values)
+
+
+def modify_source_args(match, query:dict, body:dict) -> argparse.Namespace:
+    '''Arguments of PATCH /sources/<id>.'''
+    values = fields(body, 'field', 'value')
+    if not isinstance(values['value'], (str, int)) or isinstance(values['value'], bool):
+        raise HTTPError(400, "'value' must be a string or number")
+    return argparse.Namespace(
+        id=int(match.group(1)),
+        field=choice(values['field'], commands.SEARCH_FIELDS, 'field'),
+        value=str(values['value']),
+    )
+
+
+def create_user_args(match, query:dict, body:dict) -> argparse.Namespace:
+    '''Arguments of POST /users.'''
+    values = text(body, 'first_name', 'last_name', 'email', 'dob')
+    role = number(fields(body, 'role')['role'], 'role')
+    values['role'] = choice(role, (1, 2, 3), 'role')
+    return argparse.Namespace(**values)
+
+
+def email_args(match, query:dict, body:dict) -> argparse.Namespace:
+    '''Arguments of POST /users/unlock and /users/deactivate.'''
+    return argparse.Namespace(**text(body, 'email'))
+
+
+#pylint: enable=unused-argument
+
+# (method, path pattern, command of commands.HANDLERS, argument builder)
+ROUTES = [
+    ('GET', r'/sources/search', 'search', search_args),
+    ('GET', r'/sources/lookup', 'source lookup', lookup_args),
+    ('POST', r'/sources/lookup', 'source lookup', lookup_args),
+    ('GET', r'/sources/stats', 'source stats', stats_args),
+    ('GET', r'/sources/(\d+)', 'source show', source_id_args),
+    ('POST', r'/sources', 'source create', create_source_args),
+    ('PATCH', r'/sources/(\d+)', 'source modify', modify_source_args),
+    ('POST', r'/users', 'user create', create_user_args),
+    ('POST', r'/users/unlock', 'user unlock', email_args),
+    ('POST', r'/users/deactivate', 'user deactivate', email_args),
+]
+
+
+class APIServer:
+    """
+    Minimal HTTP/1.1 server (keep-alive, Content-Length bodies, JSON only) on asyncio streams.
+    Clients are identified by the session tokens of the sessions module.
+    """
+
+    def __init__(self, workers:int=settings.API_WORKERS, token_ttl:int=settings.API_TOKEN_TTL):
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.token_ttl = token_ttl
+
+    async def handle_connection(self, reader, writer):
+        '''Serves the requests of one client connection until it is closed or idle.'''
+        peer = writer.get_extra_info('peername')
+        try:
+            while True:
+                try:
+                    request = await self.read_request(reader)
+                except HTTPError as error:
+                    await self.respond(writer, error.status, {'error': str(error)}, False)
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                # login throttling source
+                source = f"api@{client_address(peer[0], headers)}" if peer else 'api'
+                status, payload = await self.dispatch(method, target, headers, body, source)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def read_request(reader) -> tuple:
+        '''
+        Reads one request. Returns (method, target, headers, body) or None if the client
+        closed the connection or stayed idle for longer than the keep-alive timeout.
+        '''
+        try:
+            line = await asyncio.wait_for(reader.readline(), settings.API_KEEPALIVE_TIMEOUT)
+        except asyncio.TimeoutError:
+            return None
+        except ValueError: # line longer than the stream limit
+            raise HTTPError(414, "request line too long") from None
+        if not line:
+            return None
+        parts = line.decode('latin-1').split()
+        if len(parts) != 3 or not parts[2].startswith('HTTP/1.'):
+            raise HTTPError(400, "malformed request line")
+        try: # a client that stops sending is disconnected like an idle one
+            headers = await asyncio.wait_for(
+                APIServer.read_headers(reader), settings.API_KEEPALIVE_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            return None
+        if 'transfer-encoding' in headers:
+            raise HTTPError(411, "chunked bodies are not supported, send Content-Length")
+        length = number(headers.get('content-length', '0'), 'Content-Length')
+        if length < 0:
+            raise HTTPError(400, "invalid Content-Length")
+        if length > settings.API_MAX_BODY:
+            raise HTTPError(413, "request body too large")
+        try:
+            body = await asyncio.wait_for(
+                reader.readexactly(length), settings.API_KEEPALIVE_TIMEOUT
+            ) if length else b''
+        except asyncio.TimeoutError:
+            return None
+        return (parts[0].upper(), parts[1], headers, body)
+
+    @staticmethod
+    async def read_headers(reader) -> dict:
+        '''Reads the header lines of a request. Returns the headers with lowercase names.'''
+        headers = {}
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError: # line longer than the stream limit
+                raise HTTPError(431, "header line too long") from None
+            if line in (b'\r\n', b'\n', b''):
+                return headers
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+            if len(headers) > 100:
+                raise HTTPError(431, "too many headers")
+
+    @staticmethod
+    async def respond(writer, status:int, payload, keep_alive:bool):
+        '''Writes a JSON response, or a plain text response if the payload is a string.'''
+        if isinstance(payload, str):
+            body = payload.encode('utf-8')
+            content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        else:
+            body = json.dumps(payload, default=str).encode('utf-8')
+            content_type = 'application/json'
+        head = (
+            f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    async def dispatch( #pylint: disable=too-many-arguments
+            self, method:str, target:str, headers:dict, body:bytes, source:str
+        ) -> tuple:
+        '''Routes a request and returns (status, payload). The source is the client address.'''
+        url = urlsplit(target)
+        try:
+            data = json.loads(body.decode('utf-8')) if body else {}
+            if not isinstance(data, dict):
+                raise ValueError("body must be a JSON object")
+        except ValueError as error:
+            return (400, {'error': f"invalid JSON body: {error}"})
+        try:
+            if url.path == '/metrics' and method == 'GET':
+                return (200, metrics.render())
+            if url.path == '/login' and method == 'POST':
+                return (200, await self.login(data, source))
+            login = await self.authorize(headers)
+            if url.path == '/logout' and method == 'POST':
+                await self.run_blocking(sessions.revoke, headers['authorization'][7:].strip())
+                return (200, {'logged_out': True})
+            return (200, await self.run_route(method, url.path, parse_qs(url.query), data, login))
+        except HTTPError as error:
+            return (error.status, {'error': str(error)})
+        except UNAVAILABLE_ERRORS as error:
+            print(RED + f"{method} {url.path} failed, service unavailable. Error:", error,
+                  file=sys.stderr)
+            return (503, {'error': "service temporarily unavailable, retry later"})
+        except Exception: #pylint: disable=broad-except
+            print(RED + f"{method} {url.path} failed with an unexpected error:", file=sys.stderr)
+            traceback.print_exc()
+            return (500, {'error': "internal server error"})
+
+    async def run_route(self, method:str, path:str, query:dict, data:dict, login:tuple) -> dict:
+        '''Runs the command of the matching route as the authenticated user.'''
+        allowed = []
+        for route_method, pattern, command, build in ROUTES:
+            match = re.fullmatch(pattern, path)
+            if match is None:
+                continue
+            if route_method != method:
+                allowed.append(route_method)
+                continue
+            if login[2] not in commands.ROLES[command]:
+                raise HTTPError(403, f"'{command}' is not permitted for this user role")
+            args = build(match, query, data)
+            try:
+                with COMMAND_SECONDS.time(command=command):
+                    return await self.run_blocking(commands.HANDLERS[command], args, login[0])
+            except commands.NotFoundError as error:
+                raise HTTPError(404, str(error)) from None
+            except commands.CommandError as error:
+                raise HTTPError(400, str(error)) from None
+        if allowed:
+            raise HTTPError(405, f"use {' or '.join(allowed)}")
+        raise HTTPError(404, "unknown endpoint")
+
+    async def run_blocking(self, func, *args):
+        '''Runs a blocking function (database, hashing) on the worker threads.'''
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def login(self, data:dict, source:str) -> dict:
+        '''Authenticates a user and issues a session token.'''
+        credentials = fields(data, 'username', 'password')
+        with COMMAND_SECONDS.time(command='login'): # remote clients cannot lock accounts
+            status, login = await self.run_blocking(
+                auth.authenticate, str(credentials['username']), str(credentials['password']),
+                source, False
+            )
+        if status == 'busy':
+            raise HTTPError(503, "too many logins in progress, retry later")
+        if status == 'throttled':
+            raise HTTPError(429, "too many failed logins, retry later")
+        if status == 'error':
+            raise HTTPError(503, "authentication is unavailable")
+        if status != 'ok':
+            raise HTTPError(401, "invalid credentials or inactive user")
+        log.auth_log("Successful Login", login[0])
+        token = await self.run_blocking(
+            sessions.create, login, str(credentials['username']), self.token_ttl
+        )
+        if token is None:
+            raise HTTPError(503, "session could not be started")
+        return {'token': token, 'expires_in': self.token_ttl, 'role': login[2]}
+
+    async def authorize(self, headers:dict) -> tuple:
+        '''Returns the user of the bearer token of a request, answering 401 if it is invalid.'''
+        value = headers.get('authorization', '')
+        if not value.startswith('Bearer '):
+            raise HTTPError(401, "missing bearer token, log in via POST /login")
+        if settings.SESSION_STORE == 'memory': # a dictionary lookup, no need for a thread
+            session = sessions.resolve(value[7:].strip())
+        else:
+            session = await self.run_blocking(sessions.resolve, value[7:].strip())
+        if session is None:
+            raise HTTPError(401, "invalid or expired token")
+        return (session.uid, session.first_name, session.role)
+
+    def shutdown(self):
+        '''Waits for running operations and stops the worker threads.'''
+        self.executor.shutdown(wait=True)
+
+
+async def serve(host:str, port:int):
+    '''Serves the API on the given address until the task is cancelled.'''
+    server = APIServer()
+    listener = await asyncio.start_server(server.handle_connection, host, port)
+    print(GREEN + f"API listening on http://{host}:{port}")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.shutdown()
+
+
+def main():
+    '''Parses the arguments and serves the API until interrupted.'''
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default=settings.API_HOST)
+    parser.add_argument('--port', type=int, default=settings.API_PORT)
+    args = parser.parse_args()
+
+    try:
+        sessions.signing_key() # refuse to start without the key shared by all API processes
+    except sessions.SigningKeyError as error:
+        print(RED + str(error))
+        return
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        log.shutdown() # write all queued event logs before exiting
+
+
+if __name__ == '__main__':
+    main()
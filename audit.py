@@ -0,0 +1,148 @@
+"""
+Module to query the event logs for audits (Administrator role).
+Provides filtered, paginated queries of the log tables and pre-aggregated reports,
+backed by the indexes and report views of "Eventlog_audit_reports.sql".
+Refresh the report views regularly, e.g. hourly via cron: python audit.py --refresh
+"""
+
+import argparse
+from datetime import timedelta
+import psycopg2
+from psycopg2 import sql
+import dbconnection as dbc
+import eventlog as log
+import settings
+
+RED = '\033[91m' # Error Messages
+GREEN = '\033[92m' # Success Messages
+
+# Columns each log table can be filtered on (exact match)
+FILTERS = {
+    'authlogs': ('user_id', 'operation'),
+    'operationlogs': ('user_id', 'source_id', 'operation'),
+    'adminlogs': ('admin_id', 'user_id', 'operation'),
+}
+REPORT_VIEWS = ('source_views_daily', 'failed_logins_daily')
+
+
+def date_range(column:sql.Composable, since=None, until=None) -> list:
+    '''Returns the conditions limiting a column to the dates since and until (inclusive).'''
+    conditions = []
+    if since is not None:
+        conditions.append(sql.SQL("{} >= {}").format(column, sql.Literal(since)))
+    if until is not None:
+        conditions.append(sql.SQL("{} < {}").format(column, sql.Literal(until + timedelta(days=1))))
+    return conditions
+
+
+def where(conditions:list) -> sql.Composable:
+    '''Joins conditions to a WHERE clause (empty if there are no conditions).'''
+    if not conditions:
+        return sql.SQL("")
+    return sql.SQL(" WHERE ") + sql.SQL(" AND ").join(conditions)
+
+
+def query_logs( #pylint: disable=too-many-arguments
+    table:str, filters:dict=None, since=None, until=None, before:tuple=None,
+    page_size:int=settings.AUDIT_PAGE_SIZE
+) -> tuple:
+    '''
+    Function to fetch one page of log entries, newest first.
+    Filters is a dict of column/value pairs (see FILTERS), since and until are dates (inclusive).
+    For the following page, pass the (datetime, id) of the last entry shown as before.
+    Returns a tuple: (list of rows with the id followed by the LOG_COLUMNS, has next page)
+    or None if the query failed.
+    '''
+    conditions = []
+    for column, value in (filters or {}).items():
+        if column not in FILTERS[table]:
+            raise ValueError(f"'{table}' cannot be filtered by '{column}'")
+        conditions.append(sql.SQL("{} = {}").format(sql.Identifier(column), sql.Literal(value)))
+    conditions.extend(date_range(sql.Identifier('datetime'), since, until))
+    if before is not None:
+        conditions.append(sql.SQL("(datetime, id) < ({}, {})").format(*map(sql.Literal, before)))
+    psql = sql.SQL(
+        "SELECT {columns} FROM {table}{where} ORDER BY datetime DESC, id DESC LIMIT {limit}"
+    ).format(
+        columns=sql.SQL(', ').join(map(sql.Identifier, ('id',) + log.LOG_COLUMNS[table])),
+        table=sql.Identifier(table),
+        where=where(conditions),
+        limit=sql.Literal(page_size + 1), # one extra row tells whether there is a next page
+    )
+    rows = fetch(psql)
+    if rows is None:
+        return None
+    return (rows[:page_size], len(rows) > page_size)
+
+
+def source_views(source_id:int=None, since=None, until=None,
+                 limit:int=settings.AUDIT_REPORT_LIMIT) -> list:
+    '''
+    Report of the views per source per day, newest day first.
+    Returns a list of (day, source id, views) tuples or None if the query failed.
+    '''
+    conditions = date_range(sql.Identifier('day'), since, until)
+    if source_id is not None:
+        conditions.append(sql.SQL("source_id = {}").format(sql.Literal(source_id)))
+    return fetch(sql.SQL(
+        "SELECT day, source_id, views FROM source_views_daily{where} "
+        "ORDER BY day DESC, views DESC, source_id LIMIT {limit}"
+    ).format(where=where(conditions), limit=sql.Literal(limit)))
+
+
+def failed_logins(since=None, until=None, limit:int=settings.AUDIT_REPORT_LIMIT) -> list:
+    '''
+    Report of the failed logins per user in the time range, most attempts first.
+    Returns a list of (user id, attempts, last day with a failed login) tuples
+    or None if the query failed.
+    '''
+    return fetch(sql.SQL(
+        "SELECT user_id, sum(attempts) AS total, max(day) FROM failed_logins_daily{where} "
+        "GROUP BY user_id ORDER BY total DESC, user_id LIMIT {limit}"
+    ).format(
+        where=where(date_range(sql.Identifier('day'), since, until)), limit=sql.Literal(limit)
+    ))
+
+
+def fetch(psql:sql.Composable) -> list:
+    '''Runs a query on the eventlog DB. Returns all rows or None if the query failed.'''
+    with dbc.connection('eventlog') as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(psql)
+            rows = cursor.fetchall()
+            conn.commit()
+        except psycopg2.Error as error:
+            print(RED + 'Issue with querying the event logs. Error:', error)
+            return None
+    return rows
+
+
+def refresh_reports() -> bool:
+    '''
+    Recomputes the report views without blocking the reports meanwhile.
+    Returns True if successful and False if not.
+    '''
+    with dbc.connection('eventlog') as conn:
+        cursor = conn.cursor()
+        try:
+            for view in REPORT_VIEWS:
+                cursor.execute(sql.SQL("REFRESH MATERIALIZED VIEW CONCURRENTLY {}").format(
+                    sql.Identifier(view)
+                ))
+                conn.commit()
+        except psycopg2.Error as error:
+            print(RED + 'Issue with refreshing the audit reports. Error:', error)
+            return False
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--refresh', action='store_true', help='refresh the report views')
+    if not parser.parse_args().refresh:
+        parser.print_help()
+    elif not refresh_reports():
+        raise SystemExit(1)
+    else:
+        print(GREEN + 'Audit reports refreshed.')
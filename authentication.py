@@ -1,66 +1,148 @@
 """This module handles the login and password hashing functionality."""
 
 from datetime import datetime
+import socket
 import sys
 import argon2 # Argon2 lib to hash password
 import psycopg2
+import stdiomask
+import admin_operations as adops
 import dbconnection as dbc
 import eventlog as log
+import hashing
+import settings
+import throttling
+import validation
 
 WHITE = '\033[97m' # User Input
 RED = '\033[91m' # Error Messages
 
-# set Argon2 password hasher object
-ph = argon2.PasswordHasher()
+LOCAL_SOURCE = f"cli@{socket.gethostname()}" # throttling source of the command-line logins
 
 def hash_pswd(password:str) -> str:
     """
     Uses Argon2 to hash password and returns hash as string.
-    Takes clear text password string as input.
+    Takes clear text password string as input. The hash is computed on the hashing pool.
     """
-    hashed = ph.hash(password)
+    hashed = hashing.hash_password(password)
     return hashed
 
 
-def existing_user(user:str, password:str) -> tuple: #pylint: disable=inconsistent-return-statements
+def authenticate(user:str, password:str, source:str=LOCAL_SOURCE, lockout:bool=True) -> tuple:
     '''
-    Function to authenticate existing user against the database.
-    Takes username and clear password as input.
-    If successful, returns authenticated user as tuple: (user id, first name, user role).
-    If username not found or user is locked or deactivated, returns None.
-    If password was incorrect, returns False.
+    Function to authenticate existing user against the database, without any console output.
+    Takes username, clear password and the source of the login (client address or host) as input.
+    With lockout, the user is locked after LOGIN_LOCKOUT_FAILURES incorrect passwords from the same
+    source; remote clients pass lockout=False, so that they cannot lock the accounts of others and
+    are limited by the throttling window alone.
+    Returns a tuple: (status, authenticated user as (user id, first name, user role) or None)
+    The status is one of: 'ok', 'unknown' (username not found), 'incorrect' (wrong password),
+    'throttled' (too many failed logins of the username or source, the password was not checked),
+    'lockout' (wrong password, the user has now been locked), 'deactivated', 'locked',
+    'busy' (the hashing pool is saturated) or 'error' (database issue).
     '''
-    cursor = dbc.establish_connection('authentication').cursor()
+    if not throttling.allowed(user, source): # checked before any Argon2 computation
+        return ('throttled', None)
     sql = 'SELECT id, first_name, user_role, password, status FROM users WHERE username = %(val)s'
     val = {'val':user}
     try:
-        cursor.execute(sql,val)
-        result = cursor.fetchall()[0]
-    except psycopg2.OperationalError as error:
-        print(RED+"Encountered an issue with the database. Error:", error)
-        print(WHITE, end='')
-        return None
+        with dbc.connection('authentication') as conn:
+            cursor = conn.cursor()
+            cursor.execute(sql,val)
+            result = cursor.fetchall()[0]
+    except psycopg2.Error: # incl. an exhausted connection pool
+        return ('error', None)
     except IndexError:
-        return None
+        throttling.record_failure(user, source)
+        return ('unknown', None)
     user_status = result[4]
     if user_status==2:
         log.auth_log("Failed Login: Deactivated User", result[0])
+        return ('deactivated', None)
+    if user_status==3:
+        log.auth_log("Failed Login: Locked User", result[0])
+        return ('locked', None)
+    try:
+        match = hashing.verify_password(result[3], password) # Argon2 runs on the hashing pool
+    except argon2.exceptions.VerifyMismatchError:
+        match = False
+    except hashing.PoolBusyError:
+        return ('busy', None)
+    if not match:
+        log.auth_log("Failed Login: Incorrect Password", result[0])
+        failures = throttling.record_failure(user, source)
+        if lockout and settings.LOGIN_LOCKOUT_FAILURES and \
+                failures >= settings.LOGIN_LOCKOUT_FAILURES:
+            adops.lock_user(result[0]) # consistent across all processes and sessions
+            return ('lockout', None)
+        return ('incorrect', None)
+    throttling.reset(user)
+    if hashing.needs_rehash(result[3]): # stored with an older hashing profile
+        rehash(result[0], result[3], password)
+    return ('ok', (result[0], result[1], result[2]))
+
+
+def rehash(uid:int, old_hash:str, password:str) -> bool:
+    '''
+    Replaces a user's stored hash with one of the current hashing profile, using the clear
+    password of a successful login. The hash is only replaced if it has not changed meanwhile.
+    Returns True if the hash was replaced and False if not (the login is not affected).
+    '''
+    try:
+        new_hash = hashing.hash_password(password)
+    except hashing.PoolBusyError:
+        return False # upgraded on a later login
+    sql = 'UPDATE users SET password = %(new)s WHERE id = %(uid)s AND password = %(old)s'
+    val = {'new':new_hash, 'uid':uid, 'old':old_hash}
+    try:
+        with dbc.connection('authentication') as conn:
+            cursor = conn.cursor()
+            cursor.execute(sql,val)
+            conn.commit()
+            return cursor.rowcount == 1
+    except psycopg2.OperationalError:
+        return False
+
+
+def existing_user(user:str, password:str) -> tuple:
+    '''
+    Function to authenticate existing user against the database (interactive login).
+    Takes username and clear password as input.
+    If successful, returns authenticated user as tuple: (user id, first name, user role).
+    If username not found or user is locked or deactivated, returns None.
+    If password was incorrect, returns False.
+    Locked, deactivated and throttled users are shown a notice and the CLI is terminated.
+    '''
+    status, login = authenticate(user, password)
+    if status == 'throttled':
+        print(RED+'Too many failed login attempts. Please try again in a few minutes.')
+        print(WHITE)
+        sys.exit()
+    elif status == 'lockout':
+        print(RED+'Your account has been locked because it reached ', end='')
+        print('a maximum amount of failed login attempts.')
+        print('Please contact the system administrator team for further assistance.\n')
+        print(WHITE)
+        sys.exit()
+    elif status == 'error':
+        print(RED+"Encountered an issue with the database. Please try again later.")
+        print(WHITE, end='')
+    elif status == 'busy':
+        print(RED+"Too many logins in progress. Please try again later.")
+        print(WHITE, end='')
+    elif status == 'deactivated':
         print('This user is deactivated.', end='')
         print('Please contact the system administrator team for further information.')
         print(WHITE)
         sys.exit()
-    elif user_status==3:
-        log.auth_log("Failed Login: Locked User", result[0])
+    elif status == 'locked':
         print(RED+'This user is currently locked. ', end='')
         print('Please contact the system administrator team for further information.')
         print(WHITE)
         sys.exit()
-    try:
-        match = ph.verify(result[3], password)
-    except argon2.exceptions.VerifyMismatchError:
+    elif status == 'incorrect':
         return False
-    if match:
-        return (result[0], result[1], result[2])
+    return login
 
 
 def update_last_login(uid:int) -> bool:
@@ -68,16 +150,16 @@ def update_last_login(uid:int) -> bool:
     Function to update a user's last login value with the current datetime stamp.
     Returns True if successful and False if not.
     '''
-    conn = dbc.establish_connection('authentication')
-    cursor = conn.cursor()
     now = datetime.now()
     sql = 'UPDATE users SET last_login = %(now)s WHERE id = %(uid)s'
     val = {'now':now, 'uid':uid}
-    try:
-        cursor.execute(sql,val)
-        conn.commit()
-    except psycopg2.OperationalError:
-        return False
+    with dbc.connection('authentication') as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql,val)
+            conn.commit()
+        except psycopg2.OperationalError:
+            return False
     return True
 
 
@@ -86,12 +168,29 @@ def fetch_last_login(uid:int) -> str:
     Function to fetch a user's last login date.
     Returns date string if existent or None if empty.
     '''
-    cursor = dbc.establish_connection('authentication').cursor()
     sql = 'SELECT last_login FROM users WHERE id=%(uid)s'
     val = {'uid':uid}
-    try:
-        cursor.execute(sql,val)
-        result = cursor.fetchall()[0][0]
-    except IndexError:
-        return None
+    with dbc.connection('authentication') as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql,val)
+            result = cursor.fetchall()[0][0]
+        except IndexError:
+            return None
     return result
+
+
+def prompt_login(roles:tuple) -> tuple:
+    '''
+    Prompts for username and password on the command line tools (e.g. bulk imports).
+    Only users with one of the given roles are accepted.
+    Returns the authenticated user as tuple: (user id, first name, user role), or None.
+    '''
+    inpt_username = input(WHITE + "Please enter your Username: ")
+    if not validation.is_valid_username(inpt_username):
+        return None
+    login = existing_user(inpt_username, stdiomask.getpass())
+    if not login or login[2] not in roles:
+        return None
+    log.auth_log("Successful Login", login[0]) # log successful login
+    return login
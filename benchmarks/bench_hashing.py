@@ -0,0 +1,62 @@
+"""
+Benchmark for the Argon2 hashing pool. Reports verifies per second for different pool sizes.
+Run from the project root: python benchmarks/bench_hashing.py --sizes 0 1 2 4 --verifies 64
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hashing # pylint: disable=wrong-import-position
+
+PASSWORD = 'F44aF#rhVgs9hAH8'
+
+
+def bench_pool_size(workers:int, verifies:int) -> dict:
+    '''
+    Runs the given number of concurrent verifies on a hashing pool with the given worker count.
+    Returns the measured throughput as a dict.
+    '''
+    pool = hashing.HashingPool(workers=workers, max_pending=max(workers, 1) * 4)
+    hashed = pool.hash(PASSWORD) # also starts the worker processes before timing
+    start = time.perf_counter()
+    futures = [pool.submit(hashing._verify, hashed, PASSWORD) for _ in range(verifies)] #pylint: disable=protected-access
+    for future in futures:
+        future.result()
+    elapsed = time.perf_counter() - start
+    pool.shutdown()
+    return {
+        'workers':workers,
+        'verifies':verifies,
+        'seconds':round(elapsed, 3),
+        'verifies_per_second':round(verifies / elapsed, 2),
+    }
+
+
+def main():
+    '''Parses the arguments, runs the benchmark for each pool size and prints the results.'''
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=sorted({0, 1, 2, 4, os.cpu_count() or 1}),
+                        help='pool sizes (worker processes) to benchmark, 0 = inline')
+    parser.add_argument('--verifies', type=int, default=32, help='verifies per pool size')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    results = [bench_pool_size(size, args.verifies) for size in args.sizes]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"Argon2 parameters: {hashing.ph.memory_cost} KiB, t={hashing.ph.time_cost}, "
+          f"p={hashing.ph.parallelism}")
+    print("Workers\tVerifies\tSeconds\tVerifies/s")
+    for result in results:
+        print(f"{result['workers']}\t{result['verifies']}\t\t{result['seconds']}\t"
+              f"{result['verifies_per_second']}")
+
+
+if __name__ == '__main__':
+    main()
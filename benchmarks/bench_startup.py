@@ -0,0 +1,108 @@
+"""
+Benchmark for the CLI startup time. Imports main.py in fresh interpreters with
+"python -X importtime" and reports the total import time and the slowest modules.
+Run from the project root: python benchmarks/bench_startup.py --runs 5 --compare HEAD~1
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_profile(project_dir:str) -> dict:
+    '''
+    Imports the main module in a fresh interpreter with -X importtime.
+    Returns the wall time and the cumulative import time per top-level module in microseconds.
+    '''
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import main'],
+        cwd=project_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True, check=True
+    )
+    wall = time.perf_counter() - start
+    modules = {}
+    for line in completed.stderr.splitlines():
+        # Format: "import time:      self [us] |  cumulative | imported package"
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        fields = line[len('import time:'):].split('|')
+        name = fields[2].rstrip()
+        if not name.startswith(' ' * 2): # only top-level imports, nested ones are indented
+            modules[name.strip()] = int(fields[1])
+    return {'wall_us':int(wall * 1000000), 'modules':modules}
+
+
+def run(project_dir:str, runs:int, top:int) -> dict:
+    '''Profiles the startup several times and returns the medians as a dict.'''
+    profiles = [import_profile(project_dir) for _ in range(runs)]
+    modules = {}
+    for name in profiles[0]['modules']:
+        modules[name] = int(statistics.median(
+            profile['modules'].get(name, 0) for profile in profiles
+        ))
+    slowest = sorted(modules.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        'project_dir':project_dir,
+        'runs':runs,
+        'wall_ms':round(statistics.median(p['wall_us'] for p in profiles) / 1000, 1),
+        'main_import_ms':round(modules.get('main', 0) / 1000, 1),
+        'slowest_imports_ms':[(name, round(value / 1000, 1)) for name, value in slowest],
+    }
+
+
+def export_revision(revision:str, target_dir:str):
+    '''Extracts the given git revision of the project into the target directory.'''
+    archive = os.path.join(target_dir, 'revision.tar')
+    subprocess.run(
+        ['git', 'archive', '--format=tar', '-o', archive, revision], cwd=PROJECT_DIR, check=True
+    )
+    with tarfile.open(archive) as tar:
+        tar.extractall(target_dir)
+    os.remove(archive)
+
+
+def print_report(result:dict, label:str):
+    '''Prints the startup report of one project directory.'''
+    print(f"{label}: main import {result['main_import_ms']} ms, "
+          f"interpreter wall time {result['wall_ms']} ms (median of {result['runs']} runs)")
+    for name, value in result['slowest_imports_ms']:
+        print(f"    {value:>8} ms  {name}")
+
+
+def main():
+    '''Parses the arguments, runs the startup benchmark and prints the report.'''
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='interpreter starts to take the median of')
+    parser.add_argument('--top', type=int, default=10, help='number of slowest imports to show')
+    parser.add_argument('--compare', metavar='GIT_REV', help='git revision to compare against')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    results = {'current':run(PROJECT_DIR, args.runs, args.top)}
+    if args.compare:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            export_revision(args.compare, tmp_dir)
+            results[args.compare] = run(tmp_dir, args.runs, args.top)
+            results[args.compare]['project_dir'] = args.compare
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for label, result in results.items():
+        print_report(result, label)
+    if args.compare:
+        before = results[args.compare]['main_import_ms']
+        after = results['current']['main_import_ms']
+        print(f"Change of main import time: {round(after - before, 1)} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,530 @@
+"""
+System benchmark of the main code paths against a throwaway PostgreSQL server and SMTP sink.
+Creates a temporary cluster (initdb and pg_ctl of PostgreSQL 11+, from PATH or --pg-bin) with the
+three databases built from setup/sql_table_creation, seeds synthetic users, sources and event
+logs, times search_for_source, get_source_by_id, create_new_source, register_new_user,
+existing_user and the three event log writers, and prints the results as JSON.
+The results include the git revision, so runs of different commits can be compared.
+Run from the project root: python benchmarks/bench_system.py --sources 100000 --output base.json
+Compare with an earlier run: python benchmarks/bench_system.py --sources 100000 --compare base.json
+"""
+
+import argparse
+import glob
+import io
+import json
+import os
+import platform
+import random
+import re
+import shlex
+import shutil
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta, timezone
+import psycopg2
+from psycopg2 import sql
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+import settings # pylint: disable=wrong-import-position
+
+SQL_DIR = os.path.join(PROJECT_DIR, 'setup', 'sql_table_creation')
+SCHEMAS = (
+    ('authentication', (
+        'Authentication.sql', 'Authentication_sessions.sql', 'Authentication_login_failures.sql'
+    )),
+    ('data', (
+        'Data.sql', 'Data_url_index.sql', 'Data_search_index.sql', 'Data_source_stats.sql'
+    )),
+    ('eventlog', ('Eventlog.sql', 'Eventlog_audit_reports.sql')),
+)
+OPTIONAL_SCHEMAS = {'Data_search_index.sql'} # needs the pg_trgm extension (postgresql-contrib)
+HEADER_LINE = re.compile(r'^\w[\w ]* DB:.*$', re.MULTILINE) # "Data DB:" lines are not SQL
+
+DB_USER = 'bench'
+PASSWORD = 'F44aF#rhVgs9hAH8' # clear password of all seeded users
+SEED_CHUNK_SIZE = 100000 # rows per COPY while seeding
+WORDS = (
+    'phishing', 'malware', 'botnet', 'ransom', 'exploit', 'trojan', 'spyware', 'crypto',
+    'banking', 'login', 'update', 'secure', 'account', 'invoice', 'delivery', 'support',
+    'payment', 'verify', 'wallet', 'download', 'office', 'cloud', 'mail', 'stream',
+)
+OPERATIONS = {
+    'authlogs': ('Successful Login', 'Failed Login: Incorrect Password', 'Password Change'),
+    'operationlogs': ('View Source', 'Create Source', 'Modify Source'),
+    'adminlogs': ('Create User', 'Modify User', 'Unlock User', 'Deactivate User'),
+}
+
+
+class ThrowawayPostgres:
+    """
+    Temporary PostgreSQL cluster in a temporary directory, reachable only via a Unix socket in
+    that directory. Durability is switched off for speed. Removed completely on exit.
+    """
+
+    def __init__(self, pg_bin:str=None):
+        self.pg_bin = pg_bin
+        self.directory = None
+
+    def binary(self, name:str) -> str:
+        '''Returns the path of a PostgreSQL program from --pg-bin, PATH or /usr/lib/postgresql.'''
+        if self.pg_bin:
+            return os.path.join(self.pg_bin, name)
+        found = shutil.which(name)
+        if found:
+            return found
+        installed = glob.glob(f'/usr/lib/postgresql/*/bin/{name}')
+        if not installed:
+            raise SystemExit(f"{name} not found: install PostgreSQL 11+ or pass --pg-bin")
+        return max(installed, key=lambda path: float(path.split('/')[4]))
+
+    def __enter__(self):
+        self.directory = tempfile.mkdtemp(prefix='sss_bench_')
+        data = os.path.join(self.directory, 'data')
+        subprocess.run(
+            [self.binary('initdb'), '-D', data, '-U', DB_USER, '-A', 'trust', '-E', 'UTF8'],
+            stdout=subprocess.DEVNULL, check=True
+        )
+        options = (f"-k {shlex.quote(self.directory)} -c listen_addresses='' -c fsync=off "
+                   "-c synchronous_commit=off -c full_page_writes=off")
+        subprocess.run(
+            [self.binary('pg_ctl'), '-D', data, '-l', os.path.join(self.directory, 'server.log'),
+             '-o', options, '-w', 'start'],
+            stdout=subprocess.DEVNULL, check=True
+        )
+        return self
+
+    def __exit__(self, *exc_info):
+        subprocess.run(
+            [self.binary('pg_ctl'), '-D', os.path.join(self.directory, 'data'), '-m', 'fast',
+             '-w', 'stop'],
+            stdout=subprocess.DEVNULL, check=False
+        )
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    @property
+    def host(self) -> str:
+        '''Socket directory, used as host by psycopg2.'''
+        return self.directory
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Speaks just enough SMTP to accept and count the messages, which are discarded."""
+
+    def handle(self):
+        self.wfile.write(b'220 benchmark SMTP sink\r\n')
+        in_data = False
+        for line in self.rfile:
+            if in_data:
+                if line.rstrip(b'\r\n') == b'.':
+                    in_data = False
+                    with self.server.lock:
+                        self.server.messages += 1
+                    self.wfile.write(b'250 OK\r\n')
+                continue
+            command = line[:4].upper()
+            if command == b'DATA':
+                in_data = True
+                self.wfile.write(b'354 End data with <CR><LF>.<CR><LF>\r\n')
+            elif command == b'QUIT':
+                self.wfile.write(b'221 Bye\r\n')
+                return
+            else: # EHLO, HELO, MAIL, RCPT, RSET, NOOP
+                self.wfile.write(b'250 OK\r\n')
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Local SMTP server on a free port that accepts all emails, run on a background thread."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPSinkHandler)
+        self.messages = 0
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+    @property
+    def port(self) -> int:
+        '''Port the sink listens on.'''
+        return self.server_address[1]
+
+
+def configure(host:str, smtp_port:int, workdir:str):
+    '''
+    Points the settings at the throwaway server, the SMTP sink and temporary spool directories.
+    Must run before the project modules are imported, as they read some settings on import.
+    '''
+    settings.SMTP_HOST = '127.0.0.1'
+    settings.SMTP_PORT = smtp_port
+    settings.SMTP_STARTTLS = False
+    settings.SMTP_LOGIN = False
+    settings.OUTBOX_DIR = os.path.join(workdir, 'outbox')
+    settings.LOG_SPILL_FILE = os.path.join(workdir, 'eventlog_spill.jsonl')
+    settings.LOG_QUARANTINE_FILE = os.path.join(workdir, 'eventlog_quarantine.jsonl')
+    settings.SESSION_STORE = 'memory'
+    import dbconnection as dbc #pylint: disable=import-outside-toplevel
+    dbc.use_credentials(host, DB_USER)
+
+
+def schema_sql(name:str) -> str:
+    '''Returns the statements of a setup script without its non-SQL header lines.'''
+    with open(os.path.join(SQL_DIR, name), 'r') as file:
+        return HEADER_LINE.sub('', file.read())
+
+
+def create_databases(host:str) -> list:
+    '''
+    Creates the three databases and runs their setup scripts.
+    Returns the optional scripts that failed (e.g. missing extensions).
+    '''
+    conn = psycopg2.connect(host=host, dbname='postgres', user=DB_USER)
+    conn.autocommit = True
+    for db_name, _ in SCHEMAS:
+        conn.cursor().execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(db_name)))
+    conn.close()
+    skipped = []
+    for db_name, scripts in SCHEMAS:
+        conn = psycopg2.connect(host=host, dbname=db_name, user=DB_USER)
+        conn.autocommit = True
+        for name in scripts:
+            try:
+                conn.cursor().execute(schema_sql(name))
+            except psycopg2.Error as error:
+                if name not in OPTIONAL_SCHEMAS:
+                    raise
+                print(f"Skipping {name}: {str(error).strip()}")
+                skipped.append(name)
+        conn.close()
+    return skipped
+
+
+def copy_rows(conn, table:str, columns:tuple, rows) -> int:
+    '''Loads rows (without tabs, newlines or backslashes) via COPY in chunks. Returns the count.'''
+    statement = sql.SQL("COPY {table} ({columns}) FROM STDIN").format(
+        table=sql.Identifier(table), columns=sql.SQL(', ').join(map(sql.Identifier, columns))
+    ).as_string(conn)
+    cursor = conn.cursor()
+    count = 0
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join('\\N' if value is None else str(value) for value in row) + '\n')
+        count += 1
+        if count % SEED_CHUNK_SIZE == 0:
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+            conn.commit()
+            buffer = io.StringIO()
+    buffer.seek(0)
+    cursor.copy_expert(statement, buffer)
+    conn.commit()
+    return count
+
+
+def synthetic_users(count:int, hashed:str):
+    '''Yields users bench.user<i> with roles 1, 2, 3 in turn and the same password hash.'''
+    for i in range(count):
+        yield (f'Bench{i}', 'User', '1980-01-01', i % 3 + 1, f'bench.user{i}', hashed,
+               '2021-01-01', 1, f'bench.user{i}@example.com')
+
+
+def synthetic_sources(count:int, rng:random.Random):
+    '''Yields sources with random words, unique urls and creation dates of the last 3 years.'''
+    today = datetime.now().date()
+    for i in range(count):
+        first, second = rng.choice(WORDS), rng.choice(WORDS)
+        created = today - timedelta(days=rng.randrange(3 * 365))
+        yield (f'{first} {second} {i}', f'http://{first}-{second}-{i}.example/{rng.choice(WORDS)}',
+               rng.randint(1, 5), ' '.join(rng.choice(WORDS) for _ in range(8)), created, created)
+
+
+def synthetic_logs(table:str, count:int, start:datetime, users:int, sources:int, rng):
+    '''Yields log entries of a table with random times between start and now.'''
+    span = (datetime.now(timezone.utc) - start).total_seconds()
+    for _ in range(count):
+        logged = (start + timedelta(seconds=rng.random() * span)).isoformat()
+        operation = rng.choice(OPERATIONS[table])
+        if table == 'authlogs':
+            yield (logged, operation, rng.randrange(1, users + 1))
+        elif table == 'operationlogs':
+            yield (logged, operation, rng.randrange(1, users + 1), rng.randrange(1, sources + 1),
+                   None, None, None)
+        else:
+            yield (logged, operation, rng.randrange(1, users + 1), rng.randrange(1, users + 1),
+                   None, None, None)
+
+
+def seed(modules:dict, args) -> dict:
+    '''Seeds users, sources and event logs. Returns the seconds taken per table group.'''
+    dbc, log, partitions = modules['dbc'], modules['log'], modules['partitions']
+    rng = random.Random(args.seed)
+    timings = {}
+    start = time.perf_counter()
+    hashed = modules['hashing'].hash_password(PASSWORD)
+    user_columns = ('first_name', 'last_name', 'dob', 'user_role', 'username', 'password',
+                    'last_login', 'status', 'email')
+    with dbc.connection('authentication') as conn:
+        copy_rows(conn, 'users', user_columns, synthetic_users(args.users, hashed))
+    timings['users'] = round(time.perf_counter() - start, 2)
+
+    start = time.perf_counter()
+    source_columns = ('name', 'url', 'threat_level', 'description', 'creation_date',
+                      'modified_date')
+    with dbc.connection('data') as conn:
+        copy_rows(conn, 'sources', source_columns, synthetic_sources(args.sources, rng))
+    timings['sources'] = round(time.perf_counter() - start, 2)
+
+    start = time.perf_counter()
+    first_month = partitions.add_months(partitions.current_month(), 1 - args.log_months)
+    with dbc.connection('eventlog') as conn:
+        for offset in range(args.log_months - 1): # past months, ensure_partitions does the rest
+            for table in log.LOG_COLUMNS:
+                partitions.create_partition(conn, table, partitions.add_months(first_month, offset))
+        partitions.ensure_partitions(conn)
+        first = datetime.strptime(partitions.month_bound(first_month), '%Y-%m-%d')
+        shares = {'authlogs': 0.2, 'operationlogs': 0.6, 'adminlogs': 0.2}
+        for table, columns in log.LOG_COLUMNS.items():
+            rows = synthetic_logs(table, int(args.logs * shares[table]),
+                                  first.replace(tzinfo=timezone.utc), args.users, args.sources, rng)
+            copy_rows(conn, table, columns, rows)
+    timings['eventlogs'] = round(time.perf_counter() - start, 2)
+
+    for db_name, _ in SCHEMAS:
+        with dbc.connection(db_name) as conn:
+            conn.autocommit = True
+            conn.cursor().execute("ANALYZE")
+            conn.autocommit = False
+    return timings
+
+
+def percentile(timings:list, fraction:float) -> float:
+    '''Returns the percentile of sorted timings (nearest rank).'''
+    return timings[min(len(timings) - 1, int(round(fraction * (len(timings) - 1))))]
+
+
+def summarize(timings:list, total:float) -> dict:
+    '''Returns the latency statistics of timings in seconds, in milliseconds.'''
+    timings = sorted(timings)
+    return {
+        'iterations':len(timings),
+        'mean_ms':round(sum(timings) / len(timings) * 1000, 3),
+        'p50_ms':round(percentile(timings, 0.5) * 1000, 3),
+        'p95_ms':round(percentile(timings, 0.95) * 1000, 3),
+        'p99_ms':round(percentile(timings, 0.99) * 1000, 3),
+        'max_ms':round(timings[-1] * 1000, 3),
+        'ops_per_second':round(len(timings) / total, 2),
+    }
+
+
+def measure(func, iterations:int, warmup:int) -> dict:
+    '''Calls func warmup times untimed, then times each of the iterations.'''
+    for _ in range(warmup):
+        func()
+    timings = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        call_start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - call_start)
+    return summarize(timings, time.perf_counter() - start)
+
+
+def measure_log_writer(func, iterations:int, flush) -> dict:
+    '''
+    Times the calls of a log writer (queueing) and the flush that writes them to the database.
+    ops_per_second covers both, i.e. the end-to-end throughput of the writer.
+    '''
+    timings = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        call_start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - call_start)
+    flush_start = time.perf_counter()
+    flush()
+    end = time.perf_counter()
+    result = summarize(timings, end - start)
+    result['flush_ms'] = round((end - flush_start) * 1000, 3)
+    return result
+
+
+def benchmarks(modules:dict, args, search_mode:str) -> dict:
+    '''Returns the benchmark cases as name -> (function, iterations, kind).'''
+    ops, adops, auth, log = modules['ops'], modules['adops'], modules['auth'], modules['log']
+    rng = random.Random(args.seed + 1)
+    counter = iter(range(10 ** 9))
+    admin_id, specialist_id = 1, 2 # bench.user0 and bench.user1 (roles 1 and 2)
+
+    def search_name():
+        list(ops.search_for_source('name', rng.choice(WORDS), mode=search_mode,
+                                   limit=settings.SEARCH_PAGE_SIZE))
+
+    def search_url():
+        list(ops.search_for_source('url', f'-{rng.randrange(args.sources)}.example',
+                                   mode=search_mode, limit=settings.SEARCH_PAGE_SIZE))
+
+    def get_source_uncached():
+        ops.source_cache.clear()
+        ops.get_source_by_id(rng.randrange(1, args.sources + 1))
+
+    def create_source():
+        i = next(counter)
+        ops.create_new_source(f'bench source {i}', f'http://bench-{i}.example/new', 3,
+                              'benchmark source', specialist_id)
+
+    def register_user():
+        i = next(counter)
+        adops.register_new_user(f'New{i}', 'Benchuser', '1990-01-01',
+                                f'new.user{i}@example.com', 2, admin_id)
+
+    fast, slow = args.iterations, args.slow_iterations
+    return {
+        'search_for_source.name': (search_name, fast, 'call'),
+        'search_for_source.url': (search_url, fast, 'call'),
+        'get_source_by_id.uncached': (get_source_uncached, fast, 'call'),
+        'get_source_by_id.cached': (lambda: ops.get_source_by_id(1), fast, 'call'),
+        'create_new_source': (create_source, fast, 'call'),
+        'register_new_user': (register_user, slow, 'call'),
+        'existing_user': (lambda: auth.existing_user('bench.user0', PASSWORD), slow, 'call'),
+        'eventlog.auth_log': (lambda: log.auth_log('Successful Login', admin_id), fast, 'log'),
+        'eventlog.operation_log': (
+            lambda: log.operation_log('View Source', specialist_id, 1), fast, 'log'
+        ),
+        'eventlog.admin_log': (
+            lambda: log.admin_log('Modify User', admin_id, 2, 'first_name', 'a', 'b'), fast, 'log'
+        ),
+    }
+
+
+def git_revision() -> dict:
+    '''Returns the checked out commit and whether the working tree has changes.'''
+    def git(*args):
+        return subprocess.run(['git'] + list(args), cwd=PROJECT_DIR, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, universal_newlines=True,
+                              check=False).stdout.strip()
+    return {'commit':git('rev-parse', 'HEAD') or None, 'dirty':bool(git('status', '--porcelain'))}
+
+
+def load_modules() -> dict:
+    '''Imports the project modules (after configure) and returns them by short name.'''
+    #pylint: disable=import-outside-toplevel
+    import admin_operations
+    import authentication
+    import dbconnection
+    import eventlog
+    import hashing
+    import operations
+    import partitions
+    return {'adops':admin_operations, 'auth':authentication, 'dbc':dbconnection,
+            'log':eventlog, 'hashing':hashing, 'ops':operations, 'partitions':partitions}
+
+
+def run(args) -> dict:
+    '''Sets up the server and sink, seeds the databases, runs the benchmarks and returns them.'''
+    with ThrowawayPostgres(args.pg_bin) as server, SMTPSink() as sink:
+        configure(server.host, sink.port, server.directory)
+        skipped = create_databases(server.host)
+        search_mode = 'like' if 'Data_search_index.sql' in skipped else settings.SEARCH_MODE
+        modules = load_modules()
+        print(f"Seeding {args.users} users, {args.sources} sources, {args.logs} log entries...")
+        seed_seconds = seed(modules, args)
+        with modules['dbc'].connection('data') as conn:
+            cursor = conn.cursor()
+            cursor.execute("SHOW server_version")
+            server_version = cursor.fetchone()[0]
+        results = {}
+        for name, (func, iterations, kind) in benchmarks(modules, args, search_mode).items():
+            if args.only and not any(name.startswith(prefix) for prefix in args.only):
+                continue
+            print(f"Running {name} ({iterations} iterations)...")
+            if kind == 'log':
+                results[name] = measure_log_writer(func, iterations, modules['log'].flush)
+            else:
+                results[name] = measure(func, iterations, args.warmup)
+        modules['log'].shutdown()
+        modules['dbc'].close_all_pools()
+        emails = sink.messages
+    return dict(git_revision(), **{
+        'created':datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python':platform.python_version(),
+        'postgres':server_version,
+        'scale':{'users':args.users, 'sources':args.sources, 'logs':args.logs,
+                 'log_months':args.log_months},
+        'search_mode':search_mode,
+        'skipped_schemas':skipped,
+        'seed_seconds':seed_seconds,
+        'emails_sent':emails,
+        'results':results,
+    })
+
+
+def compare(report:dict, baseline:dict):
+    '''Prints the median latencies of a report next to the ones of a baseline report.'''
+    print()
+    print(f"Baseline {baseline.get('commit')} -> current {report.get('commit')}")
+    if baseline.get('scale') != report.get('scale'):
+        print("Warning: the runs used different scales, the results are not comparable.")
+    print(f"{'Benchmark':<28}{'Base p50 ms':>14}{'p50 ms':>12}{'Change':>10}")
+    for name, result in report['results'].items():
+        base = baseline.get('results', {}).get(name)
+        if base is None or not base['p50_ms']:
+            print(f"{name:<28}{'-':>14}{result['p50_ms']:>12}{'-':>10}")
+            continue
+        change = (result['p50_ms'] - base['p50_ms']) / base['p50_ms'] * 100
+        print(f"{name:<28}{base['p50_ms']:>14}{result['p50_ms']:>12}{change:>+9.1f}%")
+
+
+def main():
+    '''Parses the arguments, runs the benchmark and writes or compares the JSON results.'''
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sources', type=int, default=10000,
+                        help='seeded sources (e.g. 10000 to 10000000)')
+    parser.add_argument('--users', type=int, default=1000, help='seeded users')
+    parser.add_argument('--logs', type=int, default=None,
+                        help='seeded event log entries (default: as many as sources)')
+    parser.add_argument('--log-months', type=int, default=3,
+                        help='months the seeded event log entries are spread over')
+    parser.add_argument('--iterations', type=int, default=200,
+                        help='timed calls of the database benchmarks')
+    parser.add_argument('--slow-iterations', type=int, default=10,
+                        help='timed calls of the benchmarks that run Argon2')
+    parser.add_argument('--warmup', type=int, default=3, help='untimed calls before timing')
+    parser.add_argument('--only', nargs='+', help='only run the benchmarks with these prefixes')
+    parser.add_argument('--seed', type=int, default=42, help='random seed of the synthetic data')
+    parser.add_argument('--pg-bin', help='directory of initdb and pg_ctl')
+    parser.add_argument('--output', help='write the JSON results to this file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare with')
+    args = parser.parse_args()
+    if args.logs is None:
+        args.logs = args.sources
+    if args.users < 3 or args.sources < 1:
+        parser.error("at least 3 users and 1 source are needed")
+
+    with redirect_stdout(sys.stderr): # progress and messages of the operations
+        report = run(args)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            compare(report, json.load(file))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Calibration of the Argon2 hashing profile. For each memory size, the time cost is raised until
+one hash takes at least the target latency on this host; the profile with the most memory that
+stays close to the target is recommended as settings for "settings.py".
+Run from the project root: python benchmarks/calibrate_hashing.py --target-ms 500
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hashing # pylint: disable=wrong-import-position
+import settings # pylint: disable=wrong-import-position
+
+PASSWORD = 'F44aF#rhVgs9hAH8'
+TOLERANCE = 1.25 # profiles up to 25% slower than the target count as close to it
+
+
+def hash_latency(memory_cost:int, time_cost:int, parallelism:int, runs:int) -> float:
+    '''Returns the median latency of one hash with the given parameters in milliseconds.'''
+    hasher = hashing.password_hasher(memory_cost, time_cost, parallelism)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        hasher.hash(PASSWORD)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def calibrate_memory(memory_cost:int, parallelism:int, target_ms:float, args) -> dict:
+    '''
+    Raises the time cost for a memory size until a hash takes at least the target latency.
+    Returns the first time cost reaching the target (or the maximum time cost) as a dict.
+    '''
+    for time_cost in range(1, args.max_time_cost + 1):
+        latency = hash_latency(memory_cost, time_cost, parallelism, args.runs)
+        if latency >= target_ms:
+            break
+    return {
+        'memory_cost':memory_cost,
+        'time_cost':time_cost,
+        'parallelism':parallelism,
+        'latency_ms':round(latency, 1),
+        'pool_memory_mib':round(memory_cost * max(settings.HASH_POOL_SIZE, 1) / 1024),
+        'close_to_target':target_ms <= latency <= target_ms * TOLERANCE,
+    }
+
+
+def recommend(results:list) -> dict:
+    '''
+    Returns the profile with the most memory that is close to the target latency, as Argon2 is
+    the more resistant to GPU attacks the more memory it uses. Falls back to the fastest profile.
+    '''
+    close = [result for result in results if result['close_to_target']]
+    if close:
+        return max(close, key=lambda result: (result['memory_cost'], -result['time_cost']))
+    return min(results, key=lambda result: result['latency_ms'])
+
+
+def main():
+    '''Parses the arguments, calibrates each memory size and prints the results.'''
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--target-ms', type=float, default=500,
+                        help='target latency of one hash in milliseconds')
+    parser.add_argument('--memory', type=int, nargs='+',
+                        default=[65536, settings.HASH_MEMORY_COST, 262144, 524288],
+                        help='memory sizes to calibrate in KiB')
+    parser.add_argument('--parallelism', type=int, default=settings.HASH_PARALLELISM,
+                        help='Argon2 lanes per hash')
+    parser.add_argument('--max-time-cost', type=int, default=10,
+                        help='highest time cost tried per memory size')
+    parser.add_argument('--runs', type=int, default=3, help='hashes timed per profile')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    results = [calibrate_memory(memory, args.parallelism, args.target_ms, args)
+               for memory in sorted(set(args.memory))]
+    best = recommend(results)
+    if args.json:
+        print(json.dumps({'target_ms':args.target_ms, 'results':results, 'recommended':best},
+                         indent=2))
+        return
+    print(f"Target latency: {args.target_ms} ms per hash, "
+          f"{settings.HASH_POOL_SIZE} hashing pool worker(s)")
+    print("Memory KiB\tTime cost\tLanes\tLatency ms\tPool MiB")
+    for result in results:
+        print(f"{result['memory_cost']}\t\t{result['time_cost']}\t\t{result['parallelism']}\t"
+              f"{result['latency_ms']}\t\t{result['pool_memory_mib']}")
+    print("\nRecommended settings:")
+    print(f"HASH_MEMORY_COST = {best['memory_cost']}")
+    print(f"HASH_TIME_COST = {best['time_cost']}")
+    print(f"HASH_PARALLELISM = {best['parallelism']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Module providing an in-process LRU cache with time-to-live expiry."""
+
+import threading
+import time
+from collections import OrderedDict
+
+MISSING = object() # returned by LRUCache.get if a key is not cached
+
+
+class LRUCache:
+    """
+    Thread-safe, size-bounded cache. Entries expire after the TTL (in seconds) and the
+    least recently used entry is evicted once the cache is full.
+    Keeps hit, miss and eviction counters for monitoring.
+    Read-through callers take the generation() before reading a value from its origin and pass
+    it to put, so a value read before a concurrent invalidation is not cached.
+    """
+
+    def __init__(self, max_size:int, ttl:float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict() # key -> (value, expires_at), least recently used first
+        self._generation = 0 # increased by every invalidation
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        '''Returns the cached value of the key or MISSING if not cached or expired.'''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                    self.evictions += 1
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def generation(self) -> int:
+        '''Returns the invalidation counter, to be passed to put by read-through callers.'''
+        with self._lock:
+            return self._generation
+
+    def put(self, key, value, generation:int=None):
+        '''
+        Caches a value for the key. Evicts the least recently used entry if full.
+        With a generation, the value is only cached if nothing was invalidated since.
+        '''
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        '''Removes the key from the cache if present.'''
+        with self._lock:
+            self._entries.pop(key, None)
+            self._generation += 1
+
+    def clear(self):
+        '''Removes all entries from the cache.'''
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def stats(self) -> dict:
+        '''Returns the current size and the hit, miss and eviction counters as a dict.'''
+        with self._lock:
+            return {
+                'size':len(self._entries),
+                'max_size':self.max_size,
+                'hits':self.hits,
+                'misses':self.misses,
+                'evictions':self.evictions,
+            }
@@ -0,0 +1,365 @@
+"""
+Module providing the non-interactive command mode of main.py for scripts and automation.
+Commands authenticate once per process with the credentials of a (service) account given in the
+environment variables SSS_USERNAME and SSS_PASSWORD, call the same operations as the interface
+and print machine-readable output with --json. The 'batch' command runs one command per line
+of a JSONL file (or stdin) in the same process, e.g.:
+    python main.py search --field url --term plattan --json
+    python main.py source create --name ... --url ... --threat-level 3 --description ...
+    python main.py user unlock --email jane.doe@example.com
+    python main.py batch commands.jsonl   (one JSON array of arguments per line)
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import psycopg2
+import admin_operations as adops
+import authentication as auth
+import eventlog as log
+import hashing
+import ingestion
+import operations as ops
+import validation
+
+USERNAME_ENV = 'SSS_USERNAME'
+PASSWORD_ENV = 'SSS_PASSWORD'
+
+# Roles allowed per command: 1 = Administrator, 2 = Specialist, 3 = Authority (as in interface)
+ROLES = {
+    'search': (2, 3),
+    'source show': (2, 3),
+    'source lookup': (2, 3),
+    'source stats': (1, 2, 3),
+    'source create': (2,),
+    'source modify': (2,),
+    'user create': (1,),
+    'user unlock': (1,),
+    'user deactivate': (1,),
+}
+SEARCH_FIELDS = ('name', 'url', 'description', 'threat_level')
+MAX_LIMIT = 100 # maximum results of one search page
+
+EXIT_OK, EXIT_FAILED, EXIT_USAGE, EXIT_AUTH = 0, 1, 2, 3
+
+
+class CommandError(Exception):
+    """Raised for invalid commands and arguments, as well as failed or forbidden operations."""
+
+
+class NotFoundError(CommandError):
+    """Raised if the source or user a command refers to does not exist."""
+
+
+class HelpRequested(CommandError):
+    """Raised instead of printing the help of a command (--help), with the help text."""
+
+
+class CommandParser(argparse.ArgumentParser):
+    """
+    Argument parser that raises CommandError instead of printing to stdout and exiting,
+    as required by batch mode, where a --help or invalid line must only fail that command.
+    """
+
+    def error(self, message):
+        raise CommandError(message)
+
+    def exit(self, status=0, message=None):
+        raise CommandError(message.strip() if message else f"{self.prog} exited")
+
+    def print_help(self, file=None):
+        raise HelpRequested(self.format_help())
+
+
+def limit(value:str) -> int:
+    '''Argument type of the search page size: a number from 1 to MAX_LIMIT.'''
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid number: '{value}'") from None
+    if not 1 <= number <= MAX_LIMIT:
+        raise argparse.ArgumentTypeError(f"must be between 1 and {MAX_LIMIT}")
+    return number
+
+
+def build_parser() -> CommandParser:
+    '''Builds the parser of all commands.'''
+    parser = CommandParser(prog='main.py', description='Suspect Sources System command mode')
+    common = CommandParser(add_help=False) # options accepted after every command
+    common.add_argument('--json', action='store_true', help='print the result as JSON')
+    commands = parser.add_subparsers(dest='command')
+
+    search = commands.add_parser('search', parents=[common], help='search sources')
+    search.add_argument('--field', choices=SEARCH_FIELDS, required=True)
+    search.add_argument('--term', required=True)
+    search.add_argument('--after-id', type=int, help='return the page following this source id')
+    search.add_argument('--limit', type=limit, default=MAX_LIMIT,
+                        help=f'maximum results (page size, 1 - {MAX_LIMIT})')
+
+    source = commands.add_parser('source', help='show, create or modify sources')
+    source_actions = source.add_subparsers(dest='action')
+    show = source_actions.add_parser('show', parents=[common])
+    show.add_argument('id', type=int)
+    lookup = source_actions.add_parser('lookup', parents=[common])
+    lookup.add_argument('--url', action='append', required=True, help='exact url (repeatable)')
+    stats = source_actions.add_parser('stats', parents=[common])
+    stats.add_argument('--by', choices=('threat_level', 'creation_month', 'both'),
+                       default='threat_level')
+    create = source_actions.add_parser('create', parents=[common])
+    create.add_argument('--name', required=True)
+    create.add_argument('--url', required=True)
+    create.add_argument('--threat-level', type=int, required=True)
+    create.add_argument('--description', required=True)
+    modify = source_actions.add_parser('modify', parents=[common])
+    modify.add_argument('id', type=int)
+    modify.add_argument('--field', choices=SEARCH_FIELDS, required=True)
+    modify.add_argument('--value', required=True)
+
+    user = commands.add_parser('user', help='create, unlock or deactivate users')
+    user_actions = user.add_subparsers(dest='action')
+    create_user = user_actions.add_parser('create', parents=[common])
+    create_user.add_argument('--first-name', required=True)
+    create_user.add_argument('--last-name', required=True)
+    create_user.add_argument('--email', required=True)
+    create_user.add_argument('--dob', required=True, help='YYYY-MM-DD')
+    create_user.add_argument('--role', type=int, choices=(1, 2, 3), required=True)
+    for action in ('unlock', 'deactivate'):
+        user_actions.add_parser(action, parents=[common]).add_argument('--email', required=True)
+
+    batch = commands.add_parser('batch', help='run one command per line of a JSONL file')
+    batch.add_argument('file', nargs='?', default='-', help="JSONL file, '-' = stdin (default)")
+    return parser
+
+
+def run_search(args, uid:int) -> dict: #pylint: disable=unused-argument
+    '''Searches sources by field and term. Returns one page of (id, name) results.'''
+    if args.field == 'threat_level' and not args.term.strip().isdigit():
+        raise CommandError('Invalid Threat Level (1 - 5)')
+    rows, _, has_next = ops.search_page(args.field, args.term, page_size=args.limit,
+                                        after_id=args.after_id)
+    return {'sources': [{'id': row[0], 'name': row[1]} for row in rows], 'has_next': has_next}
+
+
+def run_source_show(args, uid:int) -> dict:
+    '''Returns the details of a source and logs the view.'''
+    source = ops.get_source_by_id(args.id)
+    if source is None:
+        raise NotFoundError(f"source {args.id} not found")
+    log.operation_log("View Source", uid, args.id)
+    keys = ('id', 'name', 'url', 'threat_level', 'description', 'creation_date', 'modified_date')
+    return dict(zip(keys, source))
+
+
+def run_source_lookup(args, uid:int) -> dict: #pylint: disable=unused-argument
+    '''Looks up sources by exact url. Returns the matching sources.'''
+    rows = ops.lookup_urls(args.url)
+    if rows is None:
+        raise CommandError("urls could not be looked up")
+    keys = ('id', 'name', 'url', 'threat_level')
+    return {'sources': [dict(zip(keys, row)) for row in rows]}
+
+
+def run_source_stats(args, uid:int) -> dict: #pylint: disable=unused-argument
+    '''Returns the number of sources per threat level and/or creation month.'''
+    stats = ops.get_source_stats(args.by)
+    if stats is None:
+        raise CommandError("source statistics could not be read")
+    keys = ('threat_level', 'creation_month') if args.by == 'both' else (args.by,)
+    return {'stats': [dict(zip(keys + ('sources',), row)) for row in stats]}
+
+
+def run_source_create(args, uid:int) -> dict:
+    '''Creates a source after validating it with the rules of the threat feed ingestion.'''
+    record = {'name': args.name, 'url': args.url, 'threat_level': args.threat_level,
+              'description': args.description}
+    error = ingestion.validate_source(record)
+    if error is not None:
+        raise CommandError(error)
+    if not ops.create_new_source(args.name, args.url, args.threat_level, args.description, uid):
+        raise CommandError("source could not be created")
+    return {'created': True}
+
+
+def run_source_modify(args, uid:int) -> dict:
+    '''Modifies one field of a source.'''
+    if ops.get_source_by_id(args.id) is None:
+        raise NotFoundError(f"source {args.id} not found")
+    error = ingestion.validate_source_field(args.field, args.value)
+    if error is not None:
+        raise CommandError(error)
+    value = int(args.value) if args.field == 'threat_level' else args.value
+    if not ops.modify_source(args.id, args.field, value, uid):
+        if ops.get_source_by_id(args.id) is None: # deleted in the meantime
+            raise NotFoundError(f"source {args.id} not found")
+        raise CommandError("source could not be modified")
+    return {'modified': True}
+
+
+def run_user_create(args, uid:int) -> dict:
+    '''Registers a user; the generated credentials are emailed to the user.'''
+    if not (validation.is_valid_name(args.first_name) and validation.is_valid_name(args.last_name)):
+        raise CommandError('Invalid Name')
+    if not validation.is_valid_email(args.email):
+        raise CommandError('Invalid Email Address')
+    if not validation.is_valid_dob(args.dob):
+        raise CommandError('Invalid Date of Birth')
+    if adops.fetch_user_info(email=args.email) is not None:
+        raise CommandError('Email Address is already tied to a User')
+    if not adops.register_new_user(args.first_name, args.last_name, args.dob, args.email,
+                                   args.role, uid):
+        raise CommandError("user could not be created")
+    return {'created': True}
+
+
+def run_user_unlock(args, uid:int) -> dict:
+    '''Unlocks a locked user.'''
+    user = adops.fetch_user_info(email=args.email)
+    if user is None:
+        raise NotFoundError('No User found for the email address')
+    if user[5] != 3:
+        raise CommandError('User is currently not locked')
+    if not adops.unlock_user(user[0], uid):
+        raise CommandError("user could not be unlocked")
+    return {'unlocked': True, 'user_id': user[0]}
+
+
+def run_user_deactivate(args, uid:int) -> dict:
+    '''Deactivates (soft deletes) a user.'''
+    user = adops.fetch_user_info(email=args.email)
+    if user is None:
+        raise NotFoundError('No User found for the email address')
+    if user[5] == 2:
+        raise CommandError('User is already deactivated')
+    if not adops.deactivate_user(user[0], uid, user[5]):
+        raise CommandError("user could not be deactivated")
+    return {'deactivated': True, 'user_id': user[0]}
+
+
+HANDLERS = {
+    'search': run_search,
+    'source show': run_source_show,
+    'source lookup': run_source_lookup,
+    'source stats': run_source_stats,
+    'source create': run_source_create,
+    'source modify': run_source_modify,
+    'user create': run_user_create,
+    'user unlock': run_user_unlock,
+    'user deactivate': run_user_deactivate,
+}
+
+
+def login_from_env() -> tuple:
+    '''
+    Authenticates the account given in the environment (SSS_USERNAME, SSS_PASSWORD).
+    Returns the authenticated user as tuple (user id, first name, user role).
+    Raises CommandError if the credentials are missing or rejected.
+    '''
+    username, password = os.environ.get(USERNAME_ENV), os.environ.get(PASSWORD_ENV)
+    if not username or not password:
+        raise CommandError(f"set {USERNAME_ENV} and {PASSWORD_ENV} to authenticate")
+    try:
+        status, login = auth.authenticate(username, password)
+    except psycopg2.Error as error:
+        raise CommandError(f"database error: {str(error).strip()}") from error
+    if status != 'ok':
+        raise CommandError(f"authentication failed ({status})")
+    log.auth_log("Successful Login", login[0])
+    return login
+
+
+def execute(parser:CommandParser, argv:list, login:tuple) -> dict:
+    '''
+    Parses and runs a single command as the authenticated user.
+    Returns the result dict. Raises CommandError for invalid, forbidden or failed commands,
+    including unexpected errors of the operations (e.g. database errors).
+    '''
+    args = parser.parse_args(argv)
+    name = ' '.join(part for part in (args.command, getattr(args, 'action', None)) if part)
+    if name not in HANDLERS:
+        raise CommandError(f"unknown command '{name}'" if name else "no command given")
+    if login[2] not in ROLES[name]:
+        raise CommandError(f"'{name}' is not permitted for this user role")
+    # the operations print their errors, keep stdout free for the command output
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            return HANDLERS[name](args, login[0])
+        except CommandError:
+            raise
+        except hashing.PoolBusyError as error:
+            raise CommandError(str(error)) from error
+        except psycopg2.Error as error:
+            raise CommandError(f"database error: {str(error).strip()}") from error
+        except Exception as error: #pylint: disable=broad-except
+            raise CommandError(f"unexpected error: {error!r}") from error
+
+
+def output(result:dict, as_json:bool, error:str=None):
+    '''Prints a command result (or error) as JSON line or as plain text.'''
+    if as_json:
+        payload = {'ok': False, 'error': error} if error else {'ok': True, 'result': result}
+        print(json.dumps(payload, default=str), flush=True)
+    elif error:
+        print(f"Error: {error}", file=sys.stderr)
+    else:
+        for key, value in result.items():
+            if isinstance(value, list):
+                for item in value:
+                    print('\t'.join(str(field) for field in item.values()))
+            else:
+                print(f"{key}: {value}")
+
+
+def run_batch(parser:CommandParser, path:str, login:tuple) -> int:
+    '''
+    Runs the commands of a JSONL file (one JSON array of arguments per line) and prints one
+    JSON result line per command, in order. Returns EXIT_FAILED if any command failed.
+    '''
+    status = EXIT_OK
+    file = sys.stdin if path == '-' else open(path, 'r')
+    try:
+        for line in file:
+            if not line.strip():
+                continue
+            try:
+                argv = json.loads(line)
+                if not isinstance(argv, list) or 'batch' in argv:
+                    raise CommandError("each line must be a JSON array of command arguments")
+                output(execute(parser, [str(arg) for arg in argv], login), True)
+            except (CommandError, ValueError) as error:
+                output(None, True, str(error))
+                status = EXIT_FAILED
+    finally:
+        if file is not sys.stdin:
+            file.close()
+    return status
+
+
+def main(argv:list) -> int:
+    '''Runs the command mode with the given arguments. Returns the exit code.'''
+    parser = build_parser()
+    as_json = '--json' in argv
+    try:
+        args = parser.parse_args(argv) # usage errors are reported before authenticating
+    except HelpRequested as help_text:
+        print(help_text)
+        return EXIT_OK
+    except CommandError as error:
+        output(None, as_json, str(error))
+        return EXIT_USAGE
+    try:
+        login = login_from_env()
+    except CommandError as error:
+        output(None, as_json, str(error))
+        return EXIT_AUTH
+    try:
+        if args.command == 'batch':
+            return run_batch(parser, args.file, login)
+        output(execute(parser, argv, login), as_json)
+    except CommandError as error:
+        output(None, as_json, str(error))
+        return EXIT_FAILED
+    finally:
+        log.shutdown() # write all queued event logs before exiting
+    return EXIT_OK
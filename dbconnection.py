@@ -1,11 +1,27 @@
-"""This module establishes a connection to the PostgreSQL DB."""
+"""This module establishes and pools the connections to the PostgreSQL DB."""
 
-from cryptography.fernet import Fernet # lib to decrypt Postgresql credentials from binary file
+import atexit
+import functools
+import sys
+import threading
+import time
+from contextlib import contextmanager
 import psycopg2 # Postgresql connector library
+import psycopg2.pool
+from psycopg2 import extensions
+import metrics
+import settings
 
 RED = '\033[91m' # Erorr Messages
 YELLOW = '\033[93m' # Notices to User
 
+CONNECT_SECONDS = metrics.histogram('sss_db_connect_seconds', 'Duration of opening a connection')
+CONNECT_ERRORS = metrics.counter('sss_db_connect_errors_total', 'Failed connection attempts')
+QUERY_SECONDS = metrics.histogram(
+    'sss_db_query_seconds', 'Duration of database statements by database and calling function'
+)
+SKIPPED_CALLERS = ('psycopg2', 'contextlib', __name__) # modules not reported as caller
+
 def retrieve_key():
     '''Function to retrieve the Fernet Encryption Key from the config folder.'''
     # Try retrieving the Fernet encryption key from bin file
@@ -18,19 +34,48 @@ def retrieve_key():
         return None
     return retrieved_key
 
-# Try retrieving the Postgresql credentials from bin file
-try:
-    loginFRetrieve = open("config/credentials.bin", "rb")
-    retrieved_cred = loginFRetrieve.read()
-    loginFRetrieve.close()
-except OSError:
-    print(RED + "Error retrieving credentials.")
 
-# Decrypt the retrieved Postgresql creds and split into list
-cipher = Fernet(retrieve_key())
-credential = cipher.decrypt(retrieved_cred)
-credential = credential.decode('utf-8')
-split_creds = credential.split(":")
+@functools.lru_cache(maxsize=None)
+def cipher():
+    '''
+    Returns the Fernet cipher for the master key. Set up on first use and cached,
+    so that importing the modules does not pay for loading the cryptography library.
+    '''
+    from cryptography.fernet import Fernet #pylint: disable=import-outside-toplevel
+    return Fernet(retrieve_key())
+
+
+@functools.lru_cache(maxsize=None)
+def retrieve_credentials() -> list:
+    '''
+    Decrypts the Postgresql credentials from the config folder on first use and caches them.
+    Returns the credentials as list: [host, default database, user, password]
+    '''
+    # Try retrieving the Postgresql credentials from bin file
+    try:
+        login_file = open("config/credentials.bin", "rb")
+        retrieved_cred = login_file.read()
+        login_file.close()
+    except OSError:
+        print(RED + "Error retrieving credentials.")
+        raise
+    # Decrypt the retrieved Postgresql creds and split into list
+    credential = cipher().decrypt(retrieved_cred)
+    credential = credential.decode('utf-8')
+    return credential.split(":")
+
+
+_credentials_override = None # [host, default database, user, password] used instead of config
+
+
+def use_credentials(host:str, user:str, password:str='', default_db:str='postgres'):
+    '''
+    Connects with the given credentials instead of the encrypted ones from the config folder,
+    e.g. to run the benchmarks against a throwaway database server. The host may also be the
+    directory of a Unix socket. Call before the first connection is opened.
+    '''
+    global _credentials_override #pylint: disable=global-statement
+    _credentials_override = [host, default_db, user, password]
 
 
 # Try connecting to Postgresql DB with decrypted credentials
@@ -39,16 +84,225 @@ def establish_connection(db_name:str):
     Tries to establish a connection to the specified database.
     Returns the connection object if successful.
     '''
+    split_creds = _credentials_override or retrieve_credentials()
     try:
-        conn = psycopg2.connect(
-            host=split_creds[0],
-            dbname=db_name,
-            user=split_creds[2],
-            password=split_creds[3]
-        )
+        with CONNECT_SECONDS.time(db=db_name):
+            conn = psycopg2.connect(
+                host=split_creds[0],
+                dbname=db_name,
+                user=split_creds[2],
+                password=split_creds[3],
+                cursor_factory=TimedCursor if settings.METRICS_ENABLED else None
+            )
     except psycopg2.OperationalError as error:
+        CONNECT_ERRORS.inc(db=db_name)
         print(RED + "Error:", error)
         print(YELLOW + "Exception TYPE:", type(error))
         return None
     else:
         return conn
+
+
+def caller() -> str:
+    '''
+    Returns "module.function" of the code that issued a statement, skipping the frames of
+    psycopg2 helpers (e.g. execute_values), of this module and of contextlib.
+    '''
+    frame = sys._getframe(2) #pylint: disable=protected-access
+    while frame is not None and frame.f_globals.get('__name__', '').startswith(SKIPPED_CALLERS):
+        frame = frame.f_back
+    if frame is None:
+        return 'unknown'
+    return f"{frame.f_globals.get('__name__')}.{frame.f_code.co_name}"
+
+
+class TimedCursor(extensions.cursor):
+    """Cursor that records the duration of its statements in the sss_db_query_seconds metric."""
+
+    def _observe(self, start:float):
+        '''Records the duration since start, labelled with the database and the caller.'''
+        QUERY_SECONDS.observe(time.perf_counter() - start, db=self.connection.info.dbname,
+                              caller=caller())
+
+    def execute(self, query, params=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, params)
+        finally:
+            self._observe(start)
+
+    def executemany(self, query, params_list):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, params_list)
+        finally:
+            self._observe(start)
+
+    def copy_expert(self, sql, file, size=8192):
+        start = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            self._observe(start)
+
+
+class ConnectionPool: #pylint: disable=too-many-instance-attributes
+    """Thread-safe pool of open connections to a single database."""
+
+    def __init__( #pylint: disable=too-many-arguments
+        self,
+        db_name:str,
+        min_size:int=settings.POOL_MIN_SIZE,
+        max_size:int=settings.POOL_MAX_SIZE,
+        idle_timeout:float=settings.POOL_IDLE_TIMEOUT,
+        ping_interval:float=settings.POOL_PING_INTERVAL,
+        checkout_timeout:float=settings.POOL_CHECKOUT_TIMEOUT
+    ):
+        self.db_name = db_name
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.ping_interval = ping_interval
+        self.checkout_timeout = checkout_timeout
+        self._idle = [] # (connection, returned_at) pairs, the most recently returned one is last
+        self._in_use = 0
+        self._cond = threading.Condition()
+
+    def checkout(self):
+        '''
+        Hands out an open connection of the pool. Idle connections are health-checked first
+        and replaced if broken; a new connection is opened while below the maximum size.
+        Raises a PoolError if no connection becomes free within the checkout timeout.
+        '''
+        deadline = time.monotonic() + self.checkout_timeout
+        with self._cond:
+            while True:
+                self._evict_idle()
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    break
+                if self._in_use < self.max_size:
+                    conn, returned_at = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise psycopg2.pool.PoolError(
+                        f"Connection pool for '{self.db_name}' is exhausted."
+                    )
+                self._cond.wait(remaining)
+            self._in_use += 1
+        try:
+            if conn is not None and not self._is_healthy(conn, returned_at):
+                self._close(conn)
+                conn = None
+            if conn is None:
+                conn = establish_connection(self.db_name)
+                if conn is None:
+                    raise psycopg2.OperationalError(
+                        f"Could not connect to the '{self.db_name}' database."
+                    )
+        except BaseException:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def checkin(self, conn, discard:bool=False):
+        '''
+        Returns a connection to the pool. Uncommitted work is rolled back first.
+        Broken connections (or the ones flagged with discard) are closed instead of reused.
+        '''
+        if not discard and not conn.closed:
+            status = conn.get_transaction_status()
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                discard = True
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    discard = True
+        with self._cond:
+            self._in_use -= 1
+            if discard or conn.closed or len(self._idle) >= self.max_size:
+                self._close(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._evict_idle()
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        '''Context manager that checks out a connection and returns it to the pool on exit.'''
+        conn = self.checkout()
+        try:
+            yield conn
+        finally:
+            self.checkin(conn)
+
+    def close(self):
+        '''Closes all idle connections of the pool.'''
+        with self._cond:
+            while self._idle:
+                self._close(self._idle.pop()[0])
+
+    def _is_healthy(self, conn, returned_at:float) -> bool:
+        '''Checks if an idle connection is still usable. Pings the server if idle for a while.'''
+        if conn.closed:
+            return False
+        if time.monotonic() - returned_at < self.ping_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def _evict_idle(self):
+        '''Closes the oldest idle connections above the minimum size once they timed out.'''
+        now = time.monotonic()
+        while (self._idle and self._in_use + len(self._idle) > self.min_size
+               and now - self._idle[0][1] > self.idle_timeout):
+            self._close(self._idle.pop(0)[0])
+
+    @staticmethod
+    def _close(conn):
+        '''Closes a connection, ignoring errors of already broken connections.'''
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+
+_pools = {} # one ConnectionPool per database name
+_pools_lock = threading.Lock()
+
+def get_pool(db_name:str) -> ConnectionPool:
+    '''Returns the connection pool of the given database and creates it on first use.'''
+    with _pools_lock:
+        pool = _pools.get(db_name)
+        if pool is None:
+            pool = ConnectionPool(db_name)
+            _pools[db_name] = pool
+        return pool
+
+
+def connection(db_name:str):
+    '''
+    Context manager to borrow a pooled connection to the specified database.
+    Example: with connection('data') as conn: conn.cursor().execute(...)
+    The connection is returned to the pool (and uncommitted work rolled back) on exit.
+    '''
+    return get_pool(db_name).connection()
+
+
+def close_all_pools():
+    '''Closes the idle connections of all pools. Registered to run when the CLI exits.'''
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close()
+
+atexit.register(close_all_pools)
@@ -1,30 +1,347 @@
 """Module to handle the logging of events on the system."""
 
-from datetime import datetime # python lib to query date and time
+import atexit
+import glob
+import itertools
+import json
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone # python lib to query date and time
 import psycopg2
+import psycopg2.extras
+import psycopg2.pool
+from psycopg2 import sql
 import dbconnection as dbc
+import metrics
+import settings
+
+RED = '\033[91m' # Erorr Messages
+
+# Columns of the three log tables in the order the entries are queued
+LOG_COLUMNS = {
+    'authlogs': ('datetime', 'operation', 'user_id'),
+    'operationlogs': (
+        'datetime', 'operation', 'user_id', 'source_id', 'modified_attribute', 'old_value',
+        'new_value'
+    ),
+    'adminlogs': (
+        'datetime', 'operation', 'admin_id', 'user_id', 'modified_attribute', 'old_value',
+        'new_value'
+    ),
+}
+
+LOG_ENTRIES = metrics.counter(
+    'sss_eventlog_entries_total', 'Log entries by result (written, spilled, quarantined, lost)'
+)
+BATCH_SECONDS = metrics.histogram('sss_eventlog_batch_seconds', 'Duration of writing a log batch')
+
+_STOP = object() # sentinel that tells the writer thread to exit
+LEGACY_FORMAT = "%d/%m/%Y %H:%M:%S" # datetime strings of spill files from before timestamptz
+# Errors after which a batch may succeed later as is (the DB or the pool is unavailable)
+TRANSIENT_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError, psycopg2.pool.PoolError)
+
+
+class LogWriter:
+    """
+    Background writer that queues log entries in memory and inserts them in multi-row batches.
+    A batch is flushed once it reaches the batch size or the flush interval has passed.
+    If the eventlog DB is unreachable, the batch is appended to a local spill file instead
+    and replayed with the next successful flush, so that no audit record is lost. Spill files
+    claimed for replay by a process that ended before the replay finished are replayed as well.
+    Entries the DB rejects (e.g. a value too long for its column) are isolated from the batch and
+    moved to a quarantine file for manual review, so they cannot block the entries after them.
+    """
+
+    def __init__(
+        self,
+        batch_size:int=settings.LOG_BATCH_SIZE,
+        flush_interval:float=settings.LOG_FLUSH_INTERVAL,
+        spill_file:str=settings.LOG_SPILL_FILE,
+        quarantine_file:str=settings.LOG_QUARANTINE_FILE
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_file = spill_file
+        self.quarantine_file = quarantine_file
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._claims = itertools.count() # numbers the spill files claimed by this process
+
+    def submit(self, table:str, row:tuple):
+        '''Queues a row for the given log table. Starts the writer thread on first use.'''
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='eventlog-writer', daemon=True
+                )
+                self._thread.start()
+        self._queue.put((table, row))
+
+    def flush(self):
+        '''Blocks until every entry queued so far has been written (or spilled).'''
+        with self._lock:
+            running = self._thread is not None and self._thread.is_alive()
+        if running:
+            self._queue.join()
+
+    def shutdown(self, timeout:float=settings.LOG_SHUTDOWN_TIMEOUT):
+        '''
+        Drains the queue and stops the writer thread. Entries that could not be written
+        within the timeout are appended to the spill file.
+        '''
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join(timeout)
+        leftover = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                leftover.append(item)
+            self._queue.task_done()
+        if leftover:
+            self._spill(leftover)
+
+    def _run(self):
+        '''Writer thread loop collecting queued entries into batches.'''
+        stop = False
+        while not stop:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    if batch:
+                        item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                    else:
+                        item = self._queue.get() # idle until the next entry arrives
+                        deadline = time.monotonic() + self.flush_interval
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    self._queue.task_done()
+                    stop = True
+                    break
+                batch.append(item)
+            if batch:
+                try:
+                    self._write(batch)
+                finally:
+                    for _ in batch:
+                        self._queue.task_done()
+
+    def _write(self, batch:list):
+        '''
+        Writes a batch to the eventlog DB, replaying any spilled entries first. If the DB is
+        unavailable, the entries that were not written are spilled to be replayed later.
+        '''
+        replay_files = self._claim_spill_files()
+        replayed = [entry for filename in replay_files for entry in self._read_spill(filename)]
+        start = time.perf_counter()
+        unwritten = self._store(replayed + batch)
+        if unwritten:
+            self._spill(unwritten)
+        else:
+            BATCH_SECONDS.observe(time.perf_counter() - start)
+        for filename in replay_files:
+            try:
+                os.remove(filename)
+            except OSError as error:
+                print(RED + "Error removing the replayed event log spill file. Error:", error)
+
+    def _store(self, entries:list) -> list:
+        '''
+        Inserts log entries in one transaction. If the DB rejects the data of some entries, the
+        entries are split in halves until the rejected ones are isolated; these are quarantined
+        and the others are written. Returns the entries not written because the DB (or the
+        connection pool) is unavailable, which are retried later.
+        '''
+        pending = [entries]
+        while pending:
+            part = pending.pop()
+            try:
+                self._insert(part)
+            except TRANSIENT_ERRORS as error:
+                print(RED + "Error writing event logs, entries were spilled to file. Error:", error)
+                return part + [entry for chunk in reversed(pending) for entry in chunk]
+            except psycopg2.Error as error:
+                if len(part) == 1:
+                    print(RED + "Event log entry rejected by the database, quarantined. Error:",
+                          error)
+                    self._quarantine(part, str(error).strip())
+                else:
+                    middle = len(part) // 2
+                    pending.extend((part[middle:], part[:middle])) # first half is retried first
+            else:
+                LOG_ENTRIES.inc(len(part), result='written')
+        return []
+
+    def _insert(self, entries:list):
+        '''Inserts (table, row) pairs with one multi-row statement per table and commits.'''
+        with dbc.connection('eventlog') as conn:
+            cursor = conn.cursor()
+            for table, rows in self._group(entries).items():
+                stmt = sql.SQL("INSERT INTO {table} ({columns}) VALUES %s").format(
+                    table=sql.Identifier(table),
+                    columns=sql.SQL(', ').join(map(sql.Identifier, LOG_COLUMNS[table])),
+                )
+                psycopg2.extras.execute_values(cursor, stmt, rows, page_size=self.batch_size)
+            conn.commit()
+
+    def _spill(self, entries:list):
+        '''Appends log entries to the local spill file, from which they are replayed.'''
+        records = [{'table':table, 'row':list(row)} for table, row in entries]
+        if self._append(self.spill_file, records):
+            LOG_ENTRIES.inc(len(entries), result='spilled')
+
+    def _quarantine(self, entries:list, reason:str):
+        '''Appends log entries that cannot be written to the quarantine file (not replayed).'''
+        records = [{'table':table, 'row':list(row), 'error':reason} for table, row in entries]
+        if self._append(self.quarantine_file, records):
+            LOG_ENTRIES.inc(len(entries), result='quarantined')
+
+    @staticmethod
+    def _append(filename:str, records:list) -> bool:
+        '''
+        Appends records as JSON lines to a file and syncs it to disk. If the file cannot be
+        written (e.g. disk full), the records are printed to stderr as a last resort.
+        Returns False in that case.
+        '''
+        lines = [json.dumps(record, default=_isoformat) + '\n' for record in records]
+        try:
+            directory = os.path.dirname(filename)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(filename, 'a') as file:
+                file.writelines(lines)
+                file.flush()
+                os.fsync(file.fileno())
+        except OSError as error:
+            print(RED + f"Error writing {filename}, the event log entries follow. Error:", error,
+                  file=sys.stderr)
+            sys.stderr.writelines(lines)
+            LOG_ENTRIES.inc(len(records), result='lost')
+            return False
+        return True
+
+    def _claim_spill_files(self) -> list:
+        '''
+        Atomically moves the spill files to be replayed aside: the replay files left by ended
+        processes (oldest entries first), then the spill file. Returns the names of the claimed
+        files, which are unique to this process and claim.
+        '''
+        pattern = re.escape(self.spill_file) + r'\.(?P<pid>\d+)(?:\.\d+)?\.replay'
+        orphans = []
+        for filename in glob.glob(glob.escape(self.spill_file) + '.*.replay'):
+            match = re.fullmatch(pattern, filename)
+            if match is None or metrics.pid_alive(int(match.group('pid'))):
+                continue
+            try:
+                orphans.append((os.path.getmtime(filename), filename))
+            except OSError: # claimed by another process meanwhile
+                continue
+        orphans = [filename for _, filename in sorted(orphans)]
+        claimed = [self._claim(filename) for filename in orphans + [self.spill_file]]
+        return [filename for filename in claimed if filename is not None]
+
+    def _claim(self, filename:str) -> str:
+        '''
+        Renames a spill file to a replay file of this process. Returns the new name, or None if
+        the file does not exist (anymore, e.g. claimed by another process) or cannot be moved.
+        '''
+        claimed = f"{self.spill_file}.{os.getpid()}.{next(self._claims)}.replay"
+        try:
+            os.replace(filename, claimed)
+        except FileNotFoundError:
+            return None
+        except OSError as error:
+            print(RED + "Error claiming the event log spill file for replay. Error:", error)
+            return None
+        return claimed
+
+    def _read_spill(self, filename:str) -> list:
+        '''
+        Reads spilled log entries as (table, row) pairs. The datetimes stay ISO 8601 strings,
+        which PostgreSQL converts on insert; legacy local time strings are converted here.
+        Unreadable lines (e.g. cut off by a crash) are quarantined.
+        '''
+        entries = []
+        try:
+            with open(filename, 'r') as file:
+                lines = file.readlines()
+        except OSError as error:
+            print(RED + "Error reading the event log spill file. Error:", error)
+            return entries
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                table, row = entry['table'], entry['row']
+            except (ValueError, KeyError, TypeError):
+                self._append(self.quarantine_file, [{'line':line.rstrip('\n'),
+                                                     'error':'unreadable spill line'}])
+                continue
+            try:
+                row[0] = datetime.strptime(row[0], LEGACY_FORMAT).astimezone()
+            except (ValueError, TypeError):
+                pass
+            entries.append((table, tuple(row)))
+        return entries
+
+    @staticmethod
+    def _group(entries:list) -> dict:
+        '''Groups (table, row) pairs by table.'''
+        grouped = {}
+        for table, row in entries:
+            grouped.setdefault(table, []).append(row)
+        return grouped
+
+
+writer = LogWriter()
+atexit.register(writer.shutdown) # drain the queue when the CLI exits (incl. sys.exit)
+
+
+def flush():
+    '''Blocks until all queued log entries have been written to the eventlog DB.'''
+    writer.flush()
+
+
+def shutdown():
+    '''Drains all queued log entries and stops the background writer.'''
+    writer.shutdown()
+
+
+def _isoformat(value):
+    '''JSON serializer for the timestamps of spilled log entries.'''
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def timestamp() -> datetime:
+    '''Returns the current time as timezone-aware datetime (stored as timestamptz).'''
+    return datetime.now(timezone.utc)
+
 
 def auth_log(log_type:str, uid:int) -> bool:
     '''
     Function to create an authentication event log entry in the database.
     Takes as input the user_id that actioned the event, as well as the operation type of the log.
     Type can be: Successful Login, Password Change, Account Locked, Locked Account Login Attempt.
-    Returns True if log was created successfully and false if not.
+    The entry is queued and written in the background. Returns True once it has been queued.
     '''
-    conn = dbc.establish_connection('eventlog')
-    cursor = conn.cursor() # Connect Cursor to Eventlog DB
-    dt_now = datetime.now()
-    datestamp = dt_now.strftime("%d/%m/%Y %H:%M:%S") # captures datetime when the function is called
-    sql = """
-          INSERT INTO authlogs(datetime, operation, user_id) 
-          VALUES (%(datetime)s,%(operation)s,%(uid)s)
-          """
-    val = {'datetime':datestamp,'operation':log_type, 'uid':uid}
-    try:
-        cursor.execute(sql,val)
-        conn.commit()
-    except psycopg2.OperationalError:
-        return False
+    datestamp = timestamp() # captures datetime when the function is called
+    writer.submit('authlogs', (datestamp, log_type, uid))
     return True
 
 
@@ -35,31 +352,12 @@ def operation_log( #pylint: disable=too-many-arguments
     Function to create an operations event log entry in the database.
     Input: user_id that actioned the event, the operation type of the log, the id of the source,
     the modified attribute and the before and after value of the attribute.
-    The operation type can be: View Source, Edit Source and Create Source.
-    Returns True if log was created successfully and false if not.
+    The operation type can be: View Source, Edit Source, Create Source and Notification Not Queued.
+    The entry is queued and written in the background. Returns True once it has been queued.
     '''
-    conn = dbc.establish_connection('eventlog')
-    cursor = conn.cursor() # Connect Cursor to Eventlog DB
-    dt_now = datetime.now()
-    datestamp = dt_now.strftime("%d/%m/%Y %H:%M:%S") # captures datetime when function is called
-
-    sql = """
-          INSERT INTO operationlogs
-          (datetime, operation, user_id, source_id, modified_attribute, old_value, new_value)
-          VALUES(%(datetime)s,%(operation)s,%(uid)s,%(sid)s,%(attr)s,%(old)s,%(new)s)
-          """
-    val = {
-        'datetime':datestamp,
-        'operation':log_type,
-        'uid':uid, 'sid':source_id,
-        'attr':modified,'old':old_val,
-        'new':new_val
-        }
-    try:
-        cursor.execute(sql,val)
-        conn.commit()
-    except psycopg2.OperationalError:
-        return False
+    datestamp = timestamp() # captures datetime when function is called
+    row = (datestamp, log_type, uid, source_id, modified, old_val, new_val)
+    writer.submit('operationlogs', row)
     return True
 
 
@@ -71,29 +369,8 @@ def admin_log( #pylint: disable=too-many-arguments
     Input: admin's id that actioned the event, the type of operation, the effected user id,
     the modified attribute and the before and after value of the attribute.
     The operation type can be: Create User, Unlock User, Deactivate User and Edit User.
-    Returns True if log was created successfully and false if not.
+    The entry is queued and written in the background. Returns True once it has been queued.
     '''
-    conn = dbc.establish_connection('eventlog')
-    cursor = conn.cursor() # Connect Cursor to Eventlog DB
-    dt_now = datetime.now()
-    datestamp = dt_now.strftime("%d/%m/%Y %H:%M:%S") # captures datetime when function is called
-    sql = """
-          INSERT INTO adminlogs
-          (datetime, operation, admin_id, user_id, modified_attribute, old_value, new_value)
-          VALUES(%(datetime)s,%(operation)s,%(adid)s,%(uid)s,%(attr)s,%(old)s,%(new)s)
-          """
-    val = {
-        'datetime':datestamp,
-        'operation':log_type,
-        'adid':admin_id,
-        'uid':user_id,
-        'attr':modified,
-        'old':old_val,
-        'new':new_val
-        }
-    try:
-        cursor.execute(sql,val)
-        conn.commit()
-    except psycopg2.OperationalError:
-        return False
+    datestamp = timestamp() # captures datetime when function is called
+    writer.submit('adminlogs', (datestamp, log_type, admin_id, user_id, modified, old_val, new_val))
     return True
@@ -0,0 +1,197 @@
+"""
+Module to export the sources and the event logs to files (CSV, JSONL or Parquet).
+Rows are streamed from the database (COPY TO for CSV, server-side cursors otherwise),
+so the memory usage stays constant regardless of the table size.
+The event logs can only be exported by Administrators.
+Run with: python export.py authlogs --format jsonl --since 2021-01-01 --until 2021-01-31 --gzip
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+import psycopg2
+from psycopg2 import sql
+import authentication as auth
+import dbconnection as dbc
+import eventlog as log
+import settings
+
+RED = '\033[91m' # Error Messages
+GREEN = '\033[92m' # Success Messages
+WHITE = '\033[97m' # User Input
+
+# Exportable tables with their database, columns and the column used for date ranges
+EXPORT_TABLES = {
+    'sources': {
+        'db': 'data',
+        'columns': (
+            'id', 'name', 'url', 'threat_level', 'description', 'creation_date', 'modified_date'
+        ),
+        'date': sql.Identifier('creation_date'),
+    },
+}
+for _table, _columns in log.LOG_COLUMNS.items():
+    EXPORT_TABLES[_table] = {
+        'db': 'eventlog',
+        'columns': ('id',) + _columns,
+        'date': sql.Identifier('datetime'),
+    }
+
+FORMATS = ('csv', 'jsonl', 'parquet')
+INT_COLUMNS = ('id', 'threat_level', 'user_id', 'source_id', 'admin_id')
+DATE_COLUMNS = ('creation_date', 'modified_date')
+TIMESTAMP_COLUMNS = ('datetime',)
+
+
+def export_query(table:str, since=None, until=None) -> sql.Composed:
+    '''
+    Builds the SELECT statement of an export, ordered by id.
+    Since and until are optional dates (inclusive) that limit the rows by their date column.
+    '''
+    spec = EXPORT_TABLES[table]
+    conditions = []
+    if since is not None:
+        conditions.append(sql.SQL("{} >= {}").format(spec['date'], sql.Literal(since)))
+    if until is not None:
+        conditions.append(
+            sql.SQL("{} < {}").format(spec['date'], sql.Literal(until + timedelta(days=1)))
+        )
+    where = sql.SQL(" WHERE ") + sql.SQL(" AND ").join(conditions) if conditions else sql.SQL("")
+    return sql.SQL("SELECT {columns} FROM {table}{where} ORDER BY id").format(
+        columns=sql.SQL(', ').join(map(sql.Identifier, spec['columns'])),
+        table=sql.Identifier(table),
+        where=where,
+    )
+
+
+def open_output(path:str, compress:bool):
+    '''Opens a text file for writing, gzip-compressed if requested.'''
+    if compress:
+        return gzip.open(path, 'wt', newline='')
+    return open(path, 'w', newline='')
+
+
+def write_csv(conn, query:sql.Composed, path:str, compress:bool, columns:tuple):
+    '''Streams the query result into a CSV file via COPY TO STDOUT.'''
+    copy = sql.SQL("COPY ({}) TO STDOUT WITH CSV HEADER").format(query)
+    with open_output(path, compress) as file:
+        conn.cursor().copy_expert(copy.as_string(conn), file)
+
+
+def write_jsonl(conn, query:sql.Composed, path:str, compress:bool, columns:tuple):
+    '''Streams the query result into a JSONL file from a server-side cursor.'''
+    cursor = conn.cursor(name='export')
+    cursor.itersize = settings.EXPORT_BATCH_SIZE
+    cursor.execute(query)
+    with open_output(path, compress) as file:
+        for row in cursor:
+            file.write(json.dumps(dict(zip(columns, row)), default=str) + '\n')
+    cursor.close()
+
+
+def arrow_type(column:str):
+    '''Returns the Parquet (Arrow) data type of a column.'''
+    import pyarrow #pylint: disable=import-outside-toplevel
+    if column in INT_COLUMNS:
+        return pyarrow.int64()
+    if column in DATE_COLUMNS:
+        return pyarrow.date32()
+    if column in TIMESTAMP_COLUMNS:
+        return pyarrow.timestamp('us', tz='UTC')
+    return pyarrow.string()
+
+
+def write_parquet(conn, query:sql.Composed, path:str, compress:bool, columns:tuple):
+    '''
+    Streams the query result into a Parquet file, one row group per fetched batch.
+    Requires the optional pyarrow package. Compression is gzip if requested, snappy otherwise.
+    '''
+    import pyarrow #pylint: disable=import-outside-toplevel
+    import pyarrow.parquet #pylint: disable=import-outside-toplevel
+    schema = pyarrow.schema([(column, arrow_type(column)) for column in columns])
+    cursor = conn.cursor(name='export')
+    cursor.execute(query)
+    compression = 'gzip' if compress else 'snappy'
+    with pyarrow.parquet.ParquetWriter(path, schema, compression=compression) as writer:
+        while True:
+            rows = cursor.fetchmany(settings.EXPORT_BATCH_SIZE)
+            if not rows:
+                break
+            batch = {column: [row[i] for row in rows] for i, column in enumerate(columns)}
+            writer.write_table(pyarrow.Table.from_pydict(batch, schema=schema))
+    cursor.close()
+
+
+WRITERS = {'csv': write_csv, 'jsonl': write_jsonl, 'parquet': write_parquet}
+
+
+def export_table( #pylint: disable=too-many-arguments
+    table:str, path:str, file_format:str='csv', since=None, until=None, compress:bool=False
+) -> bool:
+    '''
+    Exports a table to the given file. The file is written under a temporary name and only
+    renamed once the export is complete, so that a failed export leaves no partial file.
+    Returns True on success, False otherwise.
+    '''
+    spec = EXPORT_TABLES[table]
+    tmp_path = path + '.tmp'
+    try:
+        with dbc.connection(spec['db']) as conn:
+            WRITERS[file_format](
+                conn, export_query(table, since, until), tmp_path, compress, spec['columns']
+            )
+        os.replace(tmp_path, path)
+    except psycopg2.Error as error:
+        print(RED + f"Issue with exporting '{table}'. Error:", error)
+        return False
+    except ImportError:
+        print(RED + "The Parquet export requires the 'pyarrow' package (pip install pyarrow).")
+        return False
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return True
+
+
+def default_path(table:str, file_format:str, compress:bool) -> str:
+    '''Returns the default output file name, e.g. 'authlogs_20210131.jsonl.gz'.'''
+    name = f"{table}_{datetime.now().strftime('%Y%m%d')}.{file_format}"
+    return name + '.gz' if compress and file_format != 'parquet' else name
+
+
+def parse_date(value:str):
+    '''Argparse type for dates in the format YYYY-MM-DD.'''
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date '{value}', expected YYYY-MM-DD") from None
+
+
+def main() -> int:
+    '''Parses the arguments and exports the table.'''
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('table', choices=sorted(EXPORT_TABLES))
+    parser.add_argument('--format', dest='file_format', choices=FORMATS, default='csv')
+    parser.add_argument('--output', help='output file (default: <table>_<date>.<format>)')
+    parser.add_argument('--since', type=parse_date, help='first day to export (YYYY-MM-DD)')
+    parser.add_argument('--until', type=parse_date, help='last day to export (YYYY-MM-DD)')
+    parser.add_argument('--gzip', action='store_true', help='compress the output')
+    args = parser.parse_args()
+
+    roles = (1, 2, 3) if args.table == 'sources' else (1,) # event logs for Administrators only
+    login = auth.prompt_login(roles=roles)
+    if login is None:
+        print(RED + 'Authentication failed or user may not export this table.' + WHITE)
+        return 1
+    path = args.output or default_path(args.table, args.file_format, args.gzip)
+    if not export_table(args.table, path, args.file_format, args.since, args.until, args.gzip):
+        return 1
+    print(GREEN + f"Exported '{args.table}' to {path} ({os.path.getsize(path)} bytes)." + WHITE)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,214 @@
+"""Module to run the Argon2 password hashing and verification on a bounded process pool."""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+import argon2 # Argon2 lib to hash password
+import metrics
+import settings
+
+
+def password_hasher(
+    memory_cost:int=settings.HASH_MEMORY_COST,
+    time_cost:int=settings.HASH_TIME_COST,
+    parallelism:int=settings.HASH_PARALLELISM
+) -> argon2.PasswordHasher:
+    '''Returns an Argon2id password hasher for the given profile (the settings by default).'''
+    return argon2.PasswordHasher(
+        time_cost=time_cost,
+        memory_cost=memory_cost,
+        parallelism=parallelism,
+        hash_len=settings.HASH_LENGTH,
+        salt_len=settings.HASH_SALT_LENGTH,
+        type=argon2.Type.ID,
+    )
+
+
+# Argon2 password hasher object used inside the worker processes
+ph = password_hasher()
+
+
+HASH_SECONDS = metrics.histogram(
+    'sss_password_hash_seconds', 'Duration of Argon2 computations incl. waiting for the pool'
+)
+HASH_REJECTED = metrics.counter('sss_password_hash_rejected_total', 'Computations rejected as busy')
+SLOT_POLL_INTERVAL = 0.01 # seconds between checks for a free slot by the asyncio functions
+
+
+class PoolBusyError(RuntimeError):
+    """Raised if the hashing pool is saturated for longer than the queue timeout."""
+
+
+def _hash(password:str) -> str:
+    '''Worker function: returns the Argon2 hash of the clear text password.'''
+    return ph.hash(password)
+
+
+def _verify(hashed:str, password:str) -> bool:
+    '''Worker function: verifies the password against the hash. Raises VerifyMismatchError.'''
+    return ph.verify(hashed, password)
+
+
+class HashingPool:
+    """
+    Runs Argon2 computations on a pool of worker processes so the caller is not blocked
+    by the CPU and memory cost of the hash. The number of workers bounds the memory that
+    Argon2 may use at once, and max_pending caps the computations that are queued or running.
+    With zero workers, computations run inline in the calling thread.
+    """
+
+    def __init__(
+        self,
+        workers:int=settings.HASH_POOL_SIZE,
+        max_pending:int=settings.HASH_MAX_PENDING,
+        queue_timeout:float=settings.HASH_QUEUE_TIMEOUT
+    ):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args) -> Future:
+        '''
+        Schedules func(*args) on the pool and returns its Future.
+        Waits for a free slot if max_pending computations are in flight already and
+        raises a PoolBusyError if none frees up within the queue timeout.
+        '''
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self._reject()
+        return self._submit_with_slot(func, *args)
+
+    async def submit_async(self, func, *args) -> Future:
+        '''
+        Awaitable version of submit(): waits for a free slot without blocking the event loop.
+        Returns the Future of the worker process.
+        '''
+        deadline = time.monotonic() + self.queue_timeout
+        while not self._slots.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                self._reject()
+            await asyncio.sleep(SLOT_POLL_INTERVAL)
+        return self._submit_with_slot(func, *args)
+
+    def _submit_with_slot(self, func, *args) -> Future:
+        '''Schedules func(*args) once a slot is held. The slot is released when it is done.'''
+        try:
+            future = self._submit(func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def hash(self, password:str) -> str:
+        '''Returns the Argon2 hash of the password, computed on the pool.'''
+        with HASH_SECONDS.time(operation='hash'):
+            return self.submit(_hash, password).result()
+
+    def verify(self, hashed:str, password:str) -> bool:
+        '''
+        Verifies the password against the Argon2 hash on the pool. Returns True if it matches.
+        Raises argon2.exceptions.VerifyMismatchError if it does not.
+        '''
+        with HASH_SECONDS.time(operation='verify'):
+            return self.submit(_verify, hashed, password).result()
+
+    async def hash_async(self, password:str) -> str:
+        '''Awaitable version of hash() for use inside an asyncio event loop.'''
+        with HASH_SECONDS.time(operation='hash'):
+            return await self._run_async(_hash, password)
+
+    async def verify_async(self, hashed:str, password:str) -> bool:
+        '''Awaitable version of verify() for use inside an asyncio event loop.'''
+        with HASH_SECONDS.time(operation='verify'):
+            return await self._run_async(_verify, hashed, password)
+
+    async def _run_async(self, func, *args):
+        '''
+        Awaits func(*args) on the worker processes, or on a thread of the default executor
+        without workers, so the event loop is never blocked by Argon2.
+        '''
+        if self.workers <= 0:
+            loop = asyncio.get_running_loop()
+            return (await loop.run_in_executor(None, self.submit, func, *args)).result()
+        return await asyncio.wrap_future(await self.submit_async(func, *args))
+
+    def shutdown(self):
+        '''Stops the worker processes. The pool is restarted on the next submit.'''
+        with self._lock:
+            executor = self._executor
+            self._executor = None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    @staticmethod
+    def _reject():
+        '''Counts and raises the rejection of a computation by a saturated pool.'''
+        HASH_REJECTED.inc()
+        raise PoolBusyError("Password hashing pool is busy. Please try again later.")
+
+    def _submit(self, func, *args) -> Future:
+        '''Hands the call to the worker processes, or runs it inline without workers.'''
+        if self.workers <= 0:
+            future = Future()
+            try:
+                future.set_result(func(*args))
+            except Exception as error: #pylint: disable=broad-except
+                future.set_exception(error)
+            return future
+        with self._lock:
+            if self._executor is None: # worker processes are started on first use
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor.submit(func, *args)
+
+
+pool = HashingPool()
+
+
+def hash_password(password:str) -> str:
+    '''Uses Argon2 to hash the password on the hashing pool and returns the hash as string.'''
+    return pool.hash(password)
+
+
+def verify_password(hashed:str, password:str) -> bool:
+    '''
+    Verifies the clear password against the Argon2 hash on the hashing pool.
+    Returns True if it matches, raises argon2.exceptions.VerifyMismatchError if not.
+    '''
+    return pool.verify(hashed, password)
+
+
+def hash_passwords(passwords:list) -> list:
+    '''
+    Hashes a list of passwords in parallel on the hashing pool, in waves of at most max_pending
+    computations, so that a long list does not hold every slot of the pool.
+    Returns the Argon2 hashes in the order of the given passwords.
+    Raises a PoolBusyError if the pool stays saturated by other callers.
+    '''
+    hashes = []
+    for start in range(0, len(passwords), pool.max_pending):
+        futures = [pool.submit(_hash, password)
+                   for password in passwords[start:start + pool.max_pending]]
+        hashes.extend(future.result() for future in futures)
+    return hashes
+
+
+def needs_rehash(hashed:str) -> bool:
+    '''
+    Returns True if the hash was created with other parameters than the current profile.
+    Only the parameters encoded in the hash are compared, so this runs inline without Argon2.
+    '''
+    return ph.check_needs_rehash(hashed)
+
+
+async def hash_password_async(password:str) -> str:
+    '''Awaitable version of hash_password().'''
+    return await pool.hash_async(password)
+
+
+async def verify_password_async(hashed:str, password:str) -> bool:
+    '''Awaitable version of verify_password().'''
+    return await pool.verify_async(hashed, password)
@@ -0,0 +1,144 @@
+"""
+Module to ingest threat feeds into the sources table (Specialist role).
+CSV feeds need a header row with the columns: name, url, threat_level, description
+JSONL feeds hold one JSON object with the same keys per line (read by records.py).
+The feed is streamed in chunks, so its size does not affect the memory usage. Malformed lines
+and invalid records are rejected with their line numbers, the other records are loaded.
+Run with: python ingestion.py feed.csv [--dry-run]
+"""
+
+import argparse
+import itertools
+import sys
+import admin_operations as adops
+import authentication as auth
+import operations as ops
+import outbox
+import records
+import settings
+import validation
+
+RED = '\033[91m' # Error Messages
+GREEN = '\033[92m' # Success Messages
+WHITE = '\033[97m' # User Input
+YELLOW = '\033[93m' # Notices to User
+
+FIELDS = ('name', 'url', 'threat_level', 'description')
+
+
+def validate_source(record:dict) -> str:
+    '''
+    Validates a source record with the same rules as the source creation prompts of the
+    interface, as well as the column sizes of the sources table.
+    Returns an error message, or None if the record is valid.
+    '''
+    for field in FIELDS:
+        if not str(record.get(field) or '').strip():
+            return f"Missing field '{field}'"
+    for field in FIELDS:
+        error = validate_source_field(field, record[field])
+        if error is not None:
+            return error
+    return None
+
+
+def validate_source_field(field:str, value) -> str:
+    '''
+    Validates a single field of a source, e.g. the new value of a modification.
+    Returns an error message, or None if the value is valid.
+    '''
+    if field in ('name', 'url', 'description') and not isinstance(value, str):
+        return f"Field '{field}' must be text"
+    if field == 'name' and not 5 <= len(value) <= 255:
+        return 'Invalid Source Name'
+    if field == 'url' and (len(value) > 255 or not validation.is_valid_url(value)):
+        return 'Invalid Source Url'
+    if field == 'description' and not 5 <= len(value) <= 500:
+        return 'Invalid Source Description'
+    if field == 'threat_level' and str(value) not in ('1', '2', '3', '4', '5'):
+        return 'Invalid Threat Level (1 - 5)'
+    return None
+
+
+def valid_sources(records, errors:list):
+    '''
+    Generator that filters the valid records of the feed and yields them as
+    (name, url, threat level, description) tuples. Invalid records are appended to errors.
+    '''
+    for line, record in records:
+        error = validate_source(record)
+        if error is not None:
+            errors.append((line, record.get('url'), error))
+            continue
+        yield (record['name'], record['url'], int(record['threat_level']), record['description'])
+
+
+def chunked(iterable, size:int):
+    '''Generator that groups an iterable into lists of the given size.'''
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def ingest(path:str, uid:int, chunk_size:int=settings.INGEST_CHUNK_SIZE) -> dict:
+    '''
+    Streams the feed into the sources table chunk by chunk (one transaction per chunk).
+    Sources with a url that exists already are skipped. Once done, a single digest notification
+    for all created sources is queued for the Authority users.
+    Returns a summary dict with the number of valid, created, duplicate and rejected records.
+    '''
+    errors = []
+    summary = {'valid':0, 'created':0, 'duplicates':0, 'failed':0, 'rejected':0}
+    digest = [] # first sources to list in the digest notification
+    for chunk in chunked(valid_sources(records.read_records(path, errors), errors), chunk_size):
+        summary['valid'] += len(chunk)
+        created = ops.create_sources_bulk(chunk, uid)
+        if created is None:
+            summary['failed'] += len(chunk)
+            continue
+        summary['created'] += len(created)
+        summary['duplicates'] += len(chunk) - len(created)
+        digest.extend(created[:settings.DIGEST_MAX_SOURCES - len(digest)])
+        print(YELLOW + f"Loaded {summary['valid']} sources, {summary['created']} created..." + WHITE)
+    for line, url, error in sorted(errors, key=lambda error: error[0]):
+        print(RED + f"Skipping line {line} ({url}): {error}")
+    summary['rejected'] = len(errors)
+    if summary['created']:
+        outbox.enqueue(
+            'new_sources_digest', recipients=adops.fetch_all_authorities(),
+            total=summary['created'], sources=digest
+        ) # one digest email per authority instead of one per source
+    return summary
+
+
+def main() -> int:
+    '''Parses the arguments and ingests the feed.'''
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('file', help='CSV or JSONL threat feed')
+    parser.add_argument('--dry-run', action='store_true', help='only validate the feed')
+    args = parser.parse_args()
+
+    if args.dry_run:
+        errors = []
+        valid = sum(1 for _ in valid_sources(records.read_records(args.file, errors), errors))
+        for line, url, error in sorted(errors, key=lambda error: error[0]):
+            print(RED + f"Invalid line {line} ({url}): {error}")
+        print(YELLOW + f"{valid} valid sources, {len(errors)} rejected records." + WHITE)
+        return 0 if not errors else 1
+
+    login = auth.prompt_login(roles=(2,)) # only specialists may create sources
+    if login is None:
+        print(RED + 'Authentication failed or user is not a Specialist.' + WHITE)
+        return 1
+    summary = ingest(args.file, login[0])
+    print(GREEN + f"{summary['created']} sources created, {summary['duplicates']} duplicates "
+          f"skipped, {summary['rejected']} records rejected, {summary['failed']} failed to load."
+          + WHITE)
+    return 0 if not summary['rejected'] and not summary['failed'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
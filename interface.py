@@ -1,12 +1,15 @@
 """Module to define the Interface Class including menu options and user inputs."""
 
-import sys
+from datetime import datetime
+from functools import partial
 import stdiomask
-from validator_collection import checkers
+import audit
 import authentication as auth
 import admin_operations as adops
 import operations as ops
 import eventlog as log
+import sessions
+import validation
 
 
 RED = '\033[91m' # Error Messages
@@ -18,7 +21,12 @@ BOLD = '\033[1m'
 
 
 class Interface: #pylint: disable=too-many-public-methods
-    """Class that provides user menus and inputs. Differentiates views depending on user role."""
+    """
+    Class that provides user menus and inputs. Differentiates views depending on user role.
+    Each screen (menu or dialogue) returns the next screen to display, or None to end the
+    session, and the run loop displays them one after another. Screens never call each other,
+    so the call stack stays flat however long a session runs.
+    """
 
     def __init__(self):
         # Initialise the interface object when main.py is run.
@@ -26,11 +34,16 @@ class Interface: #pylint: disable=too-many-public-methods
         self.urole = None
         self.first_name = None
         self.username = None
+        self.token = None # session token issued at login
 
-        self.entered_username = None
-        self.failed_attempts = 0
+        self.run() # display the screens, starting with the motd
 
-        self.motd() # call motd to display
+
+    def run(self, screen=None):
+        '''Displays the screens one after another, from the motd by default, until one is None.'''
+        screen = screen or self.motd
+        while screen is not None:
+            screen = screen()
 
 
     def motd(self):
@@ -48,70 +61,57 @@ class Interface: #pylint: disable=too-many-public-methods
               'https://marziohr.github.io/SSD_Project/policies/Privacy%20Policy.pdf\n')
         choice=self.y_n_input("Do you agree with the Terms of Service and Privacy Policy? (y/n): ")
         if choice == 'y':
-            self.login()
-        else:
-            sys.exit()
+            return self.login
+        return None
 
 
     def login(self):
         '''
         Asks user to enter username and password. If combination is found,
         logs user in and saves the user id, role and first name.
-        If combination is incorrect after third try, user will be locked from logging in again.
+        Failed attempts are counted on the database (throttling module), so the lock after
+        LOGIN_LOCKOUT_FAILURES incorrect passwords applies across all sessions.
+        Returns the next screen: the login prompt again or the main menu.
         '''
         inpt_username = self.username_input()
         inpt_password = stdiomask.getpass()
 
         login = auth.existing_user(inpt_username,inpt_password)
 
-        if login is None: # Condition if Username was not found
+        if not login: # Condition if Username was not found or entered password was incorrect
             print(RED + 'The Username and Password combination you have entered is incorrect.')
-            self.login()
-
-        elif login is False: # Condition if entered password was incorrect
-            if self.entered_username != inpt_username: # if username differs, reset attempts to 1
-                self.entered_username = inpt_username
-                self.failed_attempts = 1
-                print(RED + 'The Username and Password combination you have entered is incorrect.')
-                self.login()
-            else: # trigger lock if login for same user is failed 3 times in succession
-                if self.failed_attempts < 2:
-                    self.failed_attempts += 1
-                    print(RED, end='')
-                    print('The Username and Password combination you have entered is incorrect.')
-                    self.login()
-                else:
-                    adops.lock_user(adops.fetch_user_info(username=inpt_username)[0])
-                    print(RED+'Your account has been locked because it reached ', end='')
-                    print('a maximum amount of failed login attempts.')
-                    print('Please contact the system administrator team for further assistance.\n')
-                    print(WHITE)
-                    sys.exit()
+            return self.login
 
-        else:
-            log.auth_log("Successful Login", login[0]) # log successful login
-            self.uid = login[0]
-            self.urole = login[2]
-            self.first_name = login[1]
-            self.username = inpt_username
-
-            last_login = auth.fetch_last_login(self.uid)
-            if last_login is None:
-                print(GREEN+f'\nAccess Granted! Welcome to the System, {self.first_name}.')
-                print(YELLOW+'\nDue to you logging into the system for the first time, ', end='')
-                print('please change your own password.')
-                while True: # while password is not changed iterate over password change prompt
-                    changed_pswd = self.change_password()
-                    if changed_pswd:
-                        auth.update_last_login(self.uid) # updates last_login date stamp
-                        print(YELLOW+'You will now be logged out. ', end='')
-                        print('Please login with your new password to use the system.')
-                        self.logout()
-
-            else:
-                print(GREEN + f'\nAccess Granted! Welcome back, {self.first_name}.')
-                auth.update_last_login(self.uid) # updates last_login date stamp
-                self.handle_main()
+        log.auth_log("Successful Login", login[0]) # log successful login
+        self.uid = login[0]
+        self.urole = login[2]
+        self.first_name = login[1]
+        self.username = inpt_username
+        try:
+            self.token = sessions.create(login, inpt_username)
+        except sessions.SigningKeyError as error:
+            print(RED + str(error) + WHITE)
+            return None
+        if self.token is None:
+            print(RED + 'Your session could not be started. Please try again later.' + WHITE)
+            return None
+
+        last_login = auth.fetch_last_login(self.uid)
+        if last_login is None:
+            print(GREEN+f'\nAccess Granted! Welcome to the System, {self.first_name}.')
+            print(YELLOW+'\nDue to you logging into the system for the first time, ', end='')
+            print('please change your own password.')
+            while not self.change_password(): # iterate over password change prompt
+                if sessions.resolve(self.token) is None:
+                    return self.session_expired
+            auth.update_last_login(self.uid) # updates last_login date stamp
+            print(YELLOW+'You will now be logged out. ', end='')
+            print('Please login with your new password to use the system.')
+            return self.logout
+
+        print(GREEN + f'\nAccess Granted! Welcome back, {self.first_name}.')
+        auth.update_last_login(self.uid) # updates last_login date stamp
+        return self.handle_main
 
 
     def handle_main(self):
@@ -120,15 +120,25 @@ class Interface: #pylint: disable=too-many-public-methods
         1 = Administrator
         2 = Specialist
         3 = Third-Party Authority
+        If the session has expired or was ended (e.g. by a lock), the user has to log in again.
         '''
+        if sessions.resolve(self.token) is None:
+            return self.session_expired
         if self.urole == 1:
-            self.admin_menu()
-        elif self.urole == 2:
-            self.specialist_menu()
-        elif self.urole == 3:
-            self.authority_menu()
-        else:
-            print(RED + f"Error: User Role not set correctly. Current value set to: {self.urole}")
+            return self.admin_menu
+        if self.urole == 2:
+            return self.specialist_menu
+        if self.urole == 3:
+            return self.authority_menu
+        print(RED + f"Error: User Role not set correctly. Current value set to: {self.urole}")
+        return None
+
+
+    def session_expired(self):
+        '''Message to be displayed when the session is no longer valid. Returns the login prompt.'''
+        print(YELLOW + '\nYour session has expired. Please log in again.' + WHITE)
+        self.token = None
+        return self.login
 
 
     def admin_menu(self):
@@ -136,25 +146,23 @@ class Interface: #pylint: disable=too-many-public-methods
         Displays main menu options for the administrator role.
         Depending on choice, will trigger the operation from the admin_operations module.
         Choices include: Creating a new user, modifying an existing user,
-        deactivating (soft deleting) an existing user, unlocking a user, logout.
+        deactivating (soft deleting) an existing user, unlocking a user, audit logs, logout.
         '''
         print(BLUE + '\nPlease select what you want to do:')
         print(' 1. Create New User')
         print(' 2. Modify Existing User')
         print(' 3. Deactivate User')
         print(' 4. Unlock User')
-        print(' 5. Logout' + WHITE)
-        choice = self.choice_input(5)
-        if choice == 1:
-            self.create_user()
-        elif choice == 2:
-            self.modify_user()
-        elif choice == 3:
-            self.deactivate_user()
-        elif choice == 4:
-            self.unlock_user()
-        else:
-            self.logout()
+        print(' 5. Audit Logs')
+        print(' 6. Logout' + WHITE)
+        choice = self.choice_input(6)
+        return {
+            1: self.create_user,
+            2: self.modify_user,
+            3: self.deactivate_user,
+            4: self.unlock_user,
+            5: self.audit_menu,
+        }.get(choice, self.logout)
 
 
     def specialist_menu(self):
@@ -169,20 +177,11 @@ class Interface: #pylint: disable=too-many-public-methods
         print(' 3. Change Password')
         print(' 4. Logout' + WHITE)
         choice = self.choice_input(4)
-        if choice == 1:
-            self.search_sources()
-        elif choice == 2:
-            self.create_source()
-        elif choice == 3:
-            changed_pswd = self.change_password()
-            if changed_pswd:
-                print(YELLOW+'\nYou will now be logged out. ', end='')
-                print('Please login with your new password to use the system.')
-                self.logout()
-            else:
-                self.handle_main()
-        else:
-            self.logout()
+        return {
+            1: self.search_sources,
+            2: self.create_source,
+            3: self.change_password_menu,
+        }.get(choice, self.logout)
 
 
     def authority_menu(self):
@@ -196,18 +195,10 @@ class Interface: #pylint: disable=too-many-public-methods
         print(' 2. Change Password')
         print(' 3. Logout' + WHITE)
         choice = self.choice_input(3)
-        if choice == 1:
-            self.search_sources()
-        elif choice == 2:
-            changed_pswd = self.change_password()
-            if changed_pswd:
-                print(YELLOW+'\nYou will now be logged out. ', end='')
-                print('Please login with your new password to use the system.')
-                self.logout()
-            else:
-                self.handle_main()
-        else:
-            self.logout()
+        return {
+            1: self.search_sources,
+            2: self.change_password_menu,
+        }.get(choice, self.logout)
 
 
     def create_user(self):
@@ -245,9 +236,8 @@ class Interface: #pylint: disable=too-many-public-methods
 
         choice = self.y_n_input(WHITE + "\nDo you want to create another user? (y/n): ")
         if choice == 'y':
-            self.create_user()
-        else:
-            self.admin_menu()
+            return self.create_user
+        return self.admin_menu
 
 
     def modify_user(self): #pylint: disable=too-many-branches
@@ -295,9 +285,8 @@ class Interface: #pylint: disable=too-many-public-methods
             print(RED + 'No User found for the email address.')
         choice = self.y_n_input(WHITE + "\nDo you want to modify another user? (y/n): ")
         if choice == 'y':
-            self.modify_user()
-        else:
-            self.handle_main()
+            return self.modify_user
+        return self.handle_main
 
 
     def deactivate_user(self):
@@ -327,9 +316,8 @@ class Interface: #pylint: disable=too-many-public-methods
             print(RED + 'No User found for the email address.')
         choice = self.y_n_input(WHITE + "\nDo you want to deactivate another user? (y/n): ")
         if choice == 'y':
-            self.deactivate_user()
-        else:
-            self.admin_menu()
+            return self.deactivate_user
+        return self.admin_menu
 
 
     def unlock_user(self):
@@ -360,15 +348,96 @@ class Interface: #pylint: disable=too-many-public-methods
             print(RED + 'No User found for the email address.')
         choice = self.y_n_input(WHITE + "\nDo you want to unlock another user? (y/n): ")
         if choice == 'y':
-            self.unlock_user()
+            return self.unlock_user
+        return self.admin_menu
+
+
+    def audit_menu(self):
+        '''
+        Displays the audit options for administrators: querying one of the log tables
+        with filters, or one of the pre-aggregated reports (see the audit module).
+        '''
+        print(BLUE + '\nAudit Logs')
+        print('---------------------------')
+        print('\nPlease select what you want to do:')
+        print(' 1. Authentication Logs')
+        print(' 2. Operation Logs')
+        print(' 3. Administration Logs')
+        print(' 4. Report: Source Views per Day')
+        print(' 5. Report: Failed Logins per User')
+        print(' 6. Main menu' + WHITE)
+        choice = self.choice_input(6)
+        if choice in (1, 2, 3):
+            return partial(self.audit_logs, ('authlogs', 'operationlogs', 'adminlogs')[choice - 1])
+        if choice in (4, 5):
+            return partial(self.audit_report, choice)
+        return self.admin_menu
+
+
+    def audit_logs(self, table:str):
+        '''
+        Prompts the filters for a log table (empty input = no filter) and pages through the
+        matching log entries, newest first.
+        '''
+        filters = {}
+        for column in audit.FILTERS[table]:
+            label = column.replace('_', ' ').title() # e.g. 'User Id'
+            if column == 'operation':
+                value = input(WHITE + "\nFilter by Operation (e.g. 'View Source', empty = all): ")
+            else:
+                value = self.optional_id_input(f"Filter by {label}")
+            if value not in (None, ''):
+                filters[column] = value
+        since = self.optional_date_input("From Date")
+        until = self.optional_date_input("To Date")
+
+        page = audit.query_logs(table, filters, since, until)
+        while page is not None:
+            rows, has_next = page
+            if not rows:
+                print(RED + "No log entries found")
+                break
+            print(BLUE + '\n' + '\t'.join(('id',) + log.LOG_COLUMNS[table]))
+            for row in rows:
+                local_time = row[1].astimezone().strftime("%d/%m/%Y %H:%M:%S")
+                print('\t'.join(str(value) for value in (row[0], local_time) + row[2:]))
+            if not has_next or self.y_n_input(WHITE + "\nShow the next page? (y/n): ") == 'n':
+                break
+            page = audit.query_logs(table, filters, since, until, before=(rows[-1][1], rows[-1][0]))
+        if page is None:
+            print(RED + "Error: The event logs could not be queried. Please try again.")
+        return self.audit_menu
+
+
+    def audit_report(self, report:int):
+        '''
+        Displays one of the audit reports for an optional date range.
+        4 = Source Views per Day (optionally for one source), 5 = Failed Logins per User
+        '''
+        source_id = self.optional_id_input("Filter by Source Id") if report == 4 else None
+        since = self.optional_date_input("From Date")
+        until = self.optional_date_input("To Date")
+        if report == 4:
+            rows = audit.source_views(source_id, since, until)
+            header = "Day\t\tSource Id\tViews"
+        else:
+            rows = audit.failed_logins(since, until)
+            header = "User Id\tAttempts\tLast Failed Login"
+        if rows is None:
+            print(RED + "Error: The report could not be queried. Please try again.")
+        elif not rows:
+            print(RED + "No entries found")
         else:
-            self.admin_menu()
+            print(BLUE + '\n' + header)
+            for row in rows:
+                print('\t'.join(str(value) for value in row))
+        return self.audit_menu
 
 
-    def search_sources(self): #pylint: disable=too-many-branches,too-many-statements
+    def search_sources(self):
         '''
-        Displays options for Source Search. Once a Source has been selected, will display the
-        main information regarding the source, as well as provide the option to modify it.
+        Displays options for Source Search and pages through the results until a Source has been
+        selected. Returns the details screen of the selected source.
         '''
         print(BLUE + '\nSearch Source')
         print('---------------------------')
@@ -383,33 +452,53 @@ class Interface: #pylint: disable=too-many-public-methods
         else:
             search_term = self.search_string_input("Please enter text to search")
         field_name = self.map_input_field(input_field)
-        result = ops.search_for_source(field_name, search_term)
+        result, has_previous, has_next = ops.search_page(field_name, search_term)
 
         if len(result) == 0:
             print(RED + "No sources found")
-            self.search_sources()
-
-        print(BLUE + "\nId\tName")
-        print("--\t--------------")
-        for item in result:
-            print((str(item[0]) + "\t" +item[1]))
+            return self.search_sources
+
+        while True: # page through the results until a source id is selected
+            print(BLUE + "\nId\tName")
+            print("--\t--------------")
+            for item in result:
+                print((str(item[0]) + "\t" +item[1]))
+
+            print(WHITE + '\nPlease enter the Source Id to view details', end='')
+            if has_previous or has_next:
+                print(" ('n' = next page, 'p' = previous page)", end='')
+            print(':')
+            selection = self.source_id_input(has_previous, has_next)
+            if selection == 'n':
+                page = ops.search_page(field_name, search_term, after_id=result[-1][0])
+            elif selection == 'p':
+                page = ops.search_page(field_name, search_term, before_id=result[0][0])
+            else:
+                selected_id = selection
+                break
+            if len(page[0]) == 0:
+                print(RED + "No further sources found")
+                continue
+            result, has_previous, has_next = page
 
-        print(WHITE + '\nPlease enter the Source Id to view details:')
-        selected_id = self.source_id_input()
         # Check if entered Source Id is valid
-        is_valid_id = False
-        for item in result:
-            if item[0] == selected_id:
-                log.operation_log("View Source", self.uid, selected_id) # log view source event
-                is_valid_id = True
-        if not is_valid_id:
+        if selected_id not in [item[0] for item in result]:
             print(RED + "Invalid source Id")
-            self.search_sources()
-        source_details = ops.get_source_by_id(selected_id)
+            return self.search_sources
+        log.operation_log("View Source", self.uid, selected_id) # log view source event
+        return partial(self.source_details, selected_id)
+
+
+    def source_details(self, source_id:int):
+        '''
+        Displays the main information regarding a source, as well as the option to modify it
+        (not for authorities). Returns the screen chosen by the user.
+        '''
+        source_details = ops.get_source_by_id(source_id)
 
         if source_details is None:
             print (RED + "Error occured")
-            self.search_sources()
+            return self.search_sources
 
         print (BLUE + "\nId : " + str(source_details[0]))
         print ("Name : " + source_details[1])
@@ -424,43 +513,40 @@ class Interface: #pylint: disable=too-many-public-methods
         if self.urole == 3:
             print(' 1. Search new source')
             print(' 2. Main menu' + WHITE)
-        else:
-            print(' 1. Edit')
-            print(' 2. Search new source')
-            print(' 3. Main menu' + WHITE)
+            choice = self.choice_input(2)
+            return self.search_sources if choice == 1 else self.handle_main
 
+        print(' 1. Edit')
+        print(' 2. Search new source')
+        print(' 3. Main menu' + WHITE)
         choice = self.choice_input(3)
+        if choice == 1:
+            return partial(self.edit_source, source_id)
+        if choice == 2:
+            return self.search_sources
+        return self.handle_main
 
-        if self.urole == 3:
-            if choice == 1:
-                self.search_sources()
-            elif choice == 2:
-                self.specialist_menu()
-        else:
-            if choice == 1:
-                print(BLUE + '\nPlease select the field you want to edit:')
-                print(' 1. Name')
-                print(' 2. Url')
-                print(' 3. Description')
-                print(' 4. Threat Level' + WHITE)
-                input_edit_field = self.choice_input(4)
-
-                if input_edit_field == 2:
-                    new_value = self.source_create_url_input("Please enter new url")
-                elif input_edit_field == 4:
-                    new_value = self.choice_input(5)
-                else:
-                    new_value = self.search_string_input(WHITE + "Please enter new value")
 
-                edit_field_name = self.map_input_field(input_edit_field)
-                ops.modify_source(int(selected_id), edit_field_name, new_value, self.uid)
-                print(GREEN + '\nSource has been modified successfully')
-                self.specialist_menu()
+    def edit_source(self, source_id:int):
+        '''Prompts the field and new value to modify a source. Returns the main menu.'''
+        print(BLUE + '\nPlease select the field you want to edit:')
+        print(' 1. Name')
+        print(' 2. Url')
+        print(' 3. Description')
+        print(' 4. Threat Level' + WHITE)
+        input_edit_field = self.choice_input(4)
+
+        if input_edit_field == 2:
+            new_value = self.source_create_url_input("Please enter new url")
+        elif input_edit_field == 4:
+            new_value = self.choice_input(5)
+        else:
+            new_value = self.search_string_input(WHITE + "Please enter new value")
 
-            elif choice == 2:
-                self.search_sources()
-            elif choice == 3:
-                self.specialist_menu()
+        edit_field_name = self.map_input_field(input_edit_field)
+        ops.modify_source(int(source_id), edit_field_name, new_value, self.uid)
+        print(GREEN + '\nSource has been modified successfully')
+        return self.handle_main
 
 
     def create_source(self):
@@ -486,18 +572,34 @@ class Interface: #pylint: disable=too-many-public-methods
 
         choice = self.y_n_input(WHITE + "\nDo you want to create another Source? (y/n): ")
         if choice == 'y':
-            self.create_source()
-        else:
-            self.specialist_menu()
+            return self.create_source
+        return self.specialist_menu
+
+
+    def change_password_menu(self):
+        '''
+        Menu option to change the own password. After a successful change the user is logged out,
+        otherwise the main menu is displayed again.
+        '''
+        if self.change_password():
+            print(YELLOW+'\nYou will now be logged out. ', end='')
+            print('Please login with your new password to use the system.')
+            return self.logout
+        return self.handle_main
 
 
     def change_password(self) -> bool:
         '''
-        Function and prompt to change password. User will need to enter his existing password.
+        Function and prompt to change password. Requires a valid session of the login, and the
+        user will need to enter the current password, so an unattended session cannot be taken over.
         User will then have to enter the new password and confirm it.
         If all correct, password will be updated on the database.
         Returns True if successful and False if not.
         '''
+        if sessions.resolve(self.token) is None:
+            print(RED + 'Your session has expired. Please log in again.')
+            return False
+
         inpt_password = stdiomask.getpass(WHITE+'Please enter your current Password: ')
         login = auth.existing_user(self.username,inpt_password)
 
@@ -535,51 +637,41 @@ class Interface: #pylint: disable=too-many-public-methods
         print(BLUE, end='')
         print("\nThank you for using the NCSC Suspect Sources System. ", end='')
         print(f"See you soon, {self.first_name}!\n" + WHITE)
-        sys.exit()
+        sessions.revoke(self.token)
+        log.shutdown() # write all queued event logs before exiting
+        return None
 
 
-    def choice_input(self, num_choices:int) -> int:
+    def choice_input(self, num_choices:int) -> int: #pylint: disable=no-self-use
         '''
         Wrapper to validate the user input for a menu selection.
         The amount of different options to choose from can be set with the argument "num_choices".
-        Returns the chosen option as an Integer.
-        '''
-        user_input = input(WHITE + "\nSelect option: ")
-        try:
-            int_input = int(user_input)
-        except ValueError:
+        Returns the chosen option as an Integer. Asks again until the input is valid.
+        '''
+        while True:
+            user_input = input(WHITE + "\nSelect option: ")
+            try:
+                int_input = int(user_input)
+            except ValueError:
+                int_input = 0
+            if 0 < int_input <= num_choices:
+                return int_input
             print(RED + "Error: Invalid selection. Please check your input and try again.")
-            return self.choice_input(num_choices)
-        if 0 < int_input <= num_choices:
-            return int_input
-        print(RED + "Error: Invalid selection. Please check your input and try again.")
-        return self.choice_input(num_choices)
 
 
-    def username_input(self) -> str:
+    def username_input(self) -> str: #pylint: disable=no-self-use
         '''
         Wrapper to validate and sanitise the user input for username.
         Ensures entered string is following the validation rules. If so, returns the entered string.
         '''
-        valid_char = ('.','_','-')
-        min_len = 5
-
-        input_user = input(WHITE + "\nPlease enter your Username: ")
-
-        if len(input_user) < min_len: # checks the length of the entered username
-            print(RED + "Error: Entered username is invalid. Please check and try again.")
-            return self.username_input()
-        for char in input_user: # checks each character of user input
-            if char.isalnum():
-                continue # continue if current char is either alpha or numerical
-            if char in valid_char:
-                continue # continue if current char is part of the valid characters tuple
+        while True:
+            input_user = input(WHITE + "\nPlease enter your Username: ")
+            if validation.is_valid_username(input_user):
+                return input_user # returns entered string if all validation rules are met
             print(RED + "Error: Entered username is invalid. Please check and try again.")
-            return self.username_input()
-        return input_user # returns entered string if all validation rules are met
 
 
-    def name_input(self, name_type:str) -> str:
+    def name_input(self, name_type:str) -> str: #pylint: disable=no-self-use
         '''
         Wrapper to validate and sanitise the user input for first and lastname.
         Ensures entered string is following the validation rules. If so, returns the entered string.
@@ -588,94 +680,43 @@ class Interface: #pylint: disable=too-many-public-methods
         "first" = first name
         "last" = last name
         '''
-        valid_char = (' ','-')
-        min_len = 3
-
-        input_name = input(WHITE + f"\nPlease enter the User's {name_type} Name: ")
-
-        if len(input_name) < min_len: # checks the length of the entered name
-            print(RED + "Error: Entered Name is invalid. Please check and try again.")
-            return self.name_input(name_type)
-        for char in input_name: # checks each character of name input
-            if char.isalpha():
-                continue # continue if current char is a letter
-            if char in valid_char:
-                continue # continue if current char is part of the valid characters tuple
+        while True:
+            input_name = input(WHITE + f"\nPlease enter the User's {name_type} Name: ")
+            if validation.is_valid_name(input_name):
+                return input_name # returns entered string if all validation rules are met
             print(RED + "Error: Entered Name is invalid. Please check and try again.")
-            return self.name_input(name_type)
-        return input_name # returns entered string if all validation rules are met
 
 
-    def email_input(self, register=False) -> str:
+    def email_input(self, register=False) -> str: #pylint: disable=no-self-use
         '''
         Wrapper to validate and sanitise the user input for email.
         Ensures entered string is following the validation rules. If so, returns the entered string.
         Validation: Must contain exactly 1x '@', atleast 1x '.' and end with a letter.
         May contain alnum and '-', '.', '_', '+'
+        With register set, email addresses of existing users are rejected.
         '''
-        valid_char = ('-', '.', '_', '+')
-        min_len = 7
-        num_at_sign = 0
-        contains_dot = False
-        ends_with_letter = False
-
-        input_email = input(WHITE + "\nPlease enter the User's Email Address: ")
+        while True:
+            input_email = input(WHITE + "\nPlease enter the User's Email Address: ")
 
-        if register:
-            email_exists = adops.fetch_user_info(email=input_email)
-            if email_exists:
+            if register and adops.fetch_user_info(email=input_email):
                 print(RED + "Error: Entered Email Address is already tied to a User in the system.")
-                return self.email_input()
-
-        if len(input_email) < min_len:
-            print(RED + "Error: Entered Email Address is invalid. Please check and try again.")
-            return self.email_input()
-
-        if input_email[-1].isalpha(): # checks if email ends with a letter
-            ends_with_letter = True
-
-        if '.' in input_email: # checks if email contains atleast one '.'
-            contains_dot = True
-
-        for char in input_email: # checks each character of name input
-            if char.isalnum():
-                continue # continue if character is a letter or number
-            if char in valid_char:
-                continue # continue if character is part of the valid_char tuple
-            if char == '@':
-                num_at_sign += 1 # counts the number of times the '@' sign appears
-                continue
-            print(RED + "Error: Entered Email Address is invalid. Please check and try again.")
-            return self.email_input()
-
-        if num_at_sign == 1 and contains_dot and ends_with_letter:
-            return input_email # if all validations are met, the input string is returned
-        print(RED + "Error: Entered Email Address is invalid. Please check and try again.")
-        return self.email_input()
+            elif validation.is_valid_email(input_email):
+                return input_email # if all validations are met, the input string is returned
+            else:
+                print(RED + "Error: Entered Email Address is invalid. Please check and try again.")
 
 
-    def dob_input(self) -> str:
+    def dob_input(self) -> str: #pylint: disable=no-self-use
         '''
         Wrapper to validate and sanitise the user input date of birth.
         Ensures that string is following validation rules. If so, returns the entered string.
         Validation: Exactly 10 characters and may only contain numbers and '-'
         '''
-        valid_char = ('-')
-        exact_len = 10
-
-        input_dob = input(WHITE + "\nPlease enter the User's Date of Birth (Format YYYY-MM-DD): ")
-
-        if len(input_dob) != exact_len:
-            print(RED + "Error: Entered Date of Birth is invalid. Please check and try again.")
-            return self.dob_input()
-        for char in input_dob:
-            if char.isnumeric():
-                continue
-            if char in valid_char:
-                continue
+        while True:
+            input_dob = input(WHITE+"\nPlease enter the User's Date of Birth (Format YYYY-MM-DD): ")
+            if validation.is_valid_dob(input_dob):
+                return input_dob
             print(RED + "Error: Entered Date of Birth is invalid. Please check and try again.")
-            return self.dob_input()
-        return input_dob
 
 
     def password_validator(self, password:str) -> bool: #pylint: disable=no-self-use
@@ -684,74 +725,85 @@ class Interface: #pylint: disable=too-many-public-methods
         A password must be atleast 12 characters long, include letters and numbers,
         and atleast one special character. Returns True if conform and False if not.
         '''
-        min_len = 12
-        includes_letter = False
-        includes_number = False
-        includes_special = False
+        return validation.is_valid_password(password)
 
-        valid_special_char = '[@_!#$%^&*()<>?/\}{~:;]-.,' #pylint: disable=anomalous-backslash-in-string
 
-        if len(password) < min_len:
-            return False
-        for char in password:
-            if char.isalpha():
-                includes_letter = True
-            elif char.isnumeric():
-                includes_number = True
-            elif char in valid_special_char:
-                includes_special = True
-        if includes_special and includes_number and includes_letter:
-            return True
-        return False
-
-
-    def y_n_input(self, question:str) -> str:
+    def y_n_input(self, question:str) -> str: #pylint: disable=no-self-use
         '''Validates a yes/no question and returns the str if answer is either 'y' or 'n'.'''
-        input_choice = input(WHITE + question).lower()
-        if input_choice in ('y', 'n'):
-            return input_choice
-        print(RED+"Error: Please answer either 'y' for 'yes' or 'n' for 'no'.")
-        return self.y_n_input(question)
+        while True:
+            input_choice = input(WHITE + question).lower()
+            if input_choice in ('y', 'n'):
+                return input_choice
+            print(RED+"Error: Please answer either 'y' for 'yes' or 'n' for 'no'.")
 
 
-    def source_create_url_input(self, messege) -> str:
+    def source_create_url_input(self, messege) -> str: #pylint: disable=no-self-use
         '''Validates url input for source creation.'''
-        input_text = input(WHITE+f"\n{messege}: ")
-        if checkers.is_url(input_text) is False:
+        while True:
+            input_text = input(WHITE+f"\n{messege}: ")
+            if validation.is_valid_url(input_text):
+                return input_text # returns entered string if all validation rules are met
             print(RED + "Error: Entered data is invalid. Please check and try again.")
-            return self.source_create_url_input(messege)
-        return input_text # returns entered string if all validation rules are met
 
 
-    def source_create_string_input(self, messege) -> str:
+    def source_create_string_input(self, messege) -> str: #pylint: disable=no-self-use
         '''Validates string user input for source creation.'''
         min_len = 5
-        input_text = input(WHITE+f"\n{messege}: ")
-        if len(input_text) < min_len: # checks the length of the entered text
+        while True:
+            input_text = input(WHITE+f"\n{messege}: ")
+            if len(input_text) >= min_len: # checks the length of the entered text
+                return input_text # returns entered string if all validation rules are met
             print(RED + "Error: Entered data is invalid. Please check and try again.")
-            return self.source_create_string_input(messege)
-        return input_text # returns entered string if all validation rules are met
 
 
-    def search_string_input(self, messege) -> str:
+    def search_string_input(self, messege) -> str: #pylint: disable=no-self-use
         '''Validates string user input search term.'''
         min_len = 3
-        input_text = input(WHITE + f"\n{messege}: ")
-        if len(input_text) < min_len: # checks the length of the entered text
+        while True:
+            input_text = input(WHITE + f"\n{messege}: ")
+            if len(input_text) >= min_len: # checks the length of the entered text
+                return input_text # returns entered string if all validation rules are met
             print(RED + "Error: Search term should be more than or equal to three characters.")
-            return self.search_string_input(messege)
-        return input_text # returns entered string if all validation rules are met
 
 
-    def source_id_input(self) -> int:
-        '''Validates User Input for Source Id.'''
-        user_input = input(WHITE + "\nSelect Id: ")
-        try:
-            int_input = int(user_input)
-        except ValueError:
-            print(RED + "Error: Invalid id. Please check your input and try again.")
-            return self.source_id_input()
-        return int_input
+    def source_id_input(self, has_previous=False, has_next=False): #pylint: disable=no-self-use
+        '''
+        Validates User Input for Source Id. Returns the id as an Integer.
+        If has_previous/has_next is set, also accepts 'p'/'n' to page through the search results
+        and returns the entered letter.
+        '''
+        while True:
+            user_input = input(WHITE + "\nSelect Id: ").lower()
+            if (user_input == 'p' and has_previous) or (user_input == 'n' and has_next):
+                return user_input
+            try:
+                return int(user_input)
+            except ValueError:
+                print(RED + "Error: Invalid id. Please check your input and try again.")
+
+
+    def optional_id_input(self, messege) -> int: #pylint: disable=no-self-use
+        '''Validates an optional id input (e.g. audit filters). Returns the id or None if empty.'''
+        while True:
+            user_input = input(WHITE + f"\n{messege} (empty = all): ").strip()
+            if not user_input:
+                return None
+            try:
+                return int(user_input)
+            except ValueError:
+                print(RED + "Error: Invalid id. Please check your input and try again.")
+
+
+    def optional_date_input(self, messege): #pylint: disable=no-self-use
+        '''Validates an optional date input (YYYY-MM-DD). Returns the date or None if empty.'''
+        while True:
+            user_input = input(WHITE + f"\n{messege} (Format YYYY-MM-DD, empty = no limit): ")
+            if not user_input.strip():
+                return None
+            try:
+                return datetime.strptime(user_input.strip(), '%Y-%m-%d').date()
+            except ValueError:
+                print(RED + "Error: Entered date is invalid. Please check and try again.")
 
 
     def map_input_field(self, input_field:int) -> str: #pylint: disable=no-self-use
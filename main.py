@@ -1,6 +1,14 @@
-"""Main module to execute the Suspect Sources CLI."""
+"""
+Main module to execute the Suspect Sources CLI.
+Without arguments, the interactive interface is started. With arguments, a single command
+is run non-interactively (see commands.py), e.g. python main.py search --field url --term x --json
+"""
 
+import sys
+import commands
 import interface
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(commands.main(sys.argv[1:]))
     main_cli = interface.Interface()
@@ -0,0 +1,272 @@
+"""
+Module providing the in-process metrics of the System: latency histograms and counters of the
+hot paths (database connections and statements, password hashing, email sends, event log writes).
+The metrics are rendered in the Prometheus text format. Long-running processes expose them via
+the API (GET /metrics), and every process dumps them periodically to METRICS_DUMP_FILE, e.g. for
+the textfile collector of the Prometheus node exporter. A process removes its dump file when it
+exits, and the files of processes that ended without doing so (e.g. killed) are removed by the
+next process that starts dumping, so the directory only holds the metrics of running processes.
+
+Example:
+    QUERY_SECONDS = metrics.histogram('sss_query_seconds', 'Duration of queries')
+    with QUERY_SECONDS.time(db='data'):
+        cursor.execute(...)
+    @QUERY_SECONDS.timed(db='data')
+    def run_query(): ...
+"""
+
+import atexit
+import bisect
+import functools
+import glob
+import os
+import re
+import sys
+import threading
+import time
+import settings
+
+# Upper bounds of the histogram buckets in seconds, from sub-millisecond queries to slow SMTP
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+_metrics = {} # name -> Histogram or Counter, in registration order
+_registry_lock = threading.Lock()
+_dumper = None # thread of the periodic dump, started with the first recorded value
+_dump_lock = threading.Lock() # serialises the dumps with the removal of the file at exit
+_dump_stop = threading.Event()
+
+
+def _label_key(labels:dict) -> tuple:
+    '''Returns the labels as a hashable, sorted tuple.'''
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value) -> str:
+    '''Escapes a label value for the text format.'''
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key:tuple, extra:tuple=()) -> str:
+    '''Formats label pairs as {name="value",...}, or an empty string without labels.'''
+    pairs = [f'{name}="{_escape(value)}"' for name, value in key + extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Timer:
+    """Context manager that observes its duration in a histogram on exit."""
+
+    def __init__(self, histogram, labels:dict):
+        self.histogram = histogram
+        self.labels = labels
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Histogram:
+    """Thread-safe latency histogram with one series per combination of label values."""
+
+    kind = 'histogram'
+
+    def __init__(self, name:str, help_text:str, buckets:tuple=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._series = {} # label key -> [count per bucket..., count above all buckets, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, seconds:float, **labels):
+        '''Records a duration in seconds.'''
+        if not settings.METRICS_ENABLED:
+            return
+        index = bisect.bisect_left(self.buckets, seconds) # first bucket with seconds <= bound
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += seconds
+        _start_dumper()
+
+    def time(self, **labels) -> Timer:
+        '''Returns a context manager that records the duration of its block.'''
+        return Timer(self, labels)
+
+    def timed(self, **labels):
+        '''Decorator that records the duration of each call of the function.'''
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with Timer(self, labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def render(self) -> list:
+        '''Returns the lines of the histogram in the Prometheus text format.'''
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        lines = []
+        for key, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), values[:-1]):
+                cumulative += count
+                labels = _format_labels(key, (('le', '+Inf' if bound == float('inf') else bound),))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(key)} {values[-1]}')
+            lines.append(f'{self.name}_count{_format_labels(key)} {cumulative}')
+        return lines
+
+
+class Counter:
+    """Thread-safe counter with one series per combination of label values."""
+
+    kind = 'counter'
+
+    def __init__(self, name:str, help_text:str):
+        self.name = name
+        self.help_text = help_text
+        self._series = {} # label key -> count
+        self._lock = threading.Lock()
+
+    def inc(self, amount:float=1, **labels):
+        '''Increases the counter of the labels.'''
+        if not settings.METRICS_ENABLED:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+        _start_dumper()
+
+    def render(self) -> list:
+        '''Returns the lines of the counter in the Prometheus text format.'''
+        with self._lock:
+            series = dict(self._series)
+        return [f'{self.name}{_format_labels(key)} {value}'
+                for key, value in sorted(series.items())]
+
+
+def _register(metric_type, name:str, *args):
+    '''Returns the metric of the name, registering it on first use.'''
+    with _registry_lock:
+        metric = _metrics.get(name)
+        if metric is None:
+            metric = _metrics[name] = metric_type(name, *args)
+        return metric
+
+
+def histogram(name:str, help_text:str, buckets:tuple=DEFAULT_BUCKETS) -> Histogram:
+    '''Returns the histogram of the name (seconds), registering it on first use.'''
+    return _register(Histogram, name, help_text, buckets)
+
+
+def counter(name:str, help_text:str) -> Counter:
+    '''Returns the counter of the name (ending in _total), registering it on first use.'''
+    return _register(Counter, name, help_text)
+
+
+def render() -> str:
+    '''Returns all metrics in the Prometheus text format (version 0.0.4).'''
+    with _registry_lock:
+        metrics = list(_metrics.values())
+    lines = []
+    for metric in metrics:
+        lines.append(f'# HELP {metric.name} {metric.help_text}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def dump_path() -> str:
+    '''Returns the dump file of this process (METRICS_DUMP_FILE with program name and pid).'''
+    program = os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0] or 'python'
+    return settings.METRICS_DUMP_FILE.format(program=program, pid=os.getpid())
+
+
+def dump(path:str=None) -> str:
+    '''Writes all metrics to the file atomically (write and rename). Returns the path.'''
+    path = path or dump_path()
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary = f"{path}.tmp"
+    with open(temporary, 'w') as file:
+        file.write(render())
+    os.replace(temporary, path)
+    return path
+
+
+def _dump_loop():
+    '''Dump thread loop, writes the metrics every METRICS_DUMP_INTERVAL seconds until exit.'''
+    while not _dump_stop.wait(settings.METRICS_DUMP_INTERVAL):
+        with _dump_lock:
+            if _dump_stop.is_set():
+                break
+            try:
+                dump()
+            except OSError:
+                pass # retried with the next interval
+
+
+def pid_alive(pid:int) -> bool:
+    '''Returns True if a process with the pid exists.'''
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError: # e.g. a process of another user
+        return True
+    return True
+
+
+def remove_stale_dumps() -> int:
+    '''
+    Removes the dump files of processes that no longer run (e.g. killed before they could
+    remove their own file). Returns the number of files removed.
+    '''
+    template = settings.METRICS_DUMP_FILE
+    pattern = re.escape(os.path.basename(template)).replace(
+        re.escape('{program}'), '.+').replace(re.escape('{pid}'), r'(?P<pid>\d+)')
+    removed = 0
+    for path in glob.glob(template.format(program='*', pid='*')):
+        match = re.fullmatch(pattern, os.path.basename(path))
+        if match is None or pid_alive(int(match.group('pid'))):
+            continue
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def _start_dumper():
+    '''Starts the periodic dump (and the dump at exit) once a value has been recorded.'''
+    global _dumper #pylint: disable=global-statement
+    if _dumper is not None or settings.METRICS_DUMP_INTERVAL <= 0:
+        return
+    with _registry_lock:
+        if _dumper is not None:
+            return
+        _dumper = threading.Thread(target=_dump_loop, name='metrics-dump', daemon=True)
+        _dumper.start()
+    atexit.register(_remove_dump_at_exit)
+    remove_stale_dumps()
+
+
+def _remove_dump_at_exit():
+    '''Stops the periodic dump and removes the dump file of this process when it exits.'''
+    _dump_stop.set()
+    with _dump_lock:
+        try:
+            os.remove(dump_path())
+        except OSError:
+            pass
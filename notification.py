@@ -1,23 +1,136 @@
 """Module to handle notification actions for New Users, Password Changes and Source Additions."""
 
+import functools
+import html
 import smtplib
 from email.mime.text import MIMEText
-from cryptography.fernet import Fernet
 import dbconnection as dbc
+import metrics
+import settings
 
 RED = '\033[91m' # Erorr Messages
 GREEN = '\033[92m' # Success Messages
 
+SMTP_CONNECT_SECONDS = metrics.histogram(
+    'sss_smtp_connect_seconds', 'Duration of opening an SMTP session (incl. STARTTLS and login)'
+)
+EMAIL_SEND_SECONDS = metrics.histogram('sss_email_send_seconds', 'Duration of sending an email')
+EMAILS = metrics.counter('sss_emails_total', 'Emails by result (sent, refused, failed)')
+
 OUTBND_EMAIL =  'suspect.sources@gmail.com'
 OUTBND_ENC_PSWD = b'gAAAAABgbavwJiy3quTfBs44koynkhs5sNYVETrSeh-aTlFl3HH8LSMvtC0-09fkvqdyTgJJ6DCbmD3nr4R6V5E7VSmtbwh8GVqTqVRU1S4LoJjM0rSPuyo='
 
-with open('config/email_body.html','r') as file:
-    HTML_BODY = file.readline()
 
-retrieved_key = dbc.retrieve_key()
-cipher = Fernet(retrieved_key)
-OUTBND_PSWD = cipher.decrypt(OUTBND_ENC_PSWD)
-OUTBND_PSWD = OUTBND_PSWD.decode('utf-8')
+@functools.lru_cache(maxsize=None)
+def html_body() -> str:
+    '''Loads the HTML email template from the config folder on first use and caches it.'''
+    with open('config/email_body.html','r') as file:
+        return file.readline()
+
+
+@functools.lru_cache(maxsize=None)
+def outbound_password() -> str:
+    '''Decrypts the password of the outbound email account on first use and caches it.'''
+    return dbc.cipher().decrypt(OUTBND_ENC_PSWD).decode('utf-8')
+
+
+class SMTPTransport:
+    """
+    Keeps one authenticated SMTP session open and sends consecutive emails over it.
+    If the session breaks while sending, it reconnects once and retries the email.
+    Can be used as a context manager that closes the session on exit.
+    """
+
+    def __init__( #pylint: disable=too-many-arguments
+        self,
+        host:str=settings.SMTP_HOST,
+        port:int=settings.SMTP_PORT,
+        starttls:bool=settings.SMTP_STARTTLS,
+        login:bool=settings.SMTP_LOGIN,
+        timeout:float=settings.SMTP_TIMEOUT
+    ):
+        self.host = host
+        self.port = port
+        self.starttls = starttls
+        self.login = login
+        self.timeout = timeout
+        self._server = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def connect(self):
+        '''Opens the SMTP session (incl. STARTTLS and login) unless one is open already.'''
+        if self._server is not None:
+            return
+        with SMTP_CONNECT_SECONDS.time():
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            try:
+                if self.starttls:
+                    server.starttls()
+                if self.login:
+                    server.login(user=OUTBND_EMAIL, password=outbound_password())
+            except (smtplib.SMTPException, OSError):
+                server.close()
+                raise
+        self._server = server
+
+    def close(self):
+        '''Ends the SMTP session if one is open.'''
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except (smtplib.SMTPException, OSError):
+            self._server.close()
+        self._server = None
+
+    def send(self, recipient:str, message:MIMEText) -> bool:
+        '''
+        Sends the message to the recipient over the open session (connecting if needed).
+        Reconnects and retries once if the session fails. Returns True if the email was sent.
+        '''
+        with EMAIL_SEND_SECONDS.time():
+            result = self._send(recipient, message)
+        EMAILS.inc(result=result)
+        return result == 'sent'
+
+    def _send(self, recipient:str, message:MIMEText) -> str:
+        '''Sends the message, returns the result: 'sent', 'refused' or 'failed'.'''
+        for _ in range(2): # first attempt plus one retry on a fresh session
+            try:
+                self.connect()
+                self._server.sendmail(OUTBND_EMAIL, recipient, message.as_string())
+            except smtplib.SMTPRecipientsRefused:
+                return 'refused' # the address was rejected, a new session will not change that
+            except (smtplib.SMTPException, OSError):
+                self.close() # drop the broken session, the next attempt reconnects
+                continue
+            return 'sent'
+        return 'failed'
+
+    def send_bulk(self, messages:list) -> dict:
+        '''
+        Sends a list of (recipient, message) pairs over the same session.
+        Returns a dict with the success (True/False) of each recipient.
+        '''
+        results = {}
+        for recipient, message in messages:
+            results[recipient] = self.send(recipient, message)
+        return results
+
+
+def build_email(recipient:str, subject:str, content:str) -> MIMEText:
+    '''Wraps the HTML content into the email template and returns the message.'''
+    my_email = MIMEText(html_body().replace('{CONTENT}', content), "html")
+    my_email["From"] = OUTBND_EMAIL
+    my_email["To"] = recipient
+    my_email["Subject"] = subject
+    return my_email
+
 
 def registration_email(firstname:str, email:str, username:str, password:str) -> bool:
     '''
@@ -25,6 +138,15 @@ def registration_email(firstname:str, email:str, username:str, password:str) ->
     Takes as input the firstname, email and autogenerated password.
     Sends a notification to the given email containing the password for the created user.
     '''
+    with SMTPTransport() as transport:
+        return transport.send(email, registration_message(firstname, email, username, password))
+
+
+def registration_message(firstname:str, email:str, username:str, password:str) -> MIMEText:
+    '''
+    Builds the registration email for a new system user without sending it.
+    Used by registration_email and the bulk registration to send over one SMTP session.
+    '''
     subject = f'Welcome to the NCSC Suspect Sources System, {firstname}!'
     email_body = f"""
                 <p><strong>Welcome, {firstname}</strong>!</p>
@@ -35,23 +157,12 @@ def registration_email(firstname:str, email:str, username:str, password:str) ->
                 This is done to enhance the security of your account.<br />
                 Please don't hesitate to contact a system administrator or the technical support team should you run into any difficulties.</p>
                 """
-    my_email = MIMEText(HTML_BODY.replace('{CONTENT}', email_body), "html")
-    my_email["From"] = OUTBND_EMAIL
-    my_email["To"] = email
-    my_email["Subject"] = subject
-    try:
-        server = smtplib.SMTP("smtp.gmail.com")
-        server.starttls()
-        server.login(user=OUTBND_EMAIL, password=OUTBND_PSWD)
-        server.sendmail(OUTBND_EMAIL, email, my_email.as_string())
-    except smtplib.SMTPException:
-        return False
-    return True
+    return build_email(email, subject, email_body)
 
 
 def new_source_email(
     recipient_list:list, source_id:id, source_name:str, source_url:str, source_threat_level:int
-) -> bool:
+) -> dict:
     '''
     Function to trigger the notification when a new suspect source has been added to the system.
     Takes as input a list of tuples containing the email:firstname pair
@@ -60,6 +171,8 @@ def new_source_email(
     Sends a notification to all emails in the tuple with details of the newly added suspect source.
     Please note recipient_list structure should be:
     [('email1@email.com', 'firstname1'), ('email2@email.com', 'firstname2')]
+    All emails are sent over one SMTP session. A failed recipient does not stop the others.
+    Returns a dict with the success (True/False) of each recipient email.
     '''
     subject = f'New Suspect Source has been added: {source_name}'
     email_body = f"""
@@ -73,23 +186,58 @@ def new_source_email(
                 <p>Please log into the system and search for the threat id to obtain a full description of the newly added suspect source.</p>
                 <p>Please don't hesitate to contact a system administrator or the technical support team should you run into any difficulties.</p>
                 """
+    return send_to_recipients(recipient_list, subject, email_body)
+
+
+def new_sources_digest_email(recipient_list:list, total:int, sources:list) -> dict:
+    '''
+    Function to trigger one digest notification for a bulk ingestion of suspect sources,
+    instead of one email per source. Takes as input the email:firstname pairs of all
+    Authority users (see new_source_email), the total number of added sources and a list of
+    (id, name, url, threat level) tuples of the sources to list in the email.
+    Returns a dict with the success (True/False) of each recipient email.
+    '''
+    subject = f'{total} New Suspect Sources have been added'
+    rows = ''.join(
+        f"<tr><td>{source_id}</td><td>{html.escape(name)}</td><td>{html.escape(url)}</td>"
+        f"<td>{threat_level}</td></tr>"
+        for source_id, name, url, threat_level in sources
+    ) # feed content is escaped as it does not come from a system user
+    more = ''
+    if total > len(sources):
+        more = f"<p>... and {total - len(sources)} further sources.</p>"
+    email_body = f"""
+                <p><strong>Dear&nbsp;FIRSTNAME,</strong></p>
+                <p>This email serves as a notification that {total} new suspect sources have been added to the NCSC Suspect Sources System from a threat feed.</p>
+                <p>Overview of the added sources:</p>
+                <table><tr><th>Source ID</th><th>Source Name</th><th>Source URL</th><th>Source Threat Level</th></tr>{rows}</table>
+                {more}
+                <p>Please log into the system and search for the threat ids to obtain a full description of the newly added suspect sources.</p>
+                <p>Please don't hesitate to contact a system administrator or the technical support team should you run into any difficulties.</p>
+                """
+    return send_to_recipients(recipient_list, subject, email_body)
+
+
+def send_to_recipients(recipient_list:list, subject:str, email_body:str) -> dict:
+    '''
+    Sends the email body to all email:firstname pairs of the list over one SMTP session.
+    The placeholder FIRSTNAME in the body is replaced by the first name of each recipient.
+    Returns a dict with the success (True/False) of each recipient email.
+    '''
+    messages = []
     for item in recipient_list:
         email = item[0]
         first_name = item[1]
         content = email_body.replace('FIRSTNAME', first_name)
-        my_email = MIMEText(HTML_BODY.replace('{CONTENT}', content), "html")
-        my_email["From"] = OUTBND_EMAIL
-        my_email["To"] = email
-        my_email["Subject"] = subject
-        try:
-            server = smtplib.SMTP("smtp.gmail.com")
-            server.starttls()
-            server.login(user=OUTBND_EMAIL, password=OUTBND_PSWD)
-            server.sendmail(OUTBND_EMAIL, email, my_email.as_string())
-        except smtplib.SMTPException:
-            return False
-        print(GREEN + f"Sent Notification successfully to: {first_name} at {email}") # Debug Line to check email sends
-    return True
+        messages.append((email, build_email(email, subject, content)))
+    with SMTPTransport() as transport: # one SMTP session for all recipients
+        results = transport.send_bulk(messages)
+    for email, sent in results.items():
+        if sent:
+            print(GREEN + f"Sent Notification successfully to: {email}") # Debug Line to check email sends
+        else:
+            print(RED + f"Notification could not be sent to: {email}")
+    return results
 
 
 def changed_password_email(firstname:str, email:str) -> bool:
@@ -104,15 +252,5 @@ def changed_password_email(firstname:str, email:str) -> bool:
                  You are now able to log in with your username and newly set password.</p>
                 <p>If you did not action this change, please contact the NCSC Administrator Team immediately. In this case, your account might be comprised.</p>
                 """
-    my_email = MIMEText(HTML_BODY.replace('{CONTENT}', email_body), "html")
-    my_email["From"] = OUTBND_EMAIL
-    my_email["To"] = email
-    my_email["Subject"] = subject
-    try:
-        server = smtplib.SMTP("smtp.gmail.com")
-        server.starttls()
-        server.login(user=OUTBND_EMAIL, password=OUTBND_PSWD)
-        server.sendmail(OUTBND_EMAIL, email, my_email.as_string())
-    except smtplib.SMTPException:
-        return False
-    return True
+    with SMTPTransport() as transport:
+        return transport.send(email, build_email(email, subject, email_body))
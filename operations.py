@@ -1,48 +1,154 @@
 """Module to execute user operations for Specialist and Authority Role."""
 
+import csv
 from datetime import datetime
+import io
+import re
 import psycopg2
 from psycopg2 import sql
 import dbconnection as dbc
 import eventlog as log
-import notification
+import outbox
 import admin_operations as adops
+import cache
+import sessions
+import settings
 
+RED = '\033[91m' # Erorr Messages
+YELLOW = '\033[93m' # Notices to User
 
-def search_for_source(attribute:str, value:str) -> list:
+# Weight labels of the columns in the full-text search vector (see Data_search_index.sql)
+FULL_TEXT_WEIGHTS = {'name':'A', 'description':'B'}
+
+_full_text_missing = False # set once a database without the search_vector column is found
+
+# Read-through cache of get_source_by_id, invalidated by create_new_source and modify_source
+source_cache = cache.LRUCache(settings.SOURCE_CACHE_SIZE, settings.SOURCE_CACHE_TTL)
+
+
+def search_for_source( #pylint: disable=too-many-arguments
+    attribute:str, value:str, mode:str=settings.SEARCH_MODE,
+    after_id:int=None, before_id:int=None, limit:int=None
+):
     '''
     Function to query a specific search on the sources table.
     Two arguments are being passed: attribute and value.
     The attribute indicates the column to search for (e.g. by ID or by Name).
     The value indicates the value to search for within the column.
     Example: search_for_source('name', 'Google') -> would search for 'Google' in the 'name' column
-    The return value contains all results from the query (i.e. the 'fetchall()' result)
+    The mode selects how name and description are searched: 'like' does a case-insensitive
+    substring match (served by the trigram indexes of Data_search_index.sql if present),
+    'fulltext' matches the words of the value as word prefixes using the full-text index.
+    If the database lacks the full-text column, 'fulltext' falls back to 'like'.
+    Urls are always matched as substring.
+    Keyset pagination: after_id only returns sources with a greater id (ascending order),
+    before_id only sources with a smaller id (descending order), limit caps the number of rows.
+    Returns a generator yielding the results as (id, name) tuples. The rows are streamed
+    from a server-side cursor, which holds a pooled connection until the generator is
+    exhausted or closed.
+    '''
+    global _full_text_missing #pylint: disable=global-statement
+    if _full_text_missing:
+        mode = 'like'
+    with dbc.connection('data') as conn:
+        try:
+            cursor = open_search_cursor(
+                conn, search_condition(attribute, value, mode), after_id, before_id, limit
+            )
+        except psycopg2.errors.UndefinedColumn: #pylint: disable=no-member
+            if mode != 'fulltext':
+                raise
+            conn.rollback()
+            _full_text_missing = True
+            print(YELLOW + "Full-text search is not set up (see Data_search_index.sql), "
+                  "searching by substring instead.")
+            cursor = open_search_cursor(
+                conn, search_condition(attribute, value, 'like'), after_id, before_id, limit
+            )
+        with cursor:
+            for item in cursor:
+                yield (item[0], item[1])
+
+
+def open_search_cursor( #pylint: disable=too-many-arguments
+    conn, condition:sql.Composed, after_id:int=None, before_id:int=None, limit:int=None
+):
+    '''
+    Runs a source search with the given WHERE condition and keyset pagination (see
+    search_for_source) on a server-side cursor of the connection. Returns the cursor.
+    '''
+    keyset = sql.SQL('')
+    direction = sql.SQL('ASC')
+    if after_id is not None:
+        keyset = sql.SQL(" AND id > {}").format(sql.Literal(after_id))
+    elif before_id is not None:
+        keyset = sql.SQL(" AND id < {}").format(sql.Literal(before_id))
+        direction = sql.SQL('DESC')
+    limit_clause = sql.SQL('')
+    if limit is not None:
+        limit_clause = sql.SQL(" LIMIT {}").format(sql.Literal(limit))
+    stmt = sql.SQL(
+        "SELECT id, name FROM sources WHERE {condition}{keyset} ORDER BY id {direction}{limit}"
+    ).format(condition=condition, keyset=keyset, direction=direction, limit=limit_clause)
+    cursor = conn.cursor(name='source_search') # server-side (named) cursor
+    cursor.itersize = settings.SEARCH_PAGE_SIZE
+    cursor.execute(stmt)
+    return cursor
+
+
+def search_page( #pylint: disable=too-many-arguments
+    attribute:str, value:str, page_size:int=settings.SEARCH_PAGE_SIZE,
+    after_id:int=None, before_id:int=None, mode:str=settings.SEARCH_MODE
+) -> tuple:
+    '''
+    Function to fetch one page of a source search, ordered by id.
+    Without cursor, returns the first page. With after_id, returns the page following that id
+    (next page), with before_id the page preceding that id (previous page).
+    Returns a tuple: (list of (id, name) tuples, has previous page, has next page)
+    '''
+    rows = list(search_for_source(
+        attribute, value, mode=mode, after_id=after_id, before_id=before_id, limit=page_size+1
+    )) # one extra row tells whether there is another page in the same direction
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if before_id is not None:
+        rows.reverse()
+        return (rows, has_more, True)
+    return (rows, after_id is not None, has_more)
+
+
+def search_condition(attribute:str, value:str, mode:str=settings.SEARCH_MODE) -> sql.Composed:
+    '''
+    Builds the WHERE condition of a source search for the given attribute, value and mode.
+    See search_for_source for the matching rules.
     '''
-    cursor = dbc.establish_connection('data').cursor()
     if attribute == "threat_level":
         value = int(value)
-        stmt=sql.SQL(
-        "SELECT id, name FROM sources WHERE {attribute} = {value} order by id"
-        ).format(
+        return sql.SQL("{attribute} = {value}").format(
             attribute = sql.Identifier(attribute.lower()),
             value = sql.Literal(value),
         )
-    else:
-        value = value.lower()
-        value = '%'+value+'%'
-        stmt=sql.SQL(
-        "SELECT id, name FROM sources WHERE lower({attribute}) like {value} order by id"
-        ).format(
-            attribute = sql.Identifier(attribute.lower()),
-            value = sql.Literal(value),
+    if mode == 'fulltext' and attribute in FULL_TEXT_WEIGHTS and prefix_tsquery(value, ''):
+        return sql.SQL("search_vector @@ to_tsquery('simple', {query})").format(
+            query = sql.Literal(prefix_tsquery(value, FULL_TEXT_WEIGHTS[attribute])),
         )
+    value = value.lower()
+    value = '%'+value+'%'
+    return sql.SQL("lower({attribute}) like {value}").format(
+        attribute = sql.Identifier(attribute.lower()),
+        value = sql.Literal(value),
+    )
 
-    cursor.execute(stmt)
-    result = cursor.fetchall()
-    output = []
-    for item in result:
-        output.append((item[0], item[1]))
-    return output
+
+def prefix_tsquery(value:str, weight:str) -> str:
+    '''
+    Turns a search term into a full-text query matching all of its words as prefixes.
+    The weight restricts matches to the name (A) or description (B) part of the search vector.
+    Example: prefix_tsquery('sql inj', 'A') -> 'sql:*A & inj:*A'
+    Returns an empty string if the term contains no searchable words.
+    '''
+    words = re.findall(r'[^\W_]+', value.lower()) # only letters and digits reach the tsquery
+    return ' & '.join(word + ':*' + weight for word in words)
 
 def get_source_by_id(source_id:int) -> list:
     '''
@@ -50,19 +156,74 @@ def get_source_by_id(source_id:int) -> list:
     Used in the search operation of the interface module.
     Takes as argument the source id and returns a tuple:
     (id, name, url, threat level, description, creation date, modified date)
+    Sources are served from the in-process source_cache if they have been read recently.
     '''
-    cursor = dbc.establish_connection('data').cursor()
+    cached = source_cache.get(source_id)
+    if cached is not cache.MISSING:
+        return cached
+    generation = source_cache.generation() # a modification during the read voids the result
     psql = """
           SELECT id, name, url, threat_level, description, creation_date, modified_date 
           FROM sources WHERE id = %(value)s
           """
     val = {'value': source_id}
-    try:
-        cursor.execute(psql, val)
-        result = cursor.fetchall()[0]
-    except IndexError:
-        return None
-    return (result[0], result[1], result[2], result[3], result[4], result[5], result[6])
+    with dbc.connection('data') as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(psql, val)
+            result = cursor.fetchall()[0]
+        except IndexError:
+            return None
+    source = (result[0], result[1], result[2], result[3], result[4], result[5], result[6])
+    source_cache.put(source_id, source, generation)
+    return source
+
+
+def lookup_urls(urls:list) -> list:
+    '''
+    Function to look up many urls at once by exact match (e.g. for SIEM enrichment),
+    served by the url index of Data_url_index.sql.
+    Returns a list of (id, name, url, threat level) tuples of the matching sources,
+    or None if the query failed.
+    '''
+    psql = "SELECT id, name, url, threat_level FROM sources WHERE url = ANY(%(urls)s) ORDER BY id"
+    with dbc.connection('data') as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(psql, {'urls':list(urls)})
+            result = cursor.fetchall()
+        except psycopg2.Error as error:
+            print(RED + 'Issue with looking up the urls. Error:', error)
+            return None
+    return result
+
+
+def get_source_stats(group_by:str='threat_level') -> list:
+    '''
+    Function to return the number of sources from the source_stats summary table,
+    which is kept up to date by triggers on the sources table (Data_source_stats.sql).
+    Group_by can be 'threat_level', 'creation_month' or 'both'.
+    Returns a list of tuples: (threat level and/or creation month, number of sources),
+    ordered by the grouping columns, or None if the query failed.
+    '''
+    columns = {
+        'threat_level': ('threat_level',),
+        'creation_month': ('creation_month',),
+        'both': ('threat_level', 'creation_month'),
+    }[group_by]
+    psql = sql.SQL(
+        "SELECT {columns}, sum(sources) FROM source_stats "
+        "GROUP BY {columns} HAVING sum(sources) > 0 ORDER BY {columns}"
+    ).format(columns=sql.SQL(', ').join(map(sql.Identifier, columns)))
+    with dbc.connection('data') as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(psql)
+            result = cursor.fetchall()
+        except psycopg2.Error as error:
+            print(RED + 'Issue with reading the source statistics. Error:', error)
+            return None
+    return [row[:-1] + (int(row[-1]),) for row in result] # sum() returns a Decimal
 
 
 def create_new_source(name:str, url:str, threat_level:int, description:str, uid:int) -> bool:
@@ -70,10 +231,10 @@ def create_new_source(name:str, url:str, threat_level:int, description:str, uid:
     Function to create a new entry in the sources database table.
     Takes as input the name of the source, the url, the threat level and the description.
     Returns bool True/False depending on whether the creation was successful.
-    If successful, triggers email notification to all users with role=3 (External Authority).
+    If successful, queues an email notification to all users with role=3 (External Authority)
+    in the outbox, which is delivered by the outbox worker process. If the notification cannot
+    be queued (e.g. disk full), the source stays created: a warning is shown and logged.
     '''
-    conn = dbc.establish_connection('data')
-    cursor = conn.cursor()
     psql = """
           INSERT INTO sources (name, url, threat_level, description, creation_date, modified_date)
           VALUES (%(name)s,%(url)s,%(threat_level)s,%(description)s,%(creation_date)s,%(modified_date)s) 
@@ -87,17 +248,83 @@ def create_new_source(name:str, url:str, threat_level:int, description:str, uid:
         'creation_date':datetime.now(),
         'modified_date':datetime.now()
         }
+    with dbc.connection('data') as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(psql, val)
+            source_id = cursor.fetchone()[0] # retrieving the id of the newly created source
+            conn.commit()
+        except psycopg2.OperationalError:
+            return False
+    source_cache.invalidate(source_id)
+    recipients = adops.fetch_all_authorities() # fetching list of authority users
+    log.operation_log("Create Source", uid, source_id) # log source creation event
     try:
-        cursor.execute(psql, val)
-        conn.commit()
-    except psycopg2.OperationalError:
-        return False
-    else:
-        recipients = adops.fetch_all_authorities() # fetching list of authority users
-        source_id = cursor.fetchone()[0] # retrieving the id of the newly created source
-        log.operation_log("Create Source", uid, source_id) # log source creation event
-        notification.new_source_email(recipients, source_id, name, url, threat_level) # notification
-        return True
+        outbox.enqueue(
+            'new_source', recipients=recipients, source_id=source_id, name=name, url=url,
+            threat_level=threat_level
+        ) # notification is delivered by the outbox worker
+    except OSError as error:
+        print(YELLOW + "The source was created, but its notification could not be queued. Error:",
+              error)
+        log.operation_log("Notification Not Queued", uid, source_id, new_val=str(error))
+    return True
+
+
+# Advisory lock key that serialises the bulk inserts of sources, so that concurrent ingestions
+# cannot both insert a url that does not exist yet (the url index is not unique)
+SOURCES_BULK_LOCK = 5_390_001
+
+
+def create_sources_bulk(sources:list, uid:int) -> list:
+    '''
+    Function to create many sources at once, e.g. from a threat feed.
+    Takes a list of validated (name, url, threat level, description) tuples and the user id.
+    The rows are loaded via COPY into a temporary table and inserted into the sources table in
+    one transaction. Sources whose url exists already (or repeats within the list) are skipped.
+    The transaction holds an advisory lock, so the chunks of concurrent ingestions are inserted
+    one after the other and each sees the urls the others have created.
+    Logs one 'Create Source' event per created source; no notification is sent, this is left
+    to the caller (see ingestion.py).
+    Returns a list of (id, name, url, threat level) tuples of the created sources,
+    or None if the transaction failed.
+    '''
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(sources)
+    buffer.seek(0)
+    now = datetime.now()
+    psql = """
+          INSERT INTO sources (name, url, threat_level, description, creation_date, modified_date)
+          SELECT DISTINCT ON (url) name, url, threat_level, description, %(now)s, %(now)s
+          FROM source_feed feed
+          WHERE NOT EXISTS (SELECT 1 FROM sources WHERE sources.url = feed.url)
+          ORDER BY url
+          RETURNING id, name, url, threat_level;
+          """
+    with dbc.connection('data') as conn:
+        cursor = conn.cursor()
+        try:
+            # held until commit; taken before the INSERT so its snapshot includes earlier chunks
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (SOURCES_BULK_LOCK,))
+            cursor.execute("""
+                CREATE TEMPORARY TABLE source_feed (
+                    name VARCHAR(255), url VARCHAR(255), threat_level INT, description VARCHAR(500)
+                ) ON COMMIT DROP
+                """)
+            cursor.copy_expert(
+                "COPY source_feed (name, url, threat_level, description) FROM STDIN WITH CSV",
+                buffer
+            )
+            cursor.execute(psql, {'now':now})
+            created = sorted(cursor.fetchall())
+            conn.commit()
+        except (psycopg2.OperationalError, psycopg2.DataError) as error:
+            print(RED + 'Issue with creating the sources on database. Error:', error)
+            return None
+    for source in created:
+        source_cache.invalidate(source[0])
+        log.operation_log("Create Source", uid, source[0]) # queued and written in batches
+    return created
 
 
 def modify_source(source_id:int, attribute:str, new_value:str, uid:int) -> bool:
@@ -108,32 +335,37 @@ def modify_source(source_id:int, attribute:str, new_value:str, uid:int) -> bool:
     Example: modify_source(1, 'name', 'Google') -> Changes the 'name' of the source id=1 to 'Google'
     Returns bool True/False depending on whether the modification was successful.
     '''
-    conn = dbc.establish_connection('data')
-    cursor = conn.cursor()
-
-    stmt = sql.SQL("SELECT {attribute} FROM sources WHERE id = {sid}").format(
-            attribute = sql.Identifier(attribute),
-            sid = sql.Literal(source_id),
-    )
-    cursor.execute(stmt)
-    curr_val = cursor.fetchall()[0][0]
-
     if attribute == 'threat_level':
         new_value = int(new_value) # change new value to int type if Threat Level is being changed
 
-    stmt = sql.SQL(
-        "UPDATE sources SET {attribute}={value}, modified_date={dtnow} WHERE id = {sid}"
-    ).format(
-            attribute = sql.Identifier(attribute),
-            sid = sql.Literal(source_id),
-            value = sql.Literal(new_value),
-            dtnow = sql.Literal(datetime.now()),
-    )
-    try:
+    with dbc.connection('data') as conn:
+        cursor = conn.cursor()
+        stmt = sql.SQL("SELECT {attribute} FROM sources WHERE id = {sid}").format(
+                attribute = sql.Identifier(attribute),
+                sid = sql.Literal(source_id),
+        )
         cursor.execute(stmt)
-        conn.commit()
-    except psycopg2.OperationalError:
-        return False
+        rows = cursor.fetchall()
+        if not rows: # deleted since it was looked up
+            source_cache.invalidate(source_id)
+            print(RED + "Source not found, it may have been deleted.")
+            return False
+        curr_val = rows[0][0]
+
+        stmt = sql.SQL(
+            "UPDATE sources SET {attribute}={value}, modified_date={dtnow} WHERE id = {sid}"
+        ).format(
+                attribute = sql.Identifier(attribute),
+                sid = sql.Literal(source_id),
+                value = sql.Literal(new_value),
+                dtnow = sql.Literal(datetime.now()),
+        )
+        try:
+            cursor.execute(stmt)
+            conn.commit()
+        except psycopg2.OperationalError:
+            return False
+    source_cache.invalidate(source_id) # drop the stale cache entry of the modified source
     log.operation_log(
         "Edit Source",
         uid,
@@ -149,20 +381,21 @@ def change_password(user_id:int, new_password:str) -> bool:
     '''
     Function to change the password of a specific user. Input: user id and new password hash.
     Returns a bool value depending on whether the modification was successful.
-    If successful, triggers email notification to user that password has changed.
+    If successful, queues an email notification to the user that the password has changed.
     '''
-    conn = dbc.establish_connection('authentication')
-    cursor = conn.cursor()
     psql = "UPDATE users SET password = %(val)s WHERE id = %(id)s;"
     val = {'val':new_password, 'id': user_id}
-    try:
-        cursor.execute(psql,val)
-        conn.commit()
-    except psycopg2.OperationalError:
-        return False
+    with dbc.connection('authentication') as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(psql,val)
+            conn.commit()
+        except psycopg2.OperationalError:
+            return False
     log.auth_log("Password Change", user_id)
+    sessions.revoke_user(user_id) # sessions started with the old password end
     fetch_user = adops.fetch_user_info(uid=user_id) # retrieves user's information
     u_email = fetch_user[3]
     u_first_name = fetch_user[1]
-    notification.changed_password_email(u_first_name, u_email) # triggers email notification
+    outbox.enqueue('changed_password', firstname=u_first_name, email=u_email) # queues email
     return True
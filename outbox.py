@@ -0,0 +1,179 @@
+"""
+Module to queue email notifications in a durable spool directory and deliver them.
+The interactive modules only enqueue notifications; a separate worker process sends them
+with retries and exponential backoff. Start the worker with: python outbox.py
+"""
+
+import json
+import os
+import time
+import uuid
+import notification
+import settings
+
+RED = '\033[91m' # Erorr Messages
+GREEN = '\033[92m' # Success Messages
+YELLOW = '\033[93m' # Notices to User
+
+FAILED_DIR = os.path.join(settings.OUTBOX_DIR, 'failed') # ran out of attempts or unreadable
+CLAIM_SUFFIX = '.work' # suffix of notifications currently being delivered by the worker
+
+
+def enqueue(kind:str, **args) -> str:
+    '''
+    Persists a notification in the outbox and returns its file name.
+    The kind selects the email: 'new_source', 'new_sources_digest' or 'changed_password'.
+    The keyword arguments are passed to the matching notification function on delivery.
+    The file is written atomically so that the worker never reads a partial notification.
+    '''
+    os.makedirs(settings.OUTBOX_DIR, exist_ok=True)
+    entry = {'kind':kind, 'args':args, 'attempts':0, 'next_attempt':time.time()}
+    name = f"{int(time.time() * 1000):013d}-{uuid.uuid4().hex}.json" # sorts by creation time
+    path = os.path.join(settings.OUTBOX_DIR, name)
+    write_entry(path, entry)
+    return name
+
+
+def write_entry(path:str, entry:dict):
+    '''Writes an outbox entry via a temporary file and an atomic rename.'''
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump(entry, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+def deliver(entry:dict) -> dict:
+    '''
+    Sends the email of an outbox entry. Returns the arguments that still need to be delivered,
+    i.e. None if delivery was successful, or the failed subset of the recipients.
+    '''
+    args = entry['args']
+    if entry['kind'] == 'changed_password':
+        sent = notification.changed_password_email(args['firstname'], args['email'])
+        return None if sent else args
+    if entry['kind'] == 'new_source':
+        results = notification.new_source_email(
+            args['recipients'], args['source_id'], args['name'], args['url'], args['threat_level']
+        )
+    elif entry['kind'] == 'new_sources_digest':
+        results = notification.new_sources_digest_email(
+            args['recipients'], args['total'], args['sources']
+        )
+    else:
+        raise ValueError(f"Unknown notification kind: {entry['kind']}")
+    failed = [item for item in args['recipients'] if not results.get(item[0])]
+    if failed:
+        return dict(args, recipients=failed) # only retry the recipients that failed
+    return None
+
+
+def backoff(attempts:int) -> float:
+    '''Returns the delay in seconds before the next attempt after the given failed attempts.'''
+    return min(settings.OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1), settings.OUTBOX_BACKOFF_MAX)
+
+
+def process_entry(name:str):
+    '''
+    Claims an outbox entry, delivers it and removes it if successful.
+    Failed entries are rescheduled with exponential backoff, or moved to the 'failed'
+    folder once the maximum number of attempts is reached. Entries that cannot be read
+    (e.g. corrupt files) or delivered (e.g. unknown kinds) are moved to 'failed' right away.
+    '''
+    path = os.path.join(settings.OUTBOX_DIR, name)
+    claimed = path + CLAIM_SUFFIX
+    try:
+        os.replace(path, claimed)
+    except FileNotFoundError:
+        return # already handled
+    try:
+        with open(claimed, 'r') as file:
+            entry = json.load(file)
+        entry['attempts'] = int(entry['attempts'])
+        entry['args'] = dict(entry['args'])
+    except (OSError, ValueError, KeyError, TypeError) as error:
+        print(RED + f"Notification {name} cannot be read, moved to 'failed'. Error:", error)
+        os.makedirs(FAILED_DIR, exist_ok=True)
+        os.replace(claimed, os.path.join(FAILED_DIR, name))
+        return
+    try:
+        remaining = deliver(entry)
+    except (ValueError, KeyError) as error: # unknown kind or missing arguments
+        print(RED + f"Notification {name} cannot be delivered. Error:", error)
+        remaining = entry['args']
+        entry['attempts'] = settings.OUTBOX_MAX_ATTEMPTS - 1
+    except Exception as error: #pylint: disable=broad-except
+        # e.g. the template or the outbound password could not be loaded; retried with backoff
+        print(RED + f"Notification {name} could not be sent. Error:", error)
+        remaining = entry['args']
+    if remaining is None:
+        os.remove(claimed)
+        print(GREEN + f"Delivered notification {name}.")
+        return
+    entry['args'] = remaining
+    entry['attempts'] += 1
+    if entry['attempts'] >= settings.OUTBOX_MAX_ATTEMPTS:
+        os.makedirs(FAILED_DIR, exist_ok=True)
+        write_entry(os.path.join(FAILED_DIR, name), entry)
+        os.remove(claimed)
+        print(RED + f"Notification {name} failed after {entry['attempts']} attempts.")
+        return
+    entry['next_attempt'] = time.time() + backoff(entry['attempts'])
+    write_entry(path, entry)
+    os.remove(claimed)
+    print(YELLOW + f"Notification {name} failed, retrying in {backoff(entry['attempts'])}s.")
+
+
+def pending_entries() -> list:
+    '''Returns the names of the outbox entries that are due for delivery, oldest first.'''
+    due = []
+    now = time.time()
+    try:
+        names = sorted(os.listdir(settings.OUTBOX_DIR))
+    except FileNotFoundError:
+        return due
+    for name in names:
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(settings.OUTBOX_DIR, name), 'r') as file:
+                if json.load(file)['next_attempt'] <= now:
+                    due.append(name)
+        except FileNotFoundError:
+            continue # claimed by now
+        except (ValueError, KeyError, TypeError):
+            due.append(name) # written atomically, so corrupt for good: process_entry moves it
+    return due
+
+
+def recover_claims():
+    '''Puts back entries left claimed by a worker that stopped mid-delivery.'''
+    try:
+        names = os.listdir(settings.OUTBOX_DIR)
+    except FileNotFoundError:
+        return
+    for name in names:
+        if name.endswith('.json' + CLAIM_SUFFIX):
+            claimed = os.path.join(settings.OUTBOX_DIR, name)
+            os.replace(claimed, claimed[:-len(CLAIM_SUFFIX)])
+
+
+def run_worker(poll_interval:float=settings.OUTBOX_POLL_INTERVAL):
+    '''Delivers the outbox notifications until interrupted. Only one worker should run.'''
+    recover_claims()
+    print(GREEN + f"Notification worker started, watching '{settings.OUTBOX_DIR}'.")
+    try:
+        while True:
+            for name in pending_entries():
+                try:
+                    process_entry(name)
+                except OSError as error: # e.g. disk full, the claim is recovered on restart
+                    print(RED + f"Notification {name} could not be processed. Error:", error)
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        print(YELLOW + "Notification worker stopped.")
+
+
+if __name__ == '__main__':
+    run_worker()
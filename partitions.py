@@ -0,0 +1,231 @@
+"""
+Module to maintain the monthly partitions of the event log tables (PostgreSQL 11 or newer).
+Creates the partitions of the upcoming months and detaches, archives or drops the partitions
+older than the retention period. Run daily, e.g. via cron: python partitions.py
+"""
+
+import argparse
+import gzip
+import os
+import re
+from datetime import datetime, timezone
+import psycopg2
+from psycopg2 import sql
+import dbconnection as dbc
+import eventlog as log
+import settings
+
+RED = '\033[91m' # Error Messages
+GREEN = '\033[92m' # Success Messages
+YELLOW = '\033[93m' # Notices to User
+
+RETENTION_ACTIONS = ('archive', 'detach', 'drop')
+
+
+def add_months(month:tuple, months:int) -> tuple:
+    '''Adds months to a (year, month) tuple.'''
+    index = month[0] * 12 + month[1] - 1 + months
+    return (index // 12, index % 12 + 1)
+
+
+def current_month() -> tuple:
+    '''Returns the current UTC month as (year, month) tuple.'''
+    now = datetime.now(timezone.utc)
+    return (now.year, now.month)
+
+
+def month_bound(month:tuple) -> str:
+    '''Returns the start of a month in UTC as timestamptz literal, used as partition bound.'''
+    return f"{month[0]:04d}-{month[1]:02d}-01 00:00:00+00"
+
+
+def partition_name(table:str, month:tuple, legacy:bool=False) -> str:
+    '''
+    Returns the partition name of a month, e.g. 'authlogs_y2021m01'.
+    Legacy partitions hold all rows before the month, e.g. 'authlogs_before_y2021m01'.
+    '''
+    return f"{table}_{'before_' if legacy else ''}y{month[0]:04d}m{month[1]:02d}"
+
+
+def partition_end(table:str, name:str) -> tuple:
+    '''
+    Returns the exclusive upper bound month of a partition from its name,
+    or None for the default partition and tables not created by this module.
+    '''
+    match = re.fullmatch(re.escape(table) + r'_(before_)?y(\d{4})m(\d{2})', name)
+    if match is None:
+        return None
+    month = (int(match.group(2)), int(match.group(3)))
+    return month if match.group(1) else add_months(month, 1)
+
+
+def list_partitions(cursor, table:str) -> list:
+    '''Returns the names of the partitions attached to a log table.'''
+    cursor.execute("""
+        SELECT child.relname FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = %s ORDER BY child.relname
+        """, (table,))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def list_detached(cursor, table:str) -> list:
+    '''
+    Returns the names of former partitions of a log table that were detached but still exist,
+    e.g. because archiving them failed after the detach.
+    '''
+    cursor.execute("""
+        SELECT relname FROM pg_class
+        WHERE relkind = 'r' AND NOT relispartition AND pg_table_is_visible(oid)
+          AND relname LIKE %s ORDER BY relname
+        """, (table + '%',))
+    return [row[0] for row in cursor.fetchall() if partition_end(table, row[0]) is not None]
+
+
+def create_partition(conn, table:str, month:tuple):
+    '''
+    Creates and attaches the partition of a month in one transaction.
+    Rows of the month that were logged into the default partition (because the partition
+    did not exist yet) are moved into the new partition.
+    '''
+    name = sql.Identifier(partition_name(table, month))
+    lower, upper = sql.Literal(month_bound(month)), sql.Literal(month_bound(add_months(month, 1)))
+    cursor = conn.cursor()
+    cursor.execute(sql.SQL("CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)").format(
+        name=name, table=sql.Identifier(table)
+    ))
+    cursor.execute(sql.SQL("""
+        WITH moved AS (
+            DELETE FROM {default} WHERE datetime >= {lower} AND datetime < {upper} RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+        """).format(
+            default=sql.Identifier(f"{table}_default"), name=name, lower=lower, upper=upper
+        ))
+    cursor.execute(sql.SQL(
+        "ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM ({lower}) TO ({upper})"
+    ).format(table=sql.Identifier(table), name=name, lower=lower, upper=upper))
+    conn.commit()
+
+
+def ensure_partitions(conn, months_ahead:int=settings.PARTITION_PREMAKE_MONTHS) -> list:
+    '''
+    Creates the missing partitions from the current month up to months_ahead months ahead.
+    Returns the names of the created partitions.
+    '''
+    created = []
+    cursor = conn.cursor()
+    for table in log.LOG_COLUMNS:
+        existing = list_partitions(cursor, table)
+        conn.commit()
+        # months before the end of a legacy partition are covered already
+        covered = max([partition_end(table, name) for name in existing
+                       if name.startswith(f"{table}_before_")] or [(0, 1)])
+        for offset in range(months_ahead + 1):
+            month = add_months(current_month(), offset)
+            if partition_name(table, month) not in existing and month >= covered:
+                create_partition(conn, table, month)
+                created.append(partition_name(table, month))
+    return created
+
+
+def expired_partitions(
+    cursor, retention_months:int=settings.LOG_RETENTION_MONTHS,
+    action:str=settings.LOG_RETENTION_ACTION
+) -> list:
+    '''
+    Returns the (table, partition, attached) tuples whose rows are all older than the retention
+    period. Unless the action keeps detached partitions ('detach'), expired partitions that are
+    detached already (left over by an archive or drop that failed) are included as well.
+    Returns an empty list if the retention is disabled (0 months).
+    '''
+    if retention_months <= 0:
+        return []
+    cutoff = add_months(current_month(), -retention_months)
+    expired = []
+    for table in log.LOG_COLUMNS:
+        candidates = [(name, True) for name in list_partitions(cursor, table)]
+        if action != 'detach':
+            candidates += [(name, False) for name in list_detached(cursor, table)]
+        for name, attached in candidates:
+            end = partition_end(table, name)
+            if end is not None and end <= cutoff:
+                expired.append((table, name, attached))
+    return expired
+
+
+def archive_partition(conn, name:str, archive_dir:str=settings.LOG_ARCHIVE_DIR) -> str:
+    '''
+    Writes a detached partition to a gzip-compressed CSV file (with header) via COPY TO.
+    The file is synced to disk before it is renamed, so that only complete archives exist.
+    Returns the path of the archive.
+    '''
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.csv.gz")
+    with gzip.open(path + '.tmp', 'wt', newline='') as file:
+        conn.cursor().copy_expert(
+            sql.SQL("COPY {} TO STDOUT WITH CSV HEADER").format(sql.Identifier(name))
+            .as_string(conn), file
+        )
+    with open(path + '.tmp', 'rb') as file:
+        os.fsync(file.fileno())
+    os.replace(path + '.tmp', path)
+    conn.commit()
+    return path
+
+
+def retire_partition( #pylint: disable=too-many-arguments
+    conn, table:str, name:str, action:str=settings.LOG_RETENTION_ACTION, attached:bool=True
+):
+    '''
+    Detaches an expired partition from its log table (unless detached already) and, depending
+    on the action, archives it to a file and drops it ('archive'), keeps it as a plain table
+    ('detach') or drops it without archive ('drop'). The detach is committed first so the log
+    table is only locked briefly; if archiving fails, the detached table is picked up again by
+    the next run (see expired_partitions).
+    '''
+    cursor = conn.cursor()
+    if attached:
+        cursor.execute(sql.SQL("ALTER TABLE {table} DETACH PARTITION {name}").format(
+            table=sql.Identifier(table), name=sql.Identifier(name)
+        ))
+        conn.commit()
+    if action == 'archive':
+        print(YELLOW + f"Archived '{name}' to {archive_partition(conn, name)}.")
+    if action in ('archive', 'drop'):
+        cursor.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(name)))
+        conn.commit()
+
+
+def maintain(dry_run:bool=False) -> bool:
+    '''
+    Creates the upcoming partitions and retires the expired ones.
+    With dry_run, only the expired partitions are listed. Returns True on success.
+    '''
+    if settings.LOG_RETENTION_ACTION not in RETENTION_ACTIONS:
+        print(RED + f"Invalid LOG_RETENTION_ACTION '{settings.LOG_RETENTION_ACTION}'.")
+        return False
+    try:
+        with dbc.connection('eventlog') as conn:
+            expired = expired_partitions(conn.cursor())
+            conn.commit()
+            if dry_run:
+                for table, name, attached in expired:
+                    print(YELLOW + f"Expired: {name} ({table}{'' if attached else ', detached'})")
+                return True
+            for name in ensure_partitions(conn):
+                print(GREEN + f"Created partition '{name}'.")
+            for table, name, attached in expired:
+                retire_partition(conn, table, name, attached=attached)
+                print(GREEN + f"Retired partition '{name}' ({settings.LOG_RETENTION_ACTION}).")
+    except (psycopg2.Error, OSError) as error:
+        print(RED + "Issue with maintaining the event log partitions. Error:", error)
+        return False
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dry-run', action='store_true', help='only list expired partitions')
+    raise SystemExit(0 if maintain(parser.parse_args().dry_run) else 1)
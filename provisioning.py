@@ -0,0 +1,116 @@
+"""
+Module to provision many users at once from a CSV or JSONL file (Administrator role).
+CSV files need a header row with the columns: first_name, last_name, email, dob, role
+JSONL files hold one JSON object with the same keys per line (read by records.py).
+Run with: python provisioning.py users.csv [--dry-run]
+"""
+
+import argparse
+import sys
+from datetime import datetime
+import admin_operations as adops
+import authentication as auth
+import records
+import validation
+
+RED = '\033[91m' # Error Messages
+GREEN = '\033[92m' # Success Messages
+WHITE = '\033[97m' # User Input
+YELLOW = '\033[93m' # Notices to User
+
+FIELDS = ('first_name', 'last_name', 'email', 'dob', 'role')
+
+
+def validate_user(record:dict) -> str:
+    '''
+    Validates a user record with the same rules as the user creation prompts of the interface.
+    Returns an error message, or None if the record is valid.
+    '''
+    for field in FIELDS:
+        if not str(record.get(field) or '').strip():
+            return f"Missing field '{field}'"
+    for field in ('first_name', 'last_name', 'email', 'dob'):
+        if not isinstance(record[field], str):
+            return f"Field '{field}' must be text"
+    if not validation.is_valid_name(record['first_name']):
+        return 'Invalid First Name'
+    if not validation.is_valid_name(record['last_name']):
+        return 'Invalid Last Name'
+    if not validation.is_valid_email(record['email']):
+        return 'Invalid Email Address'
+    if not validation.is_valid_dob(record['dob']):
+        return 'Invalid Date of Birth'
+    try:
+        datetime.strptime(record['dob'], '%Y-%m-%d') # one bad date would fail the whole batch
+    except ValueError:
+        return 'Invalid Date of Birth'
+    if str(record['role']) not in ('1', '2', '3'):
+        return 'Invalid User Role (1 = Administrator, 2 = Specialist, 3 = External Authority)'
+    return None
+
+
+def load_users(path:str) -> tuple:
+    '''
+    Reads and validates all user records of the file. Duplicate email addresses within the file
+    and addresses already tied to a user in the system are rejected as well.
+    Returns a tuple: (list of valid user dicts, list of (line, email, error) tuples)
+    '''
+    users = []
+    errors = []
+    seen_emails = set()
+    for line, record in records.read_records(path, errors):
+        error = validate_user(record)
+        if error is None and record['email'] in seen_emails:
+            error = 'Duplicate Email Address in file'
+        if error is not None:
+            errors.append((line, record.get('email'), error))
+            continue
+        seen_emails.add(record['email'])
+        users.append({
+            'first_name':record['first_name'],
+            'last_name':record['last_name'],
+            'email':record['email'],
+            'dob':record['dob'],
+            'role':int(record['role']),
+        })
+    taken = adops.existing_emails([user['email'] for user in users]) if users else set()
+    for user in users:
+        if user['email'] in taken:
+            errors.append((None, user['email'], 'Email Address is already tied to a User'))
+    users = [user for user in users if user['email'] not in taken]
+    return (users, errors)
+
+
+def main() -> int:
+    '''Parses the arguments, validates the file and provisions the valid users.'''
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('file', help='CSV or JSONL file with the users to create')
+    parser.add_argument('--dry-run', action='store_true', help='only validate the file')
+    args = parser.parse_args()
+
+    users, errors = load_users(args.file)
+    for line, email, error in errors:
+        position = f"line {line}" if line is not None else "record"
+        print(RED + f"Skipping {position} ({email}): {error}")
+    print(YELLOW + f"{len(users)} valid users, {len(errors)} rejected records." + WHITE)
+    if args.dry_run or not users:
+        return 0 if not errors else 1
+
+    login = auth.prompt_login(roles=(1,)) # only administrators may provision users
+    if login is None:
+        print(RED + 'Authentication failed or user is not an Administrator.' + WHITE)
+        return 1
+    admin_id = login[0]
+    created = adops.register_users_bulk(users, admin_id)
+    if created is None:
+        print(RED + 'Error: No users have been created. Please check the file and try again.')
+        return 1
+    for user in created:
+        status = 'email sent' if user['email_sent'] else 'email could NOT be sent'
+        print(GREEN + f"Created {user['username']} (id {user['id']}) for {user['email']}, {status}")
+    print(GREEN + f"{len(created)} users have successfully been created!" + WHITE)
+    return 0 if not errors else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,35 @@
+"""
+Module reading the records of the CSV and JSONL import files of the bulk tools
+(ingestion.py for sources, provisioning.py for users).
+CSV files need a header row with the column names, JSONL files hold one JSON object per line.
+"""
+
+import csv
+import json
+
+
+def read_records(path:str, errors:list):
+    '''
+    Generator that reads the records of a CSV or JSONL file (by file extension).
+    Yields tuples of (line number, record dict). Lines that are not a JSON object are not
+    yielded but appended to errors as (line number, None, error message), so that one
+    malformed line does not stop the import.
+    '''
+    with open(path, 'r', newline='') as file:
+        if path.lower().endswith('.jsonl'):
+            for line_number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    errors.append((line_number, None, 'Malformed JSON line'))
+                    continue
+                if not isinstance(record, dict):
+                    errors.append((line_number, None, 'Line is not a JSON object'))
+                    continue
+                yield (line_number, record)
+        else:
+            reader = csv.DictReader(file)
+            for record in reader:
+                yield (reader.line_num, record)
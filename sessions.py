@@ -0,0 +1,268 @@
+"""
+Module handling the sessions of authenticated users.
+After a successful login, a session with the user id, first name and role is kept in the session
+store and the client receives a signed, expiring token for it, so later role checks and
+operations cost a token check and a store lookup instead of a database query plus Argon2.
+Tokens have the format "<session id>.<expiry>.<signature>" (HMAC-SHA256 over id and expiry),
+so forged or expired tokens are rejected before the store is consulted.
+
+SESSION_STORE selects the store: 'memory' keeps the sessions in the process (with TTL eviction),
+'database' keeps them in the 'sessions' table of the Authentication DB
+(Authentication_sessions.sql), shared by all processes. The database store requires a shared
+signing key, without it no session is started: python sessions.py --generate-key
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import namedtuple
+import psycopg2
+import dbconnection as dbc
+import settings
+
+RED = '\033[91m' # Error Messages
+GREEN = '\033[92m' # Success Messages
+YELLOW = '\033[93m' # Notices to User
+
+Session = namedtuple('Session', ('sid', 'uid', 'first_name', 'role', 'username', 'expires'))
+
+
+class SigningKeyError(RuntimeError):
+    """Raised if the database store is used without the shared signing key file."""
+
+
+class MemoryStore:
+    """
+    Thread-safe in-process session store. Expired sessions are dropped when they are looked up
+    and purged from the whole store at most every SESSION_PURGE_INTERVAL seconds.
+    """
+
+    def __init__(self):
+        self._sessions = {} # session id -> Session
+        self._lock = threading.Lock()
+        self._next_purge = time.time() + settings.SESSION_PURGE_INTERVAL
+
+    def get(self, sid:str) -> Session:
+        '''Returns the session or None if unknown or expired.'''
+        with self._lock:
+            session = self._sessions.get(sid)
+            if session is not None and session.expires <= time.time():
+                del self._sessions[sid]
+                return None
+            return session
+
+    def put(self, session:Session) -> bool:
+        '''Stores a session.'''
+        with self._lock:
+            self._sessions[session.sid] = session
+            now = time.time()
+            if now >= self._next_purge:
+                self._next_purge = now + settings.SESSION_PURGE_INTERVAL
+                expired = [sid for sid, entry in self._sessions.items() if entry.expires <= now]
+                for sid in expired:
+                    del self._sessions[sid]
+        return True
+
+    def delete(self, sid:str):
+        '''Removes a session.'''
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+    def delete_user(self, uid:int):
+        '''Removes all sessions of a user.'''
+        with self._lock:
+            for sid in [sid for sid, entry in self._sessions.items() if entry.uid == uid]:
+                del self._sessions[sid]
+
+    def purge(self) -> int:
+        '''Removes the expired sessions. Returns their number.'''
+        now = time.time()
+        with self._lock:
+            expired = [sid for sid, entry in self._sessions.items() if entry.expires <= now]
+            for sid in expired:
+                del self._sessions[sid]
+        return len(expired)
+
+
+class DatabaseStore:
+    """
+    Session store on the 'sessions' table of the Authentication DB, shared by all processes.
+    Lookups fail closed: if the database is unreachable, the session counts as invalid.
+    """
+
+    @staticmethod
+    def get(sid:str) -> Session:
+        '''Returns the session or None if unknown, expired or the database is unreachable.'''
+        psql = """SELECT id, user_id, first_name, user_role, username, extract(epoch from expires)
+                  FROM sessions WHERE id = %(sid)s AND expires > now()"""
+        try:
+            with dbc.connection('authentication') as conn:
+                cursor = conn.cursor()
+                cursor.execute(psql, {'sid':sid})
+                row = cursor.fetchone()
+        except psycopg2.OperationalError:
+            return None
+        if row is None:
+            return None
+        return Session(row[0], row[1], row[2], row[3], row[4], float(row[5]))
+
+    @staticmethod
+    def put(session:Session) -> bool:
+        '''Stores a session. Returns False if the database is unreachable.'''
+        psql = """INSERT INTO sessions (id, user_id, first_name, user_role, username, expires)
+                  VALUES (%(sid)s, %(uid)s, %(first_name)s, %(role)s, %(username)s,
+                          to_timestamp(%(expires)s))"""
+        try:
+            with dbc.connection('authentication') as conn:
+                cursor = conn.cursor()
+                cursor.execute(psql, session._asdict())
+                conn.commit()
+        except psycopg2.OperationalError as error:
+            print(RED + 'Issue with storing the session on database. Error:', error)
+            return False
+        return True
+
+    @staticmethod
+    def _execute(psql:str, val:dict) -> int:
+        '''Runs a delete statement. Returns the number of deleted rows (0 if it failed).'''
+        try:
+            with dbc.connection('authentication') as conn:
+                cursor = conn.cursor()
+                cursor.execute(psql, val)
+                conn.commit()
+                return cursor.rowcount
+        except psycopg2.OperationalError as error:
+            print(RED + 'Issue with removing sessions on database. Error:', error)
+            return 0
+
+    def delete(self, sid:str):
+        '''Removes a session.'''
+        self._execute("DELETE FROM sessions WHERE id = %(sid)s", {'sid':sid})
+
+    def delete_user(self, uid:int):
+        '''Removes all sessions of a user.'''
+        self._execute("DELETE FROM sessions WHERE user_id = %(uid)s", {'uid':uid})
+
+    def purge(self) -> int:
+        '''Removes the expired sessions. Returns their number.'''
+        return self._execute("DELETE FROM sessions WHERE expires <= now()", {})
+
+
+STORES = {'memory': MemoryStore, 'database': DatabaseStore}
+_store = STORES[settings.SESSION_STORE]()
+_key = None # signing key, loaded on first use
+_key_lock = threading.Lock()
+
+
+def signing_key() -> bytes:
+    '''
+    Returns the signing key from SESSION_KEY_FILE. Without the file, a random key is used for
+    the lifetime of the process, which is sufficient for the memory store. The database store
+    raises a SigningKeyError instead, as the tokens of each process would be rejected by the others.
+    '''
+    global _key #pylint: disable=global-statement
+    with _key_lock: # the threads of the API must not start with different keys
+        if _key is None:
+            try:
+                with open(settings.SESSION_KEY_FILE, 'rb') as file:
+                    _key = file.read()
+            except FileNotFoundError:
+                if settings.SESSION_STORE == 'database':
+                    raise SigningKeyError(
+                        f"{settings.SESSION_KEY_FILE} is missing, the database session store "
+                        "needs a shared key: python sessions.py --generate-key"
+                    ) from None
+                _key = secrets.token_bytes(32)
+        return _key
+
+
+def sign(payload:str) -> str:
+    '''Returns the HMAC-SHA256 signature of a token payload (base64url, without padding).'''
+    digest = hmac.new(signing_key(), payload.encode('ascii'), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode('ascii')
+
+
+def create(login:tuple, username:str, ttl:int=None) -> str:
+    '''
+    Starts a session for an authenticated user: (user id, first name, user role).
+    Returns the session token, or None if the session could not be stored.
+    '''
+    expires = int(time.time()) + (ttl or settings.SESSION_TTL)
+    session = Session(secrets.token_urlsafe(24), login[0], login[1], login[2], username, expires)
+    if not _store.put(session):
+        return None
+    payload = f"{session.sid}.{expires}"
+    return f"{payload}.{sign(payload)}"
+
+
+def parse(token:str) -> tuple:
+    '''
+    Checks the signature and expiry of a token without consulting the store.
+    Returns (session id, expiry) or None if the token is malformed, forged or expired.
+    '''
+    try:
+        sid, expires, signature = token.split('.')
+        expires = int(expires)
+    except (AttributeError, ValueError):
+        return None
+    if not hmac.compare_digest(signature, sign(f"{sid}.{expires}")) or expires <= time.time():
+        return None
+    return (sid, expires)
+
+
+def resolve(token:str) -> Session:
+    '''Returns the session of a token, or None if the token or its session is invalid.'''
+    parsed = parse(token)
+    if parsed is None:
+        return None
+    return _store.get(parsed[0])
+
+
+def revoke(token:str):
+    '''Ends the session of a token (logout).'''
+    parsed = parse(token)
+    if parsed is not None:
+        _store.delete(parsed[0])
+
+
+def revoke_user(uid:int):
+    '''
+    Ends all sessions of a user, e.g. after a password change, lock or deactivation.
+    With the memory store, only the sessions of the current process are ended.
+    '''
+    _store.delete_user(uid)
+
+
+def generate_key():
+    '''Writes a new random signing key to SESSION_KEY_FILE, readable by the owner only.'''
+    if os.path.exists(settings.SESSION_KEY_FILE):
+        print(YELLOW + f"{settings.SESSION_KEY_FILE} exists already, remove it to replace the key.")
+        return
+    descriptor = os.open(settings.SESSION_KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(descriptor, 'wb') as file:
+        file.write(secrets.token_bytes(32))
+    print(GREEN + f"Session signing key written to {settings.SESSION_KEY_FILE}.")
+
+
+def main():
+    '''Generates the signing key or purges the expired sessions of the database store.'''
+    parser = argparse.ArgumentParser(description='Session key and store maintenance.')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--generate-key', action='store_true',
+                       help='write a new signing key to SESSION_KEY_FILE')
+    group.add_argument('--purge', action='store_true',
+                       help='remove the expired sessions of the session store')
+    args = parser.parse_args()
+    if args.generate_key:
+        generate_key()
+    else:
+        print(GREEN + f"{_store.purge()} expired session(s) removed.")
+
+
+if __name__ == '__main__':
+    main()
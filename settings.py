@@ -0,0 +1,99 @@
+"""Module holding the tunable settings of the Suspect Sources System."""
+
+# Database Connection Pool (dbconnection module)
+POOL_MIN_SIZE = 1 # connections per database that are kept open even when idle
+POOL_MAX_SIZE = 5 # maximum number of open connections per database
+POOL_IDLE_TIMEOUT = 300 # seconds before an idle connection above the minimum is closed
+POOL_PING_INTERVAL = 30 # idle seconds after which a connection is health-checked on checkout
+POOL_CHECKOUT_TIMEOUT = 10 # seconds to wait for a free connection if the pool is exhausted
+
+# Event Log Writer (eventlog module)
+LOG_BATCH_SIZE = 100 # queued log entries that trigger an immediate flush to the eventlog DB
+LOG_FLUSH_INTERVAL = 1.0 # maximum seconds a queued log entry waits before being flushed
+LOG_SHUTDOWN_TIMEOUT = 10 # seconds to wait for the queue to drain when the CLI exits
+LOG_SPILL_FILE = 'spool/eventlog_spill.jsonl' # append-only fallback if the eventlog DB is down
+LOG_QUARANTINE_FILE = 'spool/eventlog_quarantine.jsonl' # entries the DB rejects, not replayed
+
+# Source Search (operations module)
+SEARCH_MODE = 'like' # 'like' = substring match, 'fulltext' = word prefixes (Data_search_index.sql)
+SEARCH_PAGE_SIZE = 20 # sources shown per page of search results
+
+# Source Cache (operations module)
+SOURCE_CACHE_SIZE = 256 # maximum number of sources kept in the get_source_by_id cache (0 = off)
+SOURCE_CACHE_TTL = 300 # seconds a cached source is served before it is re-read from the DB
+
+# Password Hashing Profile (hashing module), tune with "python benchmarks/calibrate_hashing.py"
+# Stored hashes with other parameters are upgraded transparently on the next successful login.
+HASH_MEMORY_COST = 102400 # Argon2 memory in KiB per hash (100 MiB)
+HASH_TIME_COST = 2 # Argon2 iterations
+HASH_PARALLELISM = 8 # Argon2 lanes (threads) per hash
+HASH_LENGTH = 16 # bytes of the raw hash
+HASH_SALT_LENGTH = 16 # bytes of the random salt
+
+# Password Hashing Pool (hashing module)
+HASH_POOL_SIZE = 2 # worker processes for Argon2 (each hash uses HASH_MEMORY_COST), 0 = inline
+HASH_MAX_PENDING = 8 # Argon2 computations that may be queued or running at the same time
+HASH_QUEUE_TIMEOUT = 30 # seconds to wait for a free slot before rejecting a computation
+
+# SMTP Transport (notification module)
+# For tests, point the transport at a local debugging server, e.g. started with
+# "python -m aiosmtpd -n -l localhost:1025" (pip install aiosmtpd), using host 'localhost',
+# port 1025 and both SMTP_STARTTLS and SMTP_LOGIN set to False.
+SMTP_HOST = 'smtp.gmail.com'
+SMTP_PORT = 25
+SMTP_STARTTLS = True # upgrade the session to TLS before logging in
+SMTP_LOGIN = True # log in with the outbound account credentials
+SMTP_TIMEOUT = 30 # seconds before an unresponsive SMTP server is given up on
+
+# Notification Outbox (outbox module)
+OUTBOX_DIR = 'spool/outbox' # spool directory of queued email notifications
+OUTBOX_POLL_INTERVAL = 5 # seconds the worker waits before checking the outbox again
+OUTBOX_MAX_ATTEMPTS = 8 # delivery attempts before a notification is moved to 'failed'
+OUTBOX_BACKOFF_BASE = 30 # seconds before the first retry, doubled with every failed attempt
+OUTBOX_BACKOFF_MAX = 3600 # upper bound of the retry delay in seconds
+
+# Threat Feed Ingestion (ingestion module)
+INGEST_CHUNK_SIZE = 5000 # feed rows loaded via COPY and committed per transaction
+DIGEST_MAX_SOURCES = 50 # sources listed in the digest notification of an ingestion
+
+# Data Export (export module)
+EXPORT_BATCH_SIZE = 10000 # rows fetched per round trip by the JSONL and Parquet exports
+
+# Event Log Partitions and Retention (partitions module)
+PARTITION_PREMAKE_MONTHS = 3 # monthly log partitions created ahead of the current month
+LOG_RETENTION_MONTHS = 24 # months of event logs kept in the eventlog DB (0 = keep forever)
+LOG_RETENTION_ACTION = 'archive' # 'archive' = gzip CSV + drop, 'detach' = keep as table, 'drop'
+LOG_ARCHIVE_DIR = 'archive/eventlog' # directory of the archived log partitions
+
+# Audit Queries (audit module)
+AUDIT_PAGE_SIZE = 20 # log entries shown per page of an audit query
+AUDIT_REPORT_LIMIT = 50 # maximum rows of an audit report
+
+# HTTP API (api module)
+API_HOST = '127.0.0.1' # bind address; expose it via a TLS-terminating reverse proxy only
+# Reverse proxies whose X-Forwarded-For header names the client, e.g. ('127.0.0.1',). Logins are
+# throttled per client address; without it, all clients share the address of the proxy.
+API_TRUSTED_PROXIES = ()
+API_PORT = 8080
+API_WORKERS = 5 # threads running the blocking operations (more than POOL_MAX_SIZE only queue)
+API_TOKEN_TTL = 3600 # seconds a session token issued by POST /login stays valid
+API_MAX_BODY = 1048576 # maximum request body in bytes
+API_KEEPALIVE_TIMEOUT = 15 # seconds an idle keep-alive connection is kept open
+API_MAX_LOOKUP_URLS = 1000 # maximum urls per lookup request
+
+# Sessions (sessions module)
+SESSION_STORE = 'memory' # 'memory' = per process, 'database' = shared 'sessions' table
+SESSION_TTL = 28800 # seconds a session stays valid after login (one working day)
+SESSION_PURGE_INTERVAL = 60 # minimum seconds between purges of expired sessions (memory store)
+SESSION_KEY_FILE = 'config/session_key.bin' # token signing key, see "python sessions.py --help"
+
+# Login Throttling (throttling module)
+LOGIN_WINDOW = 900 # seconds of the sliding window in which failed logins are counted
+LOGIN_LOCKOUT_FAILURES = 3 # incorrect passwords of a user in the window that lock it (0 = never)
+LOGIN_MAX_USERNAME_FAILURES = 5 # failures per username in the window before logins are rejected
+LOGIN_MAX_SOURCE_FAILURES = 20 # failures per client address or host before logins are rejected
+
+# Metrics (metrics module)
+METRICS_ENABLED = True # record latency histograms and counters of the hot paths
+METRICS_DUMP_INTERVAL = 15 # seconds between dumps of the metrics to a file (0 = no dumps)
+METRICS_DUMP_FILE = 'spool/metrics/{program}-{pid}.prom' # per running process, removed at exit
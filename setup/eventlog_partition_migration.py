@@ -0,0 +1,114 @@
+"""
+Converts the existing (unpartitioned) event log tables into monthly partitioned tables.
+Requires PostgreSQL 11 or newer and timestamptz datetimes (eventlog_timestamp_migration.py).
+No rows are copied: each existing table is attached as legacy partition holding all rows
+before the next month (e.g. 'authlogs_before_y2021m07'), which the retention job of
+partitions.py retires as a whole once its newest rows have expired.
+1. a CHECK constraint on the bound and the new primary key index are built without blocking,
+2. the tables are swapped in one short transaction per table,
+3. the default partition and the upcoming monthly partitions are created.
+Run from the project root: python setup/eventlog_partition_migration.py
+"""
+
+import os
+import sys
+from psycopg2 import sql
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dbconnection as dbc # pylint: disable=wrong-import-position
+import eventlog as log # pylint: disable=wrong-import-position
+import partitions # pylint: disable=wrong-import-position
+from eventlog_timestamp_migration import INDEXES # pylint: disable=wrong-import-position
+
+
+def relation_kind(cursor, table:str) -> str:
+    '''Returns the relkind of a table ('r' = table, 'p' = partitioned table).'''
+    cursor.execute("SELECT relkind FROM pg_class WHERE relname = %s", (table,))
+    return cursor.fetchone()[0]
+
+
+def prepare(conn, table:str, legacy:str, bound:str):
+    '''Validates the upper bound of the existing rows and builds the primary key index.'''
+    cursor = conn.cursor()
+    cursor.execute(sql.SQL(
+        "ALTER TABLE {table} ADD CONSTRAINT {check} CHECK (datetime < {bound}) NOT VALID"
+    ).format(
+        table=sql.Identifier(table),
+        check=sql.Identifier(f"{legacy}_bound"),
+        bound=sql.Literal(bound),
+    ))
+    conn.commit()
+    # validating separately only takes a lock that does not block the log inserts
+    cursor.execute(sql.SQL("ALTER TABLE {} VALIDATE CONSTRAINT {}").format(
+        sql.Identifier(table), sql.Identifier(f"{legacy}_bound")
+    ))
+    conn.commit()
+    conn.autocommit = True # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    try:
+        cursor.execute(sql.SQL(
+            "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} (id, datetime)"
+        ).format(sql.Identifier(f"{legacy}_pkey"), sql.Identifier(table)))
+    finally:
+        conn.autocommit = False
+
+
+def swap(conn, table:str, legacy:str, bound:str):
+    '''Replaces the table by a partitioned table and attaches it as legacy partition.'''
+    cursor = conn.cursor()
+    parent, child = sql.Identifier(table), sql.Identifier(legacy)
+    cursor.execute(sql.SQL("LOCK TABLE {} IN ACCESS EXCLUSIVE MODE").format(parent))
+    cursor.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(parent, child))
+    cursor.execute(sql.SQL("ALTER TABLE {} DROP CONSTRAINT {}").format(
+        child, sql.Identifier(f"{table}_pkey")
+    ))
+    cursor.execute(sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} PRIMARY KEY USING INDEX {}").format(
+        child, sql.Identifier(f"{legacy}_pkey"), sql.Identifier(f"{legacy}_pkey")
+    ))
+    for name, _, _ in INDEXES[table]: # free the index names for the partitioned table
+        cursor.execute(sql.SQL("ALTER INDEX IF EXISTS {} RENAME TO {}").format(
+            sql.Identifier(name), sql.Identifier(name.replace(table, legacy, 1))
+        ))
+    cursor.execute(sql.SQL(
+        "CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS) PARTITION BY RANGE (datetime)"
+    ).format(parent, child))
+    cursor.execute(sql.SQL("ALTER TABLE {} ADD PRIMARY KEY (id, datetime)").format(parent))
+    cursor.execute(sql.SQL("ALTER SEQUENCE {} OWNED BY {}.id").format(
+        sql.Identifier(f"{table}_id_seq"), parent
+    ))
+    for name, method, columns in INDEXES[table]:
+        cursor.execute(sql.SQL("CREATE INDEX {} ON {} USING {} ({})").format(
+            sql.Identifier(name), parent, sql.SQL(method),
+            sql.SQL(', ').join(map(sql.Identifier, columns)),
+        ))
+    # matching indexes of the legacy table are attached instead of being rebuilt
+    cursor.execute(sql.SQL("ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM (MINVALUE) TO ({})")
+                   .format(parent, child, sql.Literal(bound)))
+    cursor.execute(sql.SQL("CREATE TABLE {} PARTITION OF {} DEFAULT").format(
+        sql.Identifier(f"{table}_default"), parent
+    ))
+    conn.commit()
+
+
+def migrate():
+    '''Partitions every unpartitioned log table, then creates the upcoming partitions.'''
+    next_month = partitions.add_months(partitions.current_month(), 1)
+    bound = partitions.month_bound(next_month)
+    with dbc.connection('eventlog') as conn:
+        cursor = conn.cursor()
+        for table in log.LOG_COLUMNS:
+            kind = relation_kind(cursor, table)
+            conn.commit()
+            if kind == 'p':
+                print(f"{table}: partitioned already")
+                continue
+            legacy = partitions.partition_name(table, next_month, legacy=True)
+            prepare(conn, table, legacy, bound)
+            swap(conn, table, legacy, bound)
+            print(f"{table}: existing rows attached as partition '{legacy}'")
+        for name in partitions.ensure_partitions(conn):
+            print(f"Created partition '{name}'")
+
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,184 @@
+"""
+In-place migration of the eventlog 'datetime' columns from VARCHAR ('DD/MM/YYYY HH24:MI:SS')
+to TIMESTAMPTZ, including the time-range indexes. The System can keep logging meanwhile:
+1. a shadow column 'datetime_tz' is added, filled by a trigger for newly inserted rows,
+2. the existing rows are converted in batches of --batch-size rows (one transaction each),
+3. the columns are swapped in one short transaction per table,
+4. the indexes are built concurrently.
+Deploy the new eventlog module (native timestamps) right after step 3, as clients still running
+the old module can no longer write their logs once the columns have been swapped.
+Run from the project root: python setup/eventlog_timestamp_migration.py --timezone Europe/London
+"""
+
+import argparse
+import os
+import sys
+import time
+from psycopg2 import sql
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dbconnection as dbc # pylint: disable=wrong-import-position
+import eventlog as log # pylint: disable=wrong-import-position
+
+LEGACY_FORMAT = 'DD/MM/YYYY HH24:MI:SS'
+
+# Indexes per table as (name, method, columns), matching Eventlog.sql
+INDEXES = {
+    'authlogs': [
+        ('authlogs_datetime_brin', 'brin', ('datetime',)),
+        ('authlogs_user_id_datetime_idx', 'btree', ('user_id', 'datetime')),
+    ],
+    'operationlogs': [
+        ('operationlogs_datetime_brin', 'brin', ('datetime',)),
+        ('operationlogs_user_id_datetime_idx', 'btree', ('user_id', 'datetime')),
+    ],
+    'adminlogs': [
+        ('adminlogs_datetime_brin', 'brin', ('datetime',)),
+        ('adminlogs_user_id_datetime_idx', 'btree', ('user_id', 'datetime')),
+        ('adminlogs_admin_id_datetime_idx', 'btree', ('admin_id', 'datetime')),
+    ],
+}
+
+
+def converted(column:str, timezone:str) -> sql.Composed:
+    '''Expression converting a legacy datetime string, read as wall-clock time in the timezone.'''
+    return sql.SQL("to_timestamp({column}, {fmt})::timestamp AT TIME ZONE {tz}").format(
+        column=sql.SQL(column), fmt=sql.Literal(LEGACY_FORMAT), tz=sql.Literal(timezone)
+    )
+
+
+def column_type(cursor, table:str) -> str:
+    '''Returns the data type of the datetime column of a log table.'''
+    cursor.execute(
+        "SELECT data_type FROM information_schema.columns "
+        "WHERE table_name = %s AND column_name = 'datetime'", (table,)
+    )
+    return cursor.fetchone()[0]
+
+
+def prepare(conn, table:str, timezone:str):
+    '''Adds the shadow column and the trigger that converts the datetimes of new rows.'''
+    cursor = conn.cursor()
+    cursor.execute(sql.SQL("ALTER TABLE {} ADD COLUMN IF NOT EXISTS datetime_tz TIMESTAMPTZ")
+                   .format(sql.Identifier(table)))
+    cursor.execute(sql.SQL("""
+        CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$
+        BEGIN
+            NEW.datetime_tz := {expression};
+            RETURN NEW;
+        END $$ LANGUAGE plpgsql
+        """).format(
+            function=sql.Identifier(f"{table}_datetime_tz"),
+            expression=converted('NEW.datetime', timezone),
+        ))
+    cursor.execute(sql.SQL("DROP TRIGGER IF EXISTS {trigger} ON {table}").format(
+        trigger=sql.Identifier(f"{table}_datetime_tz"), table=sql.Identifier(table)
+    ))
+    cursor.execute(sql.SQL(
+        "CREATE TRIGGER {trigger} BEFORE INSERT ON {table} "
+        "FOR EACH ROW EXECUTE PROCEDURE {function}()"
+    ).format(
+        trigger=sql.Identifier(f"{table}_datetime_tz"),
+        table=sql.Identifier(table),
+        function=sql.Identifier(f"{table}_datetime_tz"),
+    ))
+    conn.commit()
+
+
+def backfill(conn, table:str, timezone:str, batch_size:int) -> int:
+    '''Converts the existing rows in id ranges of batch_size, committing each batch.'''
+    cursor = conn.cursor()
+    cursor.execute(sql.SQL("SELECT min(id), max(id) FROM {}").format(sql.Identifier(table)))
+    low, high = cursor.fetchone()
+    conn.commit()
+    if low is None:
+        return 0
+    stmt = sql.SQL(
+        "UPDATE {table} SET datetime_tz = {expression} "
+        "WHERE id >= %s AND id < %s AND datetime_tz IS NULL"
+    ).format(table=sql.Identifier(table), expression=converted('datetime', timezone))
+    updated = 0
+    for start in range(low, high + 1, batch_size):
+        cursor.execute(stmt, (start, start + batch_size))
+        conn.commit() # short transactions keep row locks and WAL bursts small
+        updated += cursor.rowcount
+        print(f"{table}: converted rows up to id {min(start + batch_size - 1, high)} of {high}")
+    return updated
+
+
+def swap(conn, table:str, timezone:str):
+    '''Replaces the VARCHAR column with the converted column in one short transaction.'''
+    cursor = conn.cursor()
+    identifier = sql.Identifier(table)
+    cursor.execute(sql.SQL("LOCK TABLE {} IN ACCESS EXCLUSIVE MODE").format(identifier))
+    cursor.execute(
+        sql.SQL("UPDATE {table} SET datetime_tz = {expression} WHERE datetime_tz IS NULL")
+        .format(table=identifier, expression=converted('datetime', timezone))
+    )
+    cursor.execute(sql.SQL("DROP TRIGGER {trigger} ON {table}").format(
+        trigger=sql.Identifier(f"{table}_datetime_tz"), table=identifier
+    ))
+    cursor.execute(sql.SQL("DROP FUNCTION {}()").format(sql.Identifier(f"{table}_datetime_tz")))
+    cursor.execute(sql.SQL("ALTER TABLE {} DROP COLUMN datetime").format(identifier))
+    cursor.execute(
+        sql.SQL("ALTER TABLE {} RENAME COLUMN datetime_tz TO datetime").format(identifier)
+    )
+    cursor.execute(sql.SQL(
+        "ALTER TABLE {} ALTER COLUMN datetime SET NOT NULL, ALTER COLUMN datetime SET DEFAULT now()"
+    ).format(identifier))
+    conn.commit()
+
+
+def create_indexes(conn, table:str):
+    '''Builds the time-range indexes without blocking the log writers.'''
+    conn.autocommit = True # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    try:
+        cursor = conn.cursor()
+        for name, method, columns in INDEXES[table]:
+            cursor.execute(sql.SQL(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} "
+                "ON {table} USING {method} ({columns})"
+            ).format(
+                name=sql.Identifier(name),
+                table=sql.Identifier(table),
+                method=sql.SQL(method),
+                columns=sql.SQL(', ').join(map(sql.Identifier, columns)),
+            ))
+    finally:
+        conn.autocommit = False
+
+
+def migrate(timezone:str, batch_size:int):
+    '''Runs all migration steps for each log table. Finished steps are skipped on a rerun.'''
+    with dbc.connection('eventlog') as conn:
+        cursor = conn.cursor()
+        if timezone is None:
+            cursor.execute("SHOW TIME ZONE")
+            timezone = cursor.fetchone()[0]
+        conn.commit()
+        print(f"Reading the logged datetimes as local time of '{timezone}'.")
+        for table in log.LOG_COLUMNS:
+            start = time.perf_counter()
+            if column_type(cursor, table) != 'timestamp with time zone':
+                prepare(conn, table, timezone)
+                backfill(conn, table, timezone, batch_size)
+                swap(conn, table, timezone)
+            conn.commit()
+            create_indexes(conn, table)
+            print(f"{table}: migrated in {time.perf_counter() - start:.1f}s")
+
+
+def main():
+    '''Parses the arguments and runs the migration.'''
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        '--timezone', help='timezone the legacy datetimes were logged in (default: DB timezone)'
+    )
+    parser.add_argument('--batch-size', type=int, default=10000, help='rows per transaction')
+    args = parser.parse_args()
+    migrate(args.timezone, args.batch_size)
+
+
+if __name__ == '__main__':
+    main()
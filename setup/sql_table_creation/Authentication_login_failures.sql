@@ -0,0 +1,12 @@
+Authentication DB: failed logins for the login throttling (see throttling.py)
+
+
+CREATE TABLE login_failures(
+	id				BIGSERIAL PRIMARY KEY	NOT NULL,
+	username		VARCHAR(255)		NOT NULL,
+	source			VARCHAR(255)		NOT NULL,
+	attempted		TIMESTAMPTZ			NOT NULL DEFAULT now()
+);
+
+CREATE INDEX login_failures_username_idx ON login_failures (username, attempted);
+CREATE INDEX login_failures_source_idx ON login_failures (source, attempted);
@@ -0,0 +1,14 @@
+Authentication DB: session store for SESSION_STORE = 'database' (see sessions.py)
+
+
+CREATE TABLE sessions(
+	id				VARCHAR(64) PRIMARY KEY	NOT NULL,
+	user_id			INT					NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+	first_name		VARCHAR(255)		NOT NULL,
+	user_role		INT					NOT NULL,
+	username		VARCHAR(255)		NOT NULL,
+	expires			TIMESTAMPTZ			NOT NULL
+);
+
+CREATE INDEX sessions_user_id_idx ON sessions (user_id);
+CREATE INDEX sessions_expires_idx ON sessions (expires);
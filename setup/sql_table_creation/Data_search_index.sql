@@ -0,0 +1,24 @@
+-- Data DB: Search Index Migration
+-- Adds the indexes of operations.search_for_source: trigram indexes for the substring matches of
+-- the default 'like' search mode and the full-text column of the opt-in 'fulltext' mode.
+-- Safe to run on an existing database, the statements are idempotent.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Full-text search vector over name (weight A) and description (weight B)
+ALTER TABLE sources ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+	GENERATED ALWAYS AS (
+		setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+		setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+	) STORED;
+
+CREATE INDEX IF NOT EXISTS sources_search_vector_idx ON sources USING GIN (search_vector);
+
+-- Trigram indexes for substring matches via lower(column) LIKE '%term%'
+CREATE INDEX IF NOT EXISTS sources_url_trgm_idx ON sources USING GIN (lower(url) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS sources_name_trgm_idx ON sources USING GIN (lower(name) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS sources_description_trgm_idx
+	ON sources USING GIN (lower(description) gin_trgm_ops);
+
+-- Equality search on the threat level
+CREATE INDEX IF NOT EXISTS sources_threat_level_idx ON sources (threat_level);
@@ -0,0 +1,58 @@
+-- Data DB: Source Statistics Migration
+-- Adds the 'source_stats' summary table (number of sources per threat level and creation month)
+-- and the triggers that keep it up to date with every insert, update and delete on 'sources'.
+-- Run on an existing database, then fill the table: python source_stats.py --repair
+-- Requires PostgreSQL 10 or newer (statement triggers with transition tables).
+
+CREATE TABLE IF NOT EXISTS source_stats (
+	threat_level	INT		NOT NULL,
+	creation_month	DATE	NOT NULL,
+	sources			BIGINT	NOT NULL,
+	PRIMARY KEY (threat_level, creation_month)
+);
+
+-- Applies the changed rows of one statement as one aggregated delta per (threat level, month),
+-- so a bulk insert of thousands of sources only touches a few summary rows.
+CREATE OR REPLACE FUNCTION source_stats_apply() RETURNS trigger AS $$
+BEGIN
+	IF TG_OP = 'INSERT' THEN
+		INSERT INTO source_stats (threat_level, creation_month, sources)
+		SELECT threat_level, date_trunc('month', creation_date)::date, count(*)
+		FROM new_rows GROUP BY 1, 2
+		ON CONFLICT (threat_level, creation_month)
+		DO UPDATE SET sources = source_stats.sources + EXCLUDED.sources;
+	ELSIF TG_OP = 'DELETE' THEN
+		INSERT INTO source_stats (threat_level, creation_month, sources)
+		SELECT threat_level, date_trunc('month', creation_date)::date, -count(*)
+		FROM old_rows GROUP BY 1, 2
+		ON CONFLICT (threat_level, creation_month)
+		DO UPDATE SET sources = source_stats.sources + EXCLUDED.sources;
+	ELSE
+		INSERT INTO source_stats (threat_level, creation_month, sources)
+		SELECT threat_level, creation_month, sum(delta) FROM (
+			SELECT threat_level, date_trunc('month', creation_date)::date AS creation_month,
+				1 AS delta FROM new_rows
+			UNION ALL
+			SELECT threat_level, date_trunc('month', creation_date)::date, -1 FROM old_rows
+		) changes
+		GROUP BY 1, 2 HAVING sum(delta) <> 0 -- e.g. updates of the name change nothing
+		ON CONFLICT (threat_level, creation_month)
+		DO UPDATE SET sources = source_stats.sources + EXCLUDED.sources;
+	END IF;
+	RETURN NULL;
+END $$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS source_stats_insert ON sources;
+CREATE TRIGGER source_stats_insert AFTER INSERT ON sources
+	REFERENCING NEW TABLE AS new_rows
+	FOR EACH STATEMENT EXECUTE PROCEDURE source_stats_apply();
+
+DROP TRIGGER IF EXISTS source_stats_update ON sources;
+CREATE TRIGGER source_stats_update AFTER UPDATE ON sources
+	REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+	FOR EACH STATEMENT EXECUTE PROCEDURE source_stats_apply();
+
+DROP TRIGGER IF EXISTS source_stats_delete ON sources;
+CREATE TRIGGER source_stats_delete AFTER DELETE ON sources
+	REFERENCING OLD TABLE AS old_rows
+	FOR EACH STATEMENT EXECUTE PROCEDURE source_stats_apply();
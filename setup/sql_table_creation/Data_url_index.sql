@@ -0,0 +1,8 @@
+-- Data DB: Url Index Migration
+-- B-tree index on the exact url, used to deduplicate threat feeds against existing sources
+-- during the bulk ingestion (ingestion.py). Safe to run on an existing database.
+-- The index is not unique, as existing data and single source creations may repeat a url; the
+-- ingestion instead serialises its inserts with an advisory lock (operations.create_sources_bulk),
+-- so concurrent ingestions skip the urls created by each other.
+
+CREATE INDEX IF NOT EXISTS sources_url_idx ON sources (url);
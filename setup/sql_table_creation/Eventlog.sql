@@ -1,32 +1,57 @@
 Eventlog DB:
 
+-- The log tables are partitioned by month (PostgreSQL 11 or newer). The monthly partitions
+-- are created by "python partitions.py" (run daily); rows outside of all monthly partitions
+-- are kept in the default partition until their partition is created.
+-- (existing databases with VARCHAR datetimes: run setup/eventlog_timestamp_migration.py,
+-- existing unpartitioned tables: run setup/eventlog_partition_migration.py)
+
 CREATE TABLE AuthLogs(
-   id SERIAL PRIMARY KEY     		NOT NULL, 
-   datetime       VARCHAR(255)    	NOT NULL,
+   id SERIAL     		NOT NULL, 
+   datetime       TIMESTAMPTZ    	NOT NULL DEFAULT now(),
    operation      VARCHAR(255)      NOT NULL,
-   user_id 		  INT				NOT NULL
-);
+   user_id 		  INT				NOT NULL,
+   PRIMARY KEY (id, datetime)
+) PARTITION BY RANGE (datetime);
 
 
     CREATE TABLE OperationLogs(
-   id SERIAL PRIMARY KEY     			NOT NULL, 
-   datetime       		VARCHAR(255)    NOT NULL,
+   id SERIAL     			NOT NULL, 
+   datetime       		TIMESTAMPTZ     NOT NULL DEFAULT now(),
    operation      		VARCHAR(255)    NOT NULL,
    user_id 		 		INT				NOT NULL,
    source_id 	  		INT				NOT NULL,
    modified_attribute	VARCHAR(255),
    old_value			VARCHAR(500),
-   new_value			VARCHAR(500)
-);
+   new_value			VARCHAR(500),
+   PRIMARY KEY (id, datetime)
+) PARTITION BY RANGE (datetime);
 
 
 CREATE TABLE AdminLogs(
-   id SERIAL PRIMARY KEY     			NOT NULL, 
-   datetime       		VARCHAR(255)    NOT NULL,
+   id SERIAL     			NOT NULL, 
+   datetime       		TIMESTAMPTZ     NOT NULL DEFAULT now(),
    operation      		VARCHAR(255)    NOT NULL,
    admin_id 		 	INT				NOT NULL,
    user_id 	  			INT				NOT NULL,
    modified_attribute	VARCHAR(255),	
    old_value			VARCHAR(255),	
-   new_value			VARCHAR(255)
-);
+   new_value			VARCHAR(255),
+   PRIMARY KEY (id, datetime)
+) PARTITION BY RANGE (datetime);
+
+
+CREATE TABLE authlogs_default PARTITION OF authlogs DEFAULT;
+CREATE TABLE operationlogs_default PARTITION OF operationlogs DEFAULT;
+CREATE TABLE adminlogs_default PARTITION OF adminlogs DEFAULT;
+
+
+-- Time-range indexes: BRIN on the append-only datetime, B-tree for per-user lookups
+-- (created on every partition automatically)
+CREATE INDEX authlogs_datetime_brin ON authlogs USING brin (datetime);
+CREATE INDEX authlogs_user_id_datetime_idx ON authlogs (user_id, datetime);
+CREATE INDEX operationlogs_datetime_brin ON operationlogs USING brin (datetime);
+CREATE INDEX operationlogs_user_id_datetime_idx ON operationlogs (user_id, datetime);
+CREATE INDEX adminlogs_datetime_brin ON adminlogs USING brin (datetime);
+CREATE INDEX adminlogs_user_id_datetime_idx ON adminlogs (user_id, datetime);
+CREATE INDEX adminlogs_admin_id_datetime_idx ON adminlogs (admin_id, datetime);
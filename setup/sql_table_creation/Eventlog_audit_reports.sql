@@ -0,0 +1,38 @@
+-- Eventlog DB: Audit Query Indexes and Report Views
+-- Adds the indexes used by the filtered log queries of audit.py and the pre-aggregated
+-- report views. Run after Eventlog.sql; safe to run on an existing database.
+-- Refresh the report views regularly (e.g. hourly via cron) as their owner: python audit.py --refresh
+
+-- Unfiltered and time-range pages, newest first (ORDER BY datetime DESC, id DESC LIMIT n):
+-- read backwards from the newest partition instead of scanning and sorting all rows
+CREATE INDEX IF NOT EXISTS authlogs_datetime_id_idx ON authlogs (datetime, id);
+CREATE INDEX IF NOT EXISTS operationlogs_datetime_id_idx ON operationlogs (datetime, id);
+CREATE INDEX IF NOT EXISTS adminlogs_datetime_id_idx ON adminlogs (datetime, id);
+
+-- Filtered queries by source and by operation over time
+-- (per-user and time-range indexes are created by Eventlog.sql)
+CREATE INDEX IF NOT EXISTS operationlogs_source_id_datetime_idx ON operationlogs (source_id, datetime);
+CREATE INDEX IF NOT EXISTS operationlogs_operation_datetime_idx ON operationlogs (operation, datetime);
+CREATE INDEX IF NOT EXISTS authlogs_operation_datetime_idx ON authlogs (operation, datetime);
+CREATE INDEX IF NOT EXISTS adminlogs_operation_datetime_idx ON adminlogs (operation, datetime);
+
+-- Report: views per source per day (UTC)
+CREATE MATERIALIZED VIEW IF NOT EXISTS source_views_daily AS
+	SELECT source_id, (datetime AT TIME ZONE 'UTC')::date AS day, count(*) AS views
+	FROM operationlogs
+	WHERE operation = 'View Source'
+	GROUP BY source_id, day;
+
+-- the unique index allows REFRESH MATERIALIZED VIEW CONCURRENTLY (reads are not blocked)
+CREATE UNIQUE INDEX IF NOT EXISTS source_views_daily_key ON source_views_daily (source_id, day);
+CREATE INDEX IF NOT EXISTS source_views_daily_day_idx ON source_views_daily (day);
+
+-- Report: failed logins per user per day (UTC)
+CREATE MATERIALIZED VIEW IF NOT EXISTS failed_logins_daily AS
+	SELECT user_id, (datetime AT TIME ZONE 'UTC')::date AS day, count(*) AS attempts
+	FROM authlogs
+	WHERE operation LIKE 'Failed Login%'
+	GROUP BY user_id, day;
+
+CREATE UNIQUE INDEX IF NOT EXISTS failed_logins_daily_key ON failed_logins_daily (user_id, day);
+CREATE INDEX IF NOT EXISTS failed_logins_daily_day_idx ON failed_logins_daily (day);
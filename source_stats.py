@@ -0,0 +1,85 @@
+"""
+Reconciliation job for the source_stats summary table (see Data_source_stats.sql).
+Recounts the sources per threat level and creation month from scratch and compares the result
+with the incrementally maintained table. With --repair, the table is rebuilt from the recount.
+Run with: python source_stats.py [--repair]
+"""
+
+import argparse
+import sys
+import psycopg2
+import dbconnection as dbc
+
+RED = '\033[91m' # Error Messages
+GREEN = '\033[92m' # Success Messages
+YELLOW = '\033[93m' # Notices to User
+
+RECOUNT = """
+    SELECT threat_level, date_trunc('month', creation_date)::date, count(*)
+    FROM sources GROUP BY 1, 2
+    """
+
+
+def differences(cursor) -> list:
+    '''
+    Compares the summary table with a full recount of the sources table.
+    Returns a list of (threat level, creation month, stored count, recounted count) tuples
+    for every group that differs.
+    '''
+    cursor.execute(RECOUNT)
+    recounted = {(row[0], row[1]): row[2] for row in cursor.fetchall()}
+    cursor.execute("SELECT threat_level, creation_month, sources FROM source_stats")
+    stored = {(row[0], row[1]): row[2] for row in cursor.fetchall()}
+    return sorted(
+        key + (stored.get(key, 0), recounted.get(key, 0))
+        for key in set(recounted) | set(stored)
+        if stored.get(key, 0) != recounted.get(key, 0)
+    )
+
+
+def reconcile(repair:bool=False) -> list:
+    '''
+    Verifies the summary table and, if repair is set, rebuilds it from the recount.
+    The sources table is locked against writes meanwhile (reads are not blocked),
+    so the triggers cannot change the table between the recount and the rebuild.
+    Returns the list of differences found (see differences) or None if the job failed.
+    '''
+    with dbc.connection('data') as conn:
+        cursor = conn.cursor()
+        try:
+            if repair:
+                cursor.execute("LOCK TABLE sources IN SHARE MODE")
+            found = differences(cursor)
+            if repair and found:
+                cursor.execute("DELETE FROM source_stats")
+                cursor.execute("INSERT INTO source_stats (threat_level, creation_month, sources)"
+                               + RECOUNT)
+            conn.commit()
+        except psycopg2.Error as error:
+            print(RED + 'Issue with reconciling the source statistics. Error:', error)
+            return None
+    return found
+
+
+def main() -> int:
+    '''Parses the arguments and runs the reconciliation.'''
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repair', action='store_true', help='rebuild the summary table')
+    args = parser.parse_args()
+    found = reconcile(args.repair)
+    if found is None:
+        return 1
+    for threat_level, month, stored, recounted in found:
+        print(YELLOW + f"Threat level {threat_level}, {month:%Y-%m}: "
+              f"{stored} stored, {recounted} counted")
+    if not found:
+        print(GREEN + "The source statistics are consistent.")
+        return 0
+    if args.repair:
+        print(GREEN + f"Rebuilt the source statistics ({len(found)} groups corrected).")
+        return 0
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,5 @@
+"""Unit tests of the Suspect Sources System, run from the project root: python -m unittest"""
+
+import settings
+
+settings.METRICS_DUMP_INTERVAL = 0 # the tests record metrics but never write dump files
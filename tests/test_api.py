@@ -0,0 +1,143 @@
+"""Unit tests of the routing and error mapping of the HTTP API, with the operations mocked."""
+
+import asyncio
+import io
+import json
+import unittest
+from contextlib import redirect_stderr
+from types import SimpleNamespace
+from unittest import mock
+import psycopg2
+import psycopg2.pool
+import api
+import hashing
+
+SPECIALIST = SimpleNamespace(uid=7, first_name='Jane', role=2)
+AUTHORITY = SimpleNamespace(uid=8, first_name='John', role=3)
+HEADERS = {'authorization': 'Bearer token'}
+
+
+class ClientAddressTest(unittest.TestCase):
+    """Client addresses behind trusted reverse proxies."""
+
+    def test_untrusted_peer(self):
+        headers = {'x-forwarded-for': '10.0.0.9'}
+        with mock.patch.object(api.settings, 'API_TRUSTED_PROXIES', ()):
+            self.assertEqual(api.client_address('192.0.2.1', headers), '192.0.2.1')
+
+    def test_trusted_proxy(self):
+        headers = {'x-forwarded-for': '10.0.0.9, 198.51.100.7, 127.0.0.1'}
+        with mock.patch.object(api.settings, 'API_TRUSTED_PROXIES', ('127.0.0.1',)):
+            self.assertEqual(api.client_address('127.0.0.1', headers), '198.51.100.7')
+            self.assertEqual(api.client_address('127.0.0.1', {}), '127.0.0.1')
+
+
+class ReadRequestTest(unittest.TestCase):
+    """Parsing of the request line, headers and body."""
+
+    @staticmethod
+    def read(data:bytes, eof:bool=True):
+        async def run():
+            reader = asyncio.StreamReader()
+            reader.feed_data(data)
+            if eof:
+                reader.feed_eof()
+            return await api.APIServer.read_request(reader)
+        return asyncio.run(run())
+
+    def test_request(self):
+        request = self.read(b'POST /login HTTP/1.1\r\nContent-Length: 2\r\n\r\n{}')
+        self.assertEqual(request, ('POST', '/login', {'content-length': '2'}, b'{}'))
+
+    def test_negative_content_length(self):
+        with self.assertRaises(api.HTTPError) as raised:
+            self.read(b'POST /login HTTP/1.1\r\nContent-Length: -5\r\n\r\n')
+        self.assertEqual(raised.exception.status, 400)
+
+    def test_client_that_stops_sending_headers_is_dropped(self):
+        with mock.patch.object(api.settings, 'API_KEEPALIVE_TIMEOUT', 0.05):
+            self.assertIsNone(self.read(b'GET /metrics HTTP/1.1\r\nHost: x', eof=False))
+
+
+class DispatchTest(unittest.TestCase):
+    """Requests are routed to the commands and all errors are answered with a status."""
+
+    def setUp(self):
+        self.server = api.APIServer(workers=1)
+        self.addCleanup(self.server.shutdown)
+        self.settings = mock.patch.object(api.settings, 'SESSION_STORE', 'memory')
+        self.settings.start()
+        self.addCleanup(self.settings.stop)
+
+    def dispatch(self, method:str, target:str, body:dict=None, user=SPECIALIST,
+                 headers:dict=None) -> tuple:
+        data = json.dumps(body).encode('utf-8') if body is not None else b''
+        with mock.patch.object(api.sessions, 'resolve', return_value=user), \
+                redirect_stderr(io.StringIO()):
+            return asyncio.run(self.server.dispatch(
+                method, target, HEADERS if headers is None else headers, data, 'api@test'
+            ))
+
+    def handler(self, command:str, **kwargs):
+        return mock.patch.dict(api.commands.HANDLERS, {command: mock.Mock(**kwargs)})
+
+    def test_routes_to_the_command(self):
+        result = {'sources': [], 'has_next': False}
+        with self.handler('search', return_value=result):
+            status, payload = self.dispatch('GET', '/sources/search?field=url&term=abc')
+            args, uid = api.commands.HANDLERS['search'].call_args[0]
+        self.assertEqual((status, payload), (200, result))
+        self.assertEqual((args.field, args.term, uid), ('url', 'abc', 7))
+
+    def test_client_errors(self):
+        self.assertEqual(self.dispatch('GET', '/sources/1', headers={})[0], 401)
+        self.assertEqual(self.dispatch('GET', '/nothing')[0], 404)
+        self.assertEqual(self.dispatch('DELETE', '/sources/1')[0], 405)
+        self.assertEqual(self.dispatch('POST', '/sources', {'name': 'x'}, AUTHORITY)[0], 403)
+        self.assertEqual(self.dispatch('GET', '/sources/search?field=size&term=1')[0], 400)
+
+    def test_fields_of_the_wrong_type_are_client_errors(self):
+        source = {'name': 12345, 'url': 'https://example.com', 'threat_level': 3,
+                  'description': ['an', 'example']}
+        status, payload = self.dispatch('POST', '/sources', source)
+        self.assertEqual(status, 400)
+        self.assertIn('name, description', payload['error'])
+        user = {'first_name': 'Jane', 'last_name': 'Doe', 'email': 7, 'dob': '01/01/1990',
+                'role': 2}
+        admin = SimpleNamespace(uid=1, first_name='Ann', role=1)
+        self.assertEqual(self.dispatch('POST', '/users', user, admin)[0], 400)
+
+    def test_invalid_threat_level_term_is_a_client_error(self):
+        with mock.patch.object(api.commands.ops, 'search_page') as search_page:
+            status, _ = self.dispatch('GET', '/sources/search?field=threat_level&term=abc')
+        self.assertEqual(status, 400)
+        search_page.assert_not_called()
+
+    def test_command_errors(self):
+        with self.handler('source show', side_effect=api.commands.NotFoundError('gone')):
+            self.assertEqual(self.dispatch('GET', '/sources/3')[0], 404)
+        with self.handler('source show', side_effect=api.commands.CommandError('bad')):
+            self.assertEqual(self.dispatch('GET', '/sources/3')[0], 400)
+
+    def test_unavailable_database_or_pool(self):
+        for error in (hashing.PoolBusyError('busy'), psycopg2.pool.PoolError('exhausted'),
+                      psycopg2.OperationalError('server closed the connection')):
+            with self.handler('source show', side_effect=error):
+                self.assertEqual(self.dispatch('GET', '/sources/3')[0], 503)
+
+    def test_unexpected_errors(self):
+        for error in (IndexError('list index out of range'), psycopg2.DataError('bad value')):
+            with self.handler('source show', side_effect=error):
+                status, payload = self.dispatch('GET', '/sources/3')
+            self.assertEqual((status, payload), (500, {'error': "internal server error"}))
+
+    def test_modify_of_a_deleted_source(self):
+        source = (3, 'Example Source', 'https://example.com', 3, 'An example source')
+        with mock.patch.object(api.commands.ops, 'get_source_by_id', side_effect=[source, None]), \
+                mock.patch.object(api.commands.ops, 'modify_source', return_value=False):
+            status, _ = self.dispatch('PATCH', '/sources/3', {'field': 'name', 'value': 'Renamed'})
+        self.assertEqual(status, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+"""Unit tests of the audit log queries of the audit module, with the database mocked."""
+
+import unittest
+from datetime import date, datetime, timezone
+from unittest import mock
+import audit
+
+
+class QueryLogsTest(unittest.TestCase):
+    """Filters, date ranges and keyset pages of query_logs."""
+
+    def setUp(self):
+        patcher = mock.patch.object(audit, 'fetch')
+        self.fetch = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.fetch.return_value = []
+
+    def statement(self) -> str:
+        return repr(self.fetch.call_args[0][0])
+
+    def test_first_page_is_ordered_newest_first(self):
+        audit.query_logs('authlogs', page_size=20)
+        stmt = self.statement()
+        self.assertIn('ORDER BY datetime DESC, id DESC LIMIT ', stmt)
+        self.assertIn('Literal(21)', stmt) # one extra row detects the next page
+        self.assertNotIn(' WHERE ', stmt)
+
+    def test_next_page_continues_after_the_last_entry(self):
+        last = (datetime(2021, 3, 1, 10, tzinfo=timezone.utc), 42)
+        audit.query_logs('operationlogs', {'source_id': 7}, before=last)
+        stmt = self.statement()
+        self.assertIn("(datetime, id) < (", stmt)
+        self.assertIn('Literal(42)', stmt)
+        self.assertIn("Identifier('source_id')", stmt)
+
+    def test_until_includes_the_whole_day(self):
+        audit.query_logs('adminlogs', since=date(2021, 3, 1), until=date(2021, 3, 31))
+        stmt = self.statement()
+        self.assertIn('Literal(datetime.date(2021, 3, 1))', stmt)
+        self.assertIn('Literal(datetime.date(2021, 4, 1))', stmt)
+
+    def test_has_next_page(self):
+        self.fetch.return_value = [(number,) for number in range(3)]
+        self.assertEqual(audit.query_logs('authlogs', page_size=2), ([(0,), (1,)], True))
+        self.fetch.return_value = [(0,), (1,)]
+        self.assertEqual(audit.query_logs('authlogs', page_size=2), ([(0,), (1,)], False))
+
+    def test_failed_query_returns_none(self):
+        self.fetch.return_value = None
+        self.assertIsNone(audit.query_logs('authlogs'))
+
+    def test_unknown_filter_is_rejected(self):
+        with self.assertRaises(ValueError):
+            audit.query_logs('authlogs', {'source_id': 7})
+
+
+if __name__ == '__main__':
+    unittest.main()
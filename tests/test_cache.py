@@ -0,0 +1,69 @@
+"""Unit tests of the LRU/TTL cache of the cache module."""
+
+import unittest
+from unittest import mock
+import cache
+
+
+class LRUCacheTest(unittest.TestCase):
+    """Size bound, expiry, counters and invalidation of the LRUCache."""
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch.object(cache.time, 'monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_get_returns_cached_values(self):
+        lru = cache.LRUCache(2, 60)
+        self.assertIs(lru.get('a'), cache.MISSING)
+        lru.put('a', 1)
+        self.assertEqual(lru.get('a'), 1)
+        self.assertEqual(lru.stats()['hits'], 1)
+        self.assertEqual(lru.stats()['misses'], 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        lru = cache.LRUCache(2, 60)
+        lru.put('a', 1)
+        lru.put('b', 2)
+        lru.get('a') # 'b' is now the least recently used entry
+        lru.put('c', 3)
+        self.assertIs(lru.get('b'), cache.MISSING)
+        self.assertEqual((lru.get('a'), lru.get('c')), (1, 3))
+        self.assertEqual(lru.stats()['evictions'], 1)
+
+    def test_entries_expire_after_the_ttl(self):
+        lru = cache.LRUCache(2, 60)
+        lru.put('a', 1)
+        self.now += 59
+        self.assertEqual(lru.get('a'), 1)
+        self.now += 1
+        self.assertIs(lru.get('a'), cache.MISSING)
+        self.assertEqual(lru.stats()['size'], 0)
+
+    def test_size_zero_disables_the_cache(self):
+        lru = cache.LRUCache(0, 60)
+        lru.put('a', 1)
+        self.assertIs(lru.get('a'), cache.MISSING)
+
+    def test_invalidate_and_clear(self):
+        lru = cache.LRUCache(3, 60)
+        lru.put('a', 1)
+        lru.put('b', 2)
+        lru.invalidate('a')
+        self.assertIs(lru.get('a'), cache.MISSING)
+        lru.clear()
+        self.assertIs(lru.get('b'), cache.MISSING)
+
+    def test_put_is_skipped_after_a_concurrent_invalidation(self):
+        lru = cache.LRUCache(3, 60)
+        generation = lru.generation()
+        lru.invalidate('a') # e.g. a modification while the old value was being read
+        lru.put('a', 'stale', generation)
+        self.assertIs(lru.get('a'), cache.MISSING)
+        lru.put('a', 'fresh', lru.generation())
+        self.assertEqual(lru.get('a'), 'fresh')
+
+
+if __name__ == '__main__':
+    unittest.main()
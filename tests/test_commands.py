@@ -0,0 +1,104 @@
+"""Unit tests of the command mode, with the operations and the authentication mocked."""
+
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+from unittest import mock
+import psycopg2
+import commands
+import hashing
+
+SPECIALIST = (7, 'Jane', 2)
+SOURCE = (3, 'Example Source', 'https://example.com', 3, 'An example source')
+
+
+class CommandTest(unittest.TestCase):
+    """Validation of the arguments and conversion of the errors of the operations."""
+
+    def setUp(self):
+        self.parser = commands.build_parser()
+
+    def execute(self, argv:list) -> dict:
+        with redirect_stderr(io.StringIO()):
+            return commands.execute(self.parser, argv, SPECIALIST)
+
+    def test_search_rejects_non_numeric_threat_level(self):
+        with mock.patch.object(commands.ops, 'search_page') as search_page:
+            with self.assertRaises(commands.CommandError):
+                self.execute(['search', '--field', 'threat_level', '--term', 'abc'])
+        search_page.assert_not_called()
+
+    def test_search_limit_is_bounded(self):
+        for value in ('0', '-5', '101', 'ten'):
+            with self.assertRaises(commands.CommandError):
+                self.execute(['search', '--field', 'url', '--term', 'x', '--limit', value])
+
+    def test_help_raises_instead_of_exiting(self):
+        with self.assertRaises(commands.HelpRequested) as raised:
+            self.execute(['search', '--help'])
+        self.assertIn('--limit', str(raised.exception))
+
+    def test_main_prints_the_help(self):
+        stdout = io.StringIO()
+        with redirect_stdout(stdout):
+            self.assertEqual(commands.main(['source', 'show', '--help']), commands.EXIT_OK)
+        self.assertIn('usage:', stdout.getvalue())
+
+    def test_modify_applies_the_source_length_rules(self):
+        with mock.patch.object(commands.ops, 'get_source_by_id', return_value=SOURCE), \
+                mock.patch.object(commands.ops, 'modify_source') as modify_source:
+            for field, value in (('name', 'abc'), ('description', 'x' * 501),
+                                 ('url', 'not a url'), ('threat_level', '9')):
+                with self.assertRaises(commands.CommandError):
+                    self.execute(['source', 'modify', '3', '--field', field, '--value', value])
+        modify_source.assert_not_called()
+
+    def test_modify_converts_the_threat_level(self):
+        with mock.patch.object(commands.ops, 'get_source_by_id', return_value=SOURCE), \
+                mock.patch.object(commands.ops, 'modify_source', return_value=True) as modify:
+            self.execute(['source', 'modify', '3', '--field', 'threat_level', '--value', '4'])
+        modify.assert_called_once_with(3, 'threat_level', 4, SPECIALIST[0])
+
+    def test_operation_errors_become_command_errors(self):
+        for error in (psycopg2.OperationalError('server closed the connection'),
+                      hashing.PoolBusyError('busy'), KeyError('boom')):
+            with mock.patch.object(commands.ops, 'get_source_by_id', side_effect=error):
+                with self.assertRaises(commands.CommandError):
+                    self.execute(['source', 'show', '3'])
+
+
+class BatchTest(unittest.TestCase):
+    """Batch mode reports every line and continues after failed commands."""
+
+    def test_batch_continues_after_a_failing_command(self):
+        lines = [['source', 'show', '3'], ['source', 'show', '--help'], ['source', 'show', '4'],
+                 'not a list']
+        results = {3: psycopg2.OperationalError('connection lost'), 4: SOURCE}
+
+        def get_source_by_id(source_id):
+            result = results[source_id]
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'commands.jsonl')
+            with open(path, 'w') as file:
+                file.writelines(json.dumps(line) + '\n' for line in lines)
+            stdout = io.StringIO()
+            lookup = mock.patch.object(commands.ops, 'get_source_by_id',
+                                       side_effect=get_source_by_id)
+            with lookup, mock.patch.object(commands.log, 'operation_log'), \
+                    redirect_stdout(stdout), redirect_stderr(io.StringIO()):
+                status = commands.run_batch(commands.build_parser(), path, SPECIALIST)
+        payloads = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual(status, commands.EXIT_FAILED)
+        self.assertEqual([payload['ok'] for payload in payloads], [False, False, True, False])
+        self.assertIn('database error', payloads[0]['error'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+"""Unit tests of the connection pool of the dbconnection module, with fake connections."""
+
+import unittest
+from unittest import mock
+import psycopg2
+import psycopg2.pool
+from psycopg2 import extensions
+import dbconnection as dbc
+
+
+class FakeConnection:
+    """Stands in for a psycopg2 connection."""
+
+    def __init__(self, status=extensions.TRANSACTION_STATUS_IDLE):
+        self.closed = 0
+        self.status = status
+        self.rolled_back = False
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.rolled_back = True
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    """Checkout, checkin and eviction of the ConnectionPool."""
+
+    def setUp(self):
+        self.opened = []
+        patcher = mock.patch.object(dbc, 'establish_connection', side_effect=self.connect)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def connect(self, db_name):
+        conn = FakeConnection()
+        self.opened.append((db_name, conn))
+        return conn
+
+    @staticmethod
+    def pool(**kwargs):
+        options = {'min_size': 1, 'max_size': 2, 'idle_timeout': 300, 'ping_interval': 30,
+                   'checkout_timeout': 0.05}
+        options.update(kwargs)
+        return dbc.ConnectionPool('data', **options)
+
+    def test_checkout_opens_and_reuses_connections(self):
+        pool = self.pool()
+        conn = pool.checkout()
+        pool.checkin(conn)
+        self.assertIs(pool.checkout(), conn)
+        self.assertEqual(self.opened, [('data', conn)])
+
+    def test_checkout_times_out_when_exhausted(self):
+        pool = self.pool(max_size=1)
+        pool.checkout()
+        with self.assertRaises(psycopg2.pool.PoolError):
+            pool.checkout()
+
+    def test_failed_connect_frees_the_slot(self):
+        pool = self.pool(max_size=1)
+        with mock.patch.object(dbc, 'establish_connection', return_value=None):
+            with self.assertRaises(psycopg2.OperationalError):
+                pool.checkout()
+        self.assertIsNotNone(pool.checkout())
+
+    def test_checkin_rolls_back_open_transactions(self):
+        pool = self.pool()
+        conn = pool.checkout()
+        conn.status = extensions.TRANSACTION_STATUS_INTRANS
+        pool.checkin(conn)
+        self.assertTrue(conn.rolled_back)
+        self.assertIs(pool.checkout(), conn)
+
+    def test_checkin_closes_broken_connections(self):
+        pool = self.pool()
+        conn = pool.checkout()
+        conn.status = extensions.TRANSACTION_STATUS_UNKNOWN
+        pool.checkin(conn)
+        self.assertTrue(conn.closed)
+        self.assertIsNot(pool.checkout(), conn)
+
+    def test_connection_context_returns_connection(self):
+        pool = self.pool(max_size=1)
+        with pool.connection() as conn:
+            pass
+        with pool.connection() as again:
+            self.assertIs(again, conn)
+
+    def test_idle_connections_above_minimum_are_evicted(self):
+        pool = self.pool(min_size=1, idle_timeout=10)
+        first, second = pool.checkout(), pool.checkout()
+        with mock.patch.object(dbc.time, 'monotonic', return_value=1000.0):
+            pool.checkin(first)
+            pool.checkin(second)
+        with mock.patch.object(dbc.time, 'monotonic', return_value=1011.0):
+            pool._evict_idle() #pylint: disable=protected-access
+        self.assertTrue(first.closed)
+        self.assertFalse(second.closed)
+
+    def test_stale_idle_connection_is_pinged_and_replaced(self):
+        pool = self.pool(ping_interval=0)
+        conn = pool.checkout()
+        pool.checkin(conn)
+        conn.cursor = mock.Mock(side_effect=psycopg2.OperationalError)
+        replacement = pool.checkout()
+        self.assertIsNot(replacement, conn)
+        self.assertTrue(conn.closed)
+
+
+if __name__ == '__main__':
+    unittest.main()
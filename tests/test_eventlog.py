@@ -0,0 +1,151 @@
+"""Unit tests of the batching, spilling and quarantine of the event log writer."""
+
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout, redirect_stderr
+from unittest import mock
+import psycopg2
+import psycopg2.pool
+import eventlog
+
+
+def entry(number:int, table:str='authlogs') -> tuple:
+    '''Returns a (table, row) pair of a log entry.'''
+    return (table, ('2021-03-01T10:00:00+00:00', 'Successful Login', number))
+
+
+class FakeDatabase:
+    """Replaces LogWriter._insert: records the written entries and rejects chosen ones."""
+
+    def __init__(self):
+        self.rows = []
+        self.calls = 0
+        self.down = False
+        self.rejected = set() # user ids whose rows raise a DataError
+
+    def insert(self, entries:list):
+        self.calls += 1
+        if self.down:
+            raise psycopg2.OperationalError('server closed the connection')
+        if any(row[2] in self.rejected for _, row in entries):
+            raise psycopg2.DataError('value too long for type character varying(500)')
+        self.rows.extend(entries)
+
+
+class LogWriterTest(unittest.TestCase):
+    """Batches, spill and replay, quarantine and file errors of the LogWriter."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.spill_file = os.path.join(directory.name, 'spill.jsonl')
+        self.quarantine_file = os.path.join(directory.name, 'quarantine.jsonl')
+        self.database = FakeDatabase()
+        self.writer = eventlog.LogWriter(batch_size=10, flush_interval=0.05,
+                                         spill_file=self.spill_file,
+                                         quarantine_file=self.quarantine_file)
+        patcher = mock.patch.object(self.writer, '_insert', side_effect=self.database.insert)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        output = redirect_stdout(io.StringIO())
+        output.__enter__()
+        self.addCleanup(output.__exit__, None, None, None)
+
+    def read(self, filename:str) -> list:
+        with open(filename) as file:
+            return [json.loads(line) for line in file]
+
+    def written_ids(self) -> list:
+        return sorted(row[2] for _, row in self.database.rows)
+
+    def test_entries_are_written_in_batches(self):
+        for number in range(25):
+            self.writer.submit('authlogs', entry(number)[1])
+        self.writer.flush()
+        self.writer.shutdown()
+        self.assertEqual(self.written_ids(), list(range(25)))
+        self.assertLessEqual(self.database.calls, 5)
+
+    def test_unavailable_database_spills_and_replays(self):
+        self.database.down = True
+        self.writer._write([entry(1), entry(2)]) #pylint: disable=protected-access
+        self.assertEqual([record['row'][2] for record in self.read(self.spill_file)], [1, 2])
+        self.database.down = False
+        self.writer._write([entry(3)]) #pylint: disable=protected-access
+        self.assertEqual(self.written_ids(), [1, 2, 3])
+        self.assertFalse(os.path.exists(self.spill_file))
+
+    def test_replay_files_of_ended_processes_are_replayed(self):
+        orphan = f"{self.spill_file}.999999.replay"
+        running = f"{self.spill_file}.{os.getpid()}.7.replay"
+        for filename, number in ((orphan, 1), (running, 2)):
+            with open(filename, 'w') as file:
+                file.write(json.dumps({'table': 'authlogs', 'row': list(entry(number)[1])}) + '\n')
+        with mock.patch.object(eventlog.metrics, 'pid_alive',
+                               side_effect=lambda pid: pid == os.getpid()):
+            self.writer._write([entry(3)]) #pylint: disable=protected-access
+        self.assertEqual(self.written_ids(), [1, 3])
+        self.assertFalse(os.path.exists(orphan))
+        self.assertTrue(os.path.exists(running)) # still being replayed by a running process
+
+    def test_pool_error_is_transient(self):
+        with mock.patch.object(self.writer, '_insert',
+                               side_effect=psycopg2.pool.PoolError('exhausted')):
+            self.writer._write([entry(1)]) #pylint: disable=protected-access
+        self.assertEqual(len(self.read(self.spill_file)), 1)
+
+    def test_rejected_entries_are_quarantined(self):
+        self.database.rejected = {3, 6}
+        self.writer._write([entry(number) for number in range(8)]) #pylint: disable=protected-access
+        self.assertEqual(self.written_ids(), [0, 1, 2, 4, 5, 7])
+        quarantined = self.read(self.quarantine_file)
+        self.assertEqual([record['row'][2] for record in quarantined], [3, 6])
+        self.assertIn('character varying', quarantined[0]['error'])
+        self.assertFalse(os.path.exists(self.spill_file))
+        self.writer._write([entry(8)]) #pylint: disable=protected-access
+        self.assertEqual(self.written_ids(), [0, 1, 2, 4, 5, 7, 8])
+
+    def test_outage_while_isolating_spills_only_unwritten_entries(self):
+        self.database.rejected = {0}
+        def insert(entries):
+            if len(entries) == 2 and entries[0][1][2] == 2: # second half of the split
+                self.database.down = True
+            self.database.insert(entries)
+        entries = [entry(number) for number in range(4)]
+        with mock.patch.object(self.writer, '_insert', side_effect=insert):
+            self.writer._write(entries) #pylint: disable=protected-access
+        self.assertEqual(self.written_ids(), [1])
+        self.assertEqual([record['row'][2] for record in self.read(self.quarantine_file)], [0])
+        self.assertEqual([record['row'][2] for record in self.read(self.spill_file)], [2, 3])
+
+    def test_unwritable_spill_file_is_reported(self):
+        self.database.down = True
+        self.writer.spill_file = os.path.join(self.quarantine_file, 'not-a-directory', 'spill')
+        with open(self.quarantine_file, 'w'):
+            pass
+        errors = io.StringIO()
+        with redirect_stderr(errors):
+            self.writer._write([entry(1)]) #pylint: disable=protected-access
+        self.assertIn('"Successful Login", 1', errors.getvalue())
+
+    def test_unreadable_spill_lines_are_quarantined(self):
+        with open(self.spill_file, 'w') as file:
+            file.write(json.dumps({'table': 'authlogs', 'row': list(entry(1)[1])}) + '\n')
+            file.write('{"table": "authlogs", "row": ["2021-03\n')
+        self.writer._write([entry(2)]) #pylint: disable=protected-access
+        self.assertEqual(self.written_ids(), [1, 2])
+        self.assertEqual(self.read(self.quarantine_file)[0]['error'], 'unreadable spill line')
+
+    def test_legacy_spill_datetimes_are_converted(self):
+        with open(self.spill_file, 'w') as file:
+            file.write(json.dumps({'table': 'authlogs',
+                                   'row': ['01/03/2021 10:00:00', 'Successful Login', 1]}) + '\n')
+        self.writer._write([]) #pylint: disable=protected-access
+        self.assertEqual(self.database.rows[0][1][0].year, 2021)
+
+
+if __name__ == '__main__':
+    unittest.main()
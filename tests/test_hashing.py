@@ -0,0 +1,83 @@
+"""Unit tests of the hashing pool of the hashing module, with a cheap Argon2 profile."""
+
+import asyncio
+import time
+import unittest
+from unittest import mock
+import argon2
+import hashing
+
+
+class HashingPoolTest(unittest.TestCase):
+    """Inline and process pool computations, slots and the asyncio functions."""
+
+    def setUp(self):
+        patcher = mock.patch.object(hashing, 'ph', hashing.password_hasher(8, 1, 1))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def pool(self, **kwargs) -> hashing.HashingPool:
+        options = {'workers': 0, 'max_pending': 2, 'queue_timeout': 0.05}
+        options.update(kwargs)
+        pool = hashing.HashingPool(**options)
+        self.addCleanup(pool.shutdown)
+        return pool
+
+    def test_hash_and_verify_inline(self):
+        pool = self.pool()
+        hashed = pool.hash('F44aF#rhVgs9hAH8')
+        self.assertTrue(pool.verify(hashed, 'F44aF#rhVgs9hAH8'))
+        with self.assertRaises(argon2.exceptions.VerifyMismatchError):
+            pool.verify(hashed, 'wrong')
+
+    def test_hash_passwords_in_waves(self):
+        pool = self.pool()
+        in_flight = []
+        submit = pool.submit
+        def tracked_submit(func, *args):
+            future = submit(func, *args)
+            in_flight.append(future)
+            self.assertLessEqual(sum(not future.done() for future in in_flight), 2)
+            return future
+        passwords = [f"F44aF#rhVgs9hAH{number}" for number in range(5)]
+        with mock.patch.object(hashing, 'pool', pool), \
+                mock.patch.object(pool, 'submit', side_effect=tracked_submit):
+            hashes = hashing.hash_passwords(passwords)
+        self.assertEqual(len(hashes), 5)
+        for hashed, password in zip(hashes, passwords):
+            self.assertTrue(pool.verify(hashed, password))
+
+    def test_async_functions_inline(self):
+        pool = self.pool()
+        async def login():
+            hashed = await pool.hash_async('F44aF#rhVgs9hAH8')
+            return await pool.verify_async(hashed, 'F44aF#rhVgs9hAH8')
+        self.assertTrue(asyncio.run(login()))
+
+    def test_async_awaits_the_worker_process(self):
+        pool = self.pool(workers=1)
+        async def run():
+            loop = asyncio.get_running_loop()
+            with mock.patch.object(loop, 'run_in_executor') as run_in_executor:
+                result = await pool._run_async(abs, -3) #pylint: disable=protected-access
+            run_in_executor.assert_not_called()
+            return result
+        self.assertEqual(asyncio.run(run()), 3)
+
+    def test_saturated_pool_rejects(self):
+        pool = self.pool(workers=1, max_pending=1)
+        running = pool.submit(time.sleep, 0.5)
+        with self.assertRaises(hashing.PoolBusyError):
+            pool.submit(abs, -1)
+        with self.assertRaises(hashing.PoolBusyError):
+            asyncio.run(pool.submit_async(abs, -1))
+        running.result()
+        self.assertEqual(pool.submit(abs, -1).result(), 1) # the slot was released
+
+    def test_needs_rehash_compares_the_profile(self):
+        self.assertFalse(hashing.needs_rehash(hashing.ph.hash('secret')))
+        self.assertTrue(hashing.needs_rehash(hashing.password_hasher(16, 1, 1).hash('secret')))
+
+
+if __name__ == '__main__':
+    unittest.main()
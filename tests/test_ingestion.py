@@ -0,0 +1,60 @@
+"""Unit tests of the feed reading and validation of the ingestion module, with the DB mocked."""
+
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+import ingestion
+
+SOURCE = {'name': 'Example Source', 'url': 'https://example.com', 'threat_level': 3,
+          'description': 'An example source'}
+
+
+class IngestTest(unittest.TestCase):
+    """Malformed lines and invalid records are rejected, the rest of the feed is loaded."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'feed.jsonl')
+
+    def write(self, lines:list):
+        with open(self.path, 'w') as file:
+            file.writelines(line + '\n' for line in lines)
+
+    def test_bad_lines_are_rejected_and_the_feed_continues(self):
+        second = dict(SOURCE, url='https://example.org')
+        self.write([
+            json.dumps(SOURCE),
+            '{"name": "Cut off',
+            '[1, 2]',
+            json.dumps(dict(SOURCE, name=12345)),
+            '',
+            json.dumps(second),
+        ])
+        created = [(1, SOURCE['name'], SOURCE['url']), (2, second['name'], second['url'])]
+        output = io.StringIO()
+        with mock.patch.object(ingestion.ops, 'create_sources_bulk', return_value=created), \
+                mock.patch.object(ingestion.adops, 'fetch_all_authorities', return_value=[]), \
+                mock.patch.object(ingestion.outbox, 'enqueue') as enqueue, \
+                redirect_stdout(output):
+            summary = ingestion.ingest(self.path, uid=7, chunk_size=10)
+        self.assertEqual((summary['valid'], summary['created'], summary['rejected']), (2, 2, 3))
+        enqueue.assert_called_once()
+        for line in ('line 2', 'line 3', 'line 4'):
+            self.assertIn(line, output.getvalue())
+
+    def test_field_types(self):
+        self.assertIsNone(ingestion.validate_source(SOURCE))
+        self.assertIsNone(ingestion.validate_source(dict(SOURCE, threat_level='5')))
+        for field, value in (('name', 12345), ('url', ['https://example.com']),
+                             ('description', {'text': 'An example source'})):
+            self.assertEqual(ingestion.validate_source(dict(SOURCE, **{field: value})),
+                             f"Field '{field}' must be text")
+
+
+if __name__ == '__main__':
+    unittest.main()
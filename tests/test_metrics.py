@@ -0,0 +1,82 @@
+"""Unit tests of the metrics rendering and the dump files of the metrics module."""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+import metrics
+
+
+class RenderTest(unittest.TestCase):
+    """Prometheus text format of histograms and counters."""
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram('test_seconds', 'Test durations', buckets=(0.1, 1.0))
+        for seconds in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(seconds, db='data')
+        self.assertEqual(histogram.render(), [
+            'test_seconds_bucket{db="data",le="0.1"} 2',
+            'test_seconds_bucket{db="data",le="1.0"} 3',
+            'test_seconds_bucket{db="data",le="+Inf"} 4',
+            'test_seconds_sum{db="data"} 2.65',
+            'test_seconds_count{db="data"} 4',
+        ])
+
+    def test_counter_labels_are_sorted_and_escaped(self):
+        counter = metrics.Counter('test_total', 'Test events')
+        counter.inc(result='b"ad')
+        counter.inc(2, result='ok')
+        counter.inc()
+        self.assertEqual(counter.render(), [
+            'test_total 1', 'test_total{result="b\\"ad"} 1', 'test_total{result="ok"} 2'
+        ])
+
+    def test_render_includes_help_and_type(self):
+        metrics.counter('sss_test_render_total', 'Rendered test counter').inc()
+        text = metrics.render()
+        self.assertIn('# HELP sss_test_render_total Rendered test counter\n'
+                      '# TYPE sss_test_render_total counter\n'
+                      'sss_test_render_total 1\n', text)
+        self.assertTrue(text.endswith('\n'))
+
+    def test_disabled(self):
+        counter = metrics.Counter('test_total', 'Test events')
+        with mock.patch.object(metrics.settings, 'METRICS_ENABLED', False):
+            counter.inc()
+        self.assertEqual(counter.render(), [])
+
+
+class DumpTest(unittest.TestCase):
+    """Dump files are written per process and removed once the process has ended."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        template = os.path.join(self.directory, '{program}-{pid}.prom')
+        patcher = mock.patch.object(metrics.settings, 'METRICS_DUMP_FILE', template)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_dump_and_removal_at_exit(self):
+        path = metrics.dump()
+        self.assertTrue(path.endswith(f"-{os.getpid()}.prom"))
+        self.assertEqual(os.listdir(self.directory), [os.path.basename(path)])
+        with mock.patch.object(metrics, '_dump_stop'):
+            metrics._remove_dump_at_exit()
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_stale_dumps_of_ended_processes_are_removed(self):
+        running = metrics.dump()
+        names = ('main-999999.prom', 'api-999998.prom', 'notes.txt')
+        for name in names:
+            with open(os.path.join(self.directory, name), 'w') as file:
+                file.write('')
+        with mock.patch.object(metrics, 'pid_alive', side_effect=lambda pid: pid == os.getpid()):
+            self.assertEqual(metrics.remove_stale_dumps(), 2)
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         sorted([os.path.basename(running), 'notes.txt']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+"""Unit tests of the source search of the operations module, with a fake database."""
+
+import io
+import unittest
+from contextlib import contextmanager, redirect_stdout
+from unittest import mock
+import psycopg2
+import psycopg2.errors
+import operations as ops
+
+
+class FakeCursor:
+    """Server-side cursor that fails on full-text queries if the column is missing."""
+
+    def __init__(self, database):
+        self.database = database
+        self.itersize = None
+
+    def execute(self, stmt, params=None):
+        self.database.statements.append(repr(stmt))
+        if 'search_vector' in repr(stmt) and not self.database.full_text:
+            raise psycopg2.errors.UndefinedColumn('column "search_vector" does not exist')
+
+    def __iter__(self):
+        return iter(self.database.rows)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class FakeDatabase:
+    """Stands in for the pooled 'data' connection."""
+
+    def __init__(self, full_text:bool=True):
+        self.full_text = full_text
+        self.rows = [(1, 'Google'), (2, 'Google Drive')]
+        self.statements = []
+        self.rollbacks = 0
+
+    def cursor(self, name=None):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    @contextmanager
+    def connection(self, db_name):
+        yield self
+
+
+class SearchConditionTest(unittest.TestCase):
+    """WHERE conditions of the search modes."""
+
+    def test_like_is_a_case_insensitive_substring_match(self):
+        condition = repr(ops.search_condition('name', 'OOGL', 'like'))
+        self.assertIn("lower(", condition)
+        self.assertIn("'%oogl%'", condition)
+
+    def test_fulltext_matches_word_prefixes(self):
+        condition = repr(ops.search_condition('description', 'sql inj', 'fulltext'))
+        self.assertIn("'sql:*B & inj:*B'", condition)
+
+    def test_urls_are_always_substring_matches(self):
+        self.assertIn("'%plattan%'", repr(ops.search_condition('url', 'plattan', 'fulltext')))
+
+    def test_threat_level_is_an_exact_match(self):
+        self.assertIn("Literal(3)", repr(ops.search_condition('threat_level', '3')))
+
+    def test_prefix_tsquery_drops_operators(self):
+        self.assertEqual(ops.prefix_tsquery("a&b | !c:*", 'A'), 'a:*A & b:*A & c:*A')
+        self.assertEqual(ops.prefix_tsquery("&|!", 'A'), '')
+
+
+class SearchFallbackTest(unittest.TestCase):
+    """The 'fulltext' mode falls back to 'like' without the search_vector column."""
+
+    def setUp(self):
+        patcher = mock.patch.object(ops, '_full_text_missing', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def search(self, database, mode):
+        with mock.patch.object(ops.dbc, 'connection', database.connection):
+            with redirect_stdout(io.StringIO()):
+                return list(ops.search_for_source('name', 'oogl', mode=mode))
+
+    def test_like_is_the_default_mode(self):
+        self.assertEqual(ops.settings.SEARCH_MODE, 'like')
+
+    def test_fulltext_uses_the_search_vector(self):
+        database = FakeDatabase()
+        self.assertEqual(len(self.search(database, 'fulltext')), 2)
+        self.assertIn('search_vector', database.statements[0])
+
+    def test_missing_column_falls_back_to_like(self):
+        database = FakeDatabase(full_text=False)
+        self.assertEqual(len(self.search(database, 'fulltext')), 2)
+        self.assertEqual(database.rollbacks, 1)
+        self.assertIn("'%oogl%'", database.statements[-1])
+        self.search(database, 'fulltext') # later searches go straight to 'like'
+        self.assertEqual(database.rollbacks, 1)
+        self.assertNotIn('search_vector', database.statements[-1])
+
+
+class SourceCacheTest(unittest.TestCase):
+    """Read-through caching of get_source_by_id."""
+
+    ROW = (7, 'Google', 'http://google.example', 1, 'Search engine', None, None)
+
+    def setUp(self):
+        patcher = mock.patch.object(ops, 'source_cache', ops.cache.LRUCache(8, 60))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cursor = mock.Mock()
+        self.cursor.fetchall.return_value = [self.ROW]
+        conn = mock.Mock()
+        conn.cursor.return_value = self.cursor
+        connection = mock.patch.object(ops.dbc, 'connection')
+        connection.start().return_value.__enter__.return_value = conn
+        self.addCleanup(connection.stop)
+
+    def test_sources_are_read_once(self):
+        self.assertEqual(ops.get_source_by_id(7), self.ROW)
+        self.assertEqual(ops.get_source_by_id(7), self.ROW)
+        self.assertEqual(self.cursor.execute.call_count, 1)
+
+    def test_source_modified_during_the_read_is_not_cached(self):
+        self.cursor.execute.side_effect = lambda *args: ops.source_cache.invalidate(7)
+        self.assertEqual(ops.get_source_by_id(7), self.ROW)
+        self.assertIs(ops.source_cache.get(7), ops.cache.MISSING)
+
+
+class CreateSourceTest(unittest.TestCase):
+    """Creation of a single source and the queueing of its notification."""
+
+    def test_unqueued_notification_does_not_fail_the_creation(self):
+        cursor = mock.Mock()
+        cursor.fetchone.return_value = (42,)
+        conn = mock.Mock()
+        conn.cursor.return_value = cursor
+        with mock.patch.object(ops.dbc, 'connection') as connection, \
+                mock.patch.object(ops.adops, 'fetch_all_authorities', return_value=[]), \
+                mock.patch.object(ops.outbox, 'enqueue', side_effect=OSError(28, 'No space')), \
+                mock.patch.object(ops.log, 'operation_log') as operation_log, \
+                redirect_stdout(io.StringIO()):
+            connection.return_value.__enter__.return_value = conn
+            created = ops.create_new_source('Example Source', 'https://example.com', 3,
+                                            'An example source', uid=7)
+        self.assertTrue(created)
+        self.assertEqual(operation_log.call_args_list[-1][0][:3],
+                         ("Notification Not Queued", 7, 42))
+
+
+class CreateSourcesBulkTest(unittest.TestCase):
+    """Bulk inserts of the ingestion."""
+
+    def test_inserts_are_serialised_by_an_advisory_lock(self):
+        cursor = mock.Mock()
+        cursor.fetchall.return_value = [(1, 'Example Source', 'https://example.com', 3)]
+        conn = mock.Mock()
+        conn.cursor.return_value = cursor
+        with mock.patch.object(ops.dbc, 'connection') as connection, \
+                mock.patch.object(ops.log, 'operation_log'):
+            connection.return_value.__enter__.return_value = conn
+            created = ops.create_sources_bulk(
+                [('Example Source', 'https://example.com', 3, 'An example source')], uid=7
+            )
+        self.assertEqual(len(created), 1)
+        statements = [call[0][0] for call in cursor.execute.call_args_list]
+        self.assertIn('pg_advisory_xact_lock', statements[0])
+        self.assertIn('INSERT INTO sources', statements[-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
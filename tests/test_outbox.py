@@ -0,0 +1,104 @@
+"""Unit tests of the notification outbox, with the email functions mocked."""
+
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+import outbox
+import settings
+
+
+class OutboxTest(unittest.TestCase):
+    """Delivery, backoff, failure and quarantine of outbox entries."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.failed_dir = os.path.join(directory.name, 'failed')
+        for patcher in (mock.patch.object(settings, 'OUTBOX_DIR', directory.name),
+                        mock.patch.object(outbox, 'FAILED_DIR', self.failed_dir),
+                        mock.patch.object(settings, 'OUTBOX_MAX_ATTEMPTS', 3),
+                        mock.patch.object(settings, 'OUTBOX_BACKOFF_BASE', 30),
+                        mock.patch.object(settings, 'OUTBOX_BACKOFF_MAX', 100),
+                        mock.patch.object(outbox.notification, 'changed_password_email')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.send = outbox.notification.changed_password_email
+        self.output = io.StringIO()
+
+    def process(self, name:str):
+        with redirect_stdout(self.output):
+            outbox.process_entry(name)
+
+    def read(self, name:str, folder:str=None) -> dict:
+        with open(os.path.join(folder or settings.OUTBOX_DIR, name)) as file:
+            return json.load(file)
+
+    def test_backoff_doubles_up_to_the_maximum(self):
+        self.assertEqual([outbox.backoff(attempt) for attempt in (1, 2, 3, 4)], [30, 60, 100, 100])
+
+    def test_delivered_entries_are_removed(self):
+        name = outbox.enqueue('changed_password', firstname='Jane', email='jane@example.com')
+        self.assertEqual(outbox.pending_entries(), [name])
+        self.send.return_value = True
+        self.process(name)
+        self.send.assert_called_once_with('Jane', 'jane@example.com')
+        self.assertEqual(os.listdir(settings.OUTBOX_DIR), [])
+
+    def test_failed_delivery_is_rescheduled_then_moved_to_failed(self):
+        name = outbox.enqueue('changed_password', firstname='Jane', email='jane@example.com')
+        self.send.return_value = False
+        self.process(name)
+        entry = self.read(name)
+        self.assertEqual(entry['attempts'], 1)
+        self.assertEqual(outbox.pending_entries(), []) # not due before the backoff has passed
+        self.process(name)
+        self.process(name)
+        self.assertEqual(self.read(name, self.failed_dir)['attempts'], 3)
+        self.assertFalse(os.path.exists(os.path.join(settings.OUTBOX_DIR, name)))
+
+    def test_only_failed_recipients_are_retried(self):
+        recipients = [('a@example.com', 'A'), ('b@example.com', 'B')]
+        name = outbox.enqueue('new_source', recipients=recipients, source_id=1, name='Google',
+                              url='http://google.example', threat_level=1)
+        with mock.patch.object(outbox.notification, 'new_source_email',
+                               return_value={'a@example.com': True, 'b@example.com': False}):
+            self.process(name)
+        self.assertEqual(self.read(name)['args']['recipients'], [['b@example.com', 'B']])
+
+    def test_errors_outside_smtp_are_retried_with_backoff(self):
+        name = outbox.enqueue('changed_password', firstname='Jane', email='jane@example.com')
+        self.send.side_effect = OSError('config/email_body.html not found')
+        self.process(name)
+        entry = self.read(name)
+        self.assertEqual(entry['attempts'], 1)
+        self.assertGreater(entry['next_attempt'], 0)
+
+    def test_unknown_kinds_are_moved_to_failed(self):
+        name = outbox.enqueue('fax', number='123')
+        self.process(name)
+        self.assertTrue(os.path.exists(os.path.join(self.failed_dir, name)))
+
+    def test_corrupt_entries_are_quarantined(self):
+        name = '0000000000001-corrupt.json'
+        with open(os.path.join(settings.OUTBOX_DIR, name), 'w') as file:
+            file.write('{"kind": "changed_pass')
+        self.assertEqual(outbox.pending_entries(), [name])
+        self.process(name)
+        with open(os.path.join(self.failed_dir, name)) as file:
+            self.assertEqual(file.read(), '{"kind": "changed_pass')
+        self.assertEqual(outbox.pending_entries(), [])
+
+    def test_interrupted_claims_are_recovered(self):
+        name = outbox.enqueue('changed_password', firstname='Jane', email='jane@example.com')
+        path = os.path.join(settings.OUTBOX_DIR, name)
+        os.replace(path, path + outbox.CLAIM_SUFFIX)
+        outbox.recover_claims()
+        self.assertEqual(outbox.pending_entries(), [name])
+
+
+if __name__ == '__main__':
+    unittest.main()
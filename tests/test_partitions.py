@@ -0,0 +1,94 @@
+"""Unit tests of the partition maintenance of the partitions module, with a fake database."""
+
+import unittest
+from unittest import mock
+import partitions
+
+
+class FakeCursor:
+    """Answers the catalog queries from dicts of attached and detached partitions."""
+
+    def __init__(self, attached:dict, detached:dict):
+        self.attached = attached
+        self.detached = detached
+        self.statements = []
+        self.result = []
+
+    def execute(self, stmt, params=None):
+        text = stmt if isinstance(stmt, str) else repr(stmt)
+        self.statements.append(text)
+        if 'pg_inherits' in text:
+            self.result = [(name,) for name in self.attached.get(params[0], [])]
+        elif 'relispartition' in text:
+            self.result = [(name,) for name in self.detached.get(params[0][:-1], [])]
+
+    def fetchall(self):
+        return self.result
+
+
+class PartitionNamesTest(unittest.TestCase):
+    """Month arithmetic and partition names."""
+
+    def test_add_months(self):
+        self.assertEqual(partitions.add_months((2021, 11), 3), (2022, 2))
+        self.assertEqual(partitions.add_months((2021, 1), -1), (2020, 12))
+
+    def test_partition_end(self):
+        self.assertEqual(partitions.partition_end('authlogs', 'authlogs_y2021m12'), (2022, 1))
+        self.assertEqual(partitions.partition_end('authlogs', 'authlogs_before_y2021m07'),
+                         (2021, 7))
+        self.assertIsNone(partitions.partition_end('authlogs', 'authlogs_default'))
+        self.assertIsNone(partitions.partition_end('authlogs', 'adminlogs_y2021m12'))
+
+
+class RetentionTest(unittest.TestCase):
+    """Expired partitions and their retirement."""
+
+    def setUp(self):
+        patcher = mock.patch.object(partitions, 'current_month', return_value=(2023, 6))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cursor = FakeCursor(
+            {'authlogs': ['authlogs_default', 'authlogs_y2021m05', 'authlogs_y2021m06']},
+            {'authlogs': ['authlogs_y2021m04']},
+        )
+
+    def test_expired_partitions_include_leftover_detached_tables(self):
+        expired = partitions.expired_partitions(self.cursor, 24, 'archive')
+        self.assertEqual(expired, [('authlogs', 'authlogs_y2021m05', True),
+                                   ('authlogs', 'authlogs_y2021m04', False)])
+
+    def test_detach_action_keeps_detached_tables(self):
+        expired = partitions.expired_partitions(self.cursor, 24, 'detach')
+        self.assertEqual(expired, [('authlogs', 'authlogs_y2021m05', True)])
+
+    def test_retention_can_be_disabled(self):
+        self.assertEqual(partitions.expired_partitions(self.cursor, 0, 'archive'), [])
+
+    def test_failed_archive_leaves_the_table_for_the_next_run(self):
+        conn = mock.Mock()
+        conn.cursor.return_value = self.cursor
+        with mock.patch.object(partitions, 'archive_partition', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                partitions.retire_partition(conn, 'authlogs', 'authlogs_y2021m05', 'archive')
+        self.assertIn('DETACH PARTITION', self.cursor.statements[0])
+        self.assertFalse(any('DROP TABLE' in text for text in self.cursor.statements))
+
+    def test_detached_tables_are_archived_without_detaching_again(self):
+        conn = mock.Mock()
+        conn.cursor.return_value = self.cursor
+        with mock.patch.object(partitions, 'archive_partition', return_value='archive.csv.gz'):
+            with mock.patch('builtins.print'):
+                partitions.retire_partition(conn, 'authlogs', 'authlogs_y2021m04', 'archive',
+                                            attached=False)
+        self.assertEqual(len(self.cursor.statements), 1)
+        self.assertIn('DROP TABLE', self.cursor.statements[0])
+
+    def test_invalid_action_is_rejected(self):
+        with mock.patch.object(partitions.settings, 'LOG_RETENTION_ACTION', 'shred'):
+            with mock.patch('builtins.print'):
+                self.assertFalse(partitions.maintain())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+"""Unit tests of the user file validation of the provisioning module, with the DB mocked."""
+
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import mock
+import admin_operations as adops
+import hashing
+import provisioning
+
+USER = {'first_name': 'Jane', 'last_name': 'Doe', 'email': 'jane.doe@example.com',
+        'dob': '1990-01-31', 'role': 2}
+
+
+class LoadUsersTest(unittest.TestCase):
+    """Malformed lines and invalid records are rejected, the other users are loaded."""
+
+    def test_bad_lines_are_rejected(self):
+        lines = [json.dumps(USER), 'not json', json.dumps(dict(USER, email=42)),
+                 json.dumps(dict(USER, email='john.doe@example.com', first_name='John'))]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'users.jsonl')
+            with open(path, 'w') as file:
+                file.writelines(line + '\n' for line in lines)
+            with mock.patch.object(provisioning.adops, 'existing_emails', return_value=set()):
+                users, errors = provisioning.load_users(path)
+        self.assertEqual([user['first_name'] for user in users], ['Jane', 'John'])
+        self.assertEqual([(line, error) for line, _, error in errors],
+                         [(2, 'Malformed JSON line'), (3, "Field 'email' must be text")])
+
+
+class RegisterUsersBulkTest(unittest.TestCase):
+    """A saturated hashing pool fails the provisioning without creating any user."""
+
+    def test_busy_hashing_pool(self):
+        busy = hashing.PoolBusyError('busy')
+        with mock.patch.object(adops.hashing, 'hash_passwords', side_effect=busy), \
+                mock.patch.object(adops.dbc, 'connection') as connection, \
+                redirect_stdout(StringIO()):
+            self.assertIsNone(adops.register_users_bulk([USER], admin_id=1))
+        connection.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
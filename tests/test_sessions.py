@@ -0,0 +1,92 @@
+"""Unit tests of the session tokens and the memory store of the sessions module."""
+
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+import sessions
+
+LOGIN = (7, 'Jane', 2)
+
+
+class SessionTest(unittest.TestCase):
+    """Signed, expiring tokens resolved from the memory store."""
+
+    def setUp(self):
+        self.now = 1_700_000_000.0
+        self.addCleanup(mock.patch.stopall)
+        mock.patch.object(sessions.time, 'time', side_effect=lambda: self.now).start()
+        mock.patch.object(sessions, '_store', sessions.MemoryStore()).start()
+        mock.patch.object(sessions, '_key', b'k' * 32).start()
+
+    def test_token_resolves_to_the_session(self):
+        token = sessions.create(LOGIN, 'jdoe', ttl=60)
+        session = sessions.resolve(token)
+        self.assertEqual((session.uid, session.first_name, session.role), LOGIN)
+        self.assertEqual(session.expires, int(self.now) + 60)
+
+    def test_token_expires(self):
+        token = sessions.create(LOGIN, 'jdoe', ttl=60)
+        self.now += 61
+        self.assertIsNone(sessions.parse(token))
+        self.assertIsNone(sessions.resolve(token))
+
+    def test_forged_tokens_are_rejected(self):
+        sid, expires, signature = sessions.create(LOGIN, 'jdoe', ttl=60).split('.')
+        extended = f"{sid}.{int(expires) + 3600}.{signature}"
+        self.assertIsNone(sessions.resolve(extended))
+        for token in ('', 'abc', None, f"{sid}.{expires}.{signature[:-2]}xx"):
+            self.assertIsNone(sessions.resolve(token))
+
+    def test_token_of_another_key_is_rejected(self):
+        token = sessions.create(LOGIN, 'jdoe', ttl=60)
+        with mock.patch.object(sessions, '_key', b'o' * 32):
+            self.assertIsNone(sessions.resolve(token))
+
+    def test_revoke(self):
+        token = sessions.create(LOGIN, 'jdoe', ttl=60)
+        other = sessions.create(LOGIN, 'jdoe', ttl=60)
+        sessions.revoke(token)
+        self.assertIsNone(sessions.resolve(token))
+        sessions.revoke_user(LOGIN[0])
+        self.assertIsNone(sessions.resolve(other))
+
+
+class SigningKeyTest(unittest.TestCase):
+    """Loading of the signing key."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.key_file = os.path.join(directory.name, 'session_key.bin')
+        self.addCleanup(mock.patch.stopall)
+        mock.patch.object(sessions, '_key', None).start()
+        mock.patch.object(sessions.settings, 'SESSION_KEY_FILE', self.key_file).start()
+
+    def test_key_file(self):
+        with open(self.key_file, 'wb') as file:
+            file.write(b'shared key')
+        self.assertEqual(sessions.signing_key(), b'shared key')
+
+    def test_random_key_is_created_once(self):
+        with mock.patch.object(sessions.settings, 'SESSION_STORE', 'memory'):
+            keys = []
+            threads = [threading.Thread(target=lambda: keys.append(sessions.signing_key()))
+                       for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(set(keys)), 1)
+        self.assertEqual(len(keys[0]), 32)
+
+    def test_database_store_requires_the_key_file(self):
+        with mock.patch.object(sessions.settings, 'SESSION_STORE', 'database'):
+            with self.assertRaises(sessions.SigningKeyError):
+                sessions.signing_key()
+        self.assertIsNone(sessions._key)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+"""Unit tests of the login throttling and lockout, with a fake database and clock."""
+
+import unittest
+from contextlib import contextmanager
+from unittest import mock
+import argon2
+import psycopg2
+import psycopg2.pool
+import authentication as auth
+import hashing
+import throttling
+
+USER = (7, 'Jane', 2, '$argon2id$stored', 1) # id, first name, role, hash, status
+
+
+class FakeCursor:
+    """Returns the configured row for every query and records the statements."""
+
+    def __init__(self, row):
+        self.row = row
+        self.statements = []
+
+    def execute(self, stmt, params=None):
+        self.statements.append((stmt, params))
+
+    def fetchone(self):
+        return self.row
+
+    def fetchall(self):
+        return [self.row]
+
+
+class FakeConnection:
+    """Stands in for a pooled connection."""
+
+    def __init__(self, row):
+        self.cursor_obj = FakeCursor(row)
+
+    def cursor(self):
+        return self.cursor_obj
+
+    def commit(self):
+        pass
+
+
+def fake_connection(row):
+    '''Returns a replacement of dbconnection.connection that serves the given row.'''
+    connection = FakeConnection(row)
+
+    @contextmanager
+    def connect(database):
+        yield connection
+    return connect, connection.cursor_obj
+
+
+class ThrottlingTest(unittest.TestCase):
+    """Sliding-window limits and the in-process block list."""
+
+    def setUp(self):
+        throttling._blocked.clear()
+        self.addCleanup(throttling._blocked.clear)
+        self.now = 1000.0
+        patcher = mock.patch.object(throttling.time, 'monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.multiple(throttling.settings, LOGIN_MAX_USERNAME_FAILURES=5,
+                                      LOGIN_MAX_SOURCE_FAILURES=20)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def allowed(self, row) -> bool:
+        connect, _ = fake_connection(row)
+        with mock.patch.object(throttling.dbc, 'connection', connect):
+            return throttling.allowed('jdoe', 'api@10.0.0.1')
+
+    def test_below_the_limits(self):
+        self.assertTrue(self.allowed((4, 100.0, 19, 100.0)))
+
+    def test_blocked_for_the_seconds_left_in_the_window(self):
+        self.assertFalse(self.allowed((5, 120.0, 5, 120.0)))
+        self.now += 119 # the block is kept without querying the database
+        self.assertFalse(self.allowed(None))
+        self.now += 2
+        self.assertTrue(self.allowed((0, None, 0, None)))
+
+    def test_block_ignores_the_wall_clock(self):
+        self.assertFalse(self.allowed((5, 60.0, 0, None)))
+        with mock.patch.object(throttling.time, 'time', return_value=0.0):
+            self.assertFalse(self.allowed(None))
+
+    def test_source_limit(self):
+        self.assertFalse(self.allowed((0, None, 20, 30.0)))
+        self.assertIn(('source', 'api@10.0.0.1'), throttling._blocked)
+
+    def test_database_and_pool_errors_allow_the_login(self):
+        for error in (psycopg2.pool.PoolError('exhausted'),
+                      psycopg2.ProgrammingError('relation "login_failures" does not exist')):
+            with mock.patch.object(throttling.dbc, 'connection', side_effect=error):
+                self.assertTrue(throttling.allowed('jdoe', 'api@10.0.0.1'))
+                self.assertEqual(throttling.record_failure('jdoe', 'api@10.0.0.1'), 0)
+                throttling.reset('jdoe')
+
+    def test_failures_are_counted_per_username_and_source(self):
+        connect, cursor = fake_connection((2,))
+        with mock.patch.object(throttling.dbc, 'connection', connect):
+            self.assertEqual(throttling.record_failure('jdoe', 'api@10.0.0.1'), 2)
+        stmt, params = cursor.statements[0]
+        self.assertIn('source = %(source)s', stmt.split('SELECT')[1])
+        self.assertEqual(params['source'], 'api@10.0.0.1')
+
+
+class AuthenticateTest(unittest.TestCase):
+    """Lockout and error statuses of authenticate()."""
+
+    def setUp(self):
+        connect, _ = fake_connection(USER)
+        self.addCleanup(mock.patch.stopall)
+        mock.patch.object(auth.dbc, 'connection', connect).start()
+        mock.patch.object(auth.throttling, 'allowed', return_value=True).start()
+        mock.patch.object(auth.log, 'auth_log').start()
+        mock.patch.object(auth.settings, 'LOGIN_LOCKOUT_FAILURES', 3).start()
+        self.lock_user = mock.patch.object(auth.adops, 'lock_user').start()
+
+    def wrong_password(self, failures:int, **kwargs) -> str:
+        mismatch = argon2.exceptions.VerifyMismatchError()
+        with mock.patch.object(auth.hashing, 'verify_password', side_effect=mismatch), \
+                mock.patch.object(auth.throttling, 'record_failure', return_value=failures):
+            return auth.authenticate('jdoe', 'wrong', **kwargs)[0]
+
+    def test_local_lockout(self):
+        self.assertEqual(self.wrong_password(2), 'incorrect')
+        self.assertEqual(self.wrong_password(3), 'lockout')
+        self.lock_user.assert_called_once_with(7)
+
+    def test_remote_logins_never_lock(self):
+        self.assertEqual(self.wrong_password(50, source='api@10.0.0.1', lockout=False),
+                         'incorrect')
+        self.lock_user.assert_not_called()
+
+    def test_busy_hashing_pool(self):
+        busy = hashing.PoolBusyError('busy')
+        with mock.patch.object(auth.hashing, 'verify_password', side_effect=busy):
+            self.assertEqual(auth.authenticate('jdoe', 'secret'), ('busy', None))
+
+
+if __name__ == '__main__':
+    unittest.main()
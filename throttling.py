@@ -0,0 +1,144 @@
+"""
+Module providing the login throttling of the System.
+Failed logins are recorded in the 'login_failures' table of the Authentication DB
+(Authentication_login_failures.sql), so the limits hold across all processes and sessions.
+Before a password is verified, the failures of the username and of the source (client address
+or host) within the last LOGIN_WINDOW seconds are counted; over the limit, the login is rejected
+without running Argon2. Rejected keys are also remembered in the process until their oldest
+failure leaves the window, so floods are rejected without a database query. The database returns
+the seconds left of the block, which are counted on the monotonic clock of the process, so the
+clocks of the database server and the application host need not agree.
+Run "python throttling.py --purge" regularly (e.g. daily via cron) to remove old failures.
+"""
+
+import argparse
+import threading
+import time
+import psycopg2
+import dbconnection as dbc
+import settings
+
+RED = '\033[91m' # Error Messages
+GREEN = '\033[92m' # Success Messages
+
+_blocked = {} # ('username'|'source', value) -> time.monotonic() until which logins are rejected
+_lock = threading.Lock()
+
+
+def _blocked_until(key:tuple) -> float:
+    '''Returns the time until which the key is rejected in this process, or 0.'''
+    with _lock:
+        until = _blocked.get(key, 0)
+        if until and until <= time.monotonic():
+            del _blocked[key]
+            return 0
+        return until
+
+
+def _block(key:tuple, seconds:float):
+    '''Remembers a rejected key for the given number of seconds.'''
+    with _lock:
+        _blocked[key] = time.monotonic() + seconds
+
+
+def allowed(username:str, source:str) -> bool:
+    '''
+    Checks the sliding-window limits of a username and a source before a login is verified.
+    Returns False if either has too many failed logins within LOGIN_WINDOW.
+    If the database or its connection pool is unavailable, the login is allowed (and fails on
+    the user lookup).
+    '''
+    keys = (('username', username), ('source', source))
+    if any(_blocked_until(key) for key in keys):
+        return False
+    # the seconds until the oldest failure of each key leaves the window, on the database clock
+    psql = """SELECT count(*) FILTER (WHERE username = %(username)s),
+                     extract(epoch from min(attempted) FILTER (WHERE username = %(username)s)
+                                        + %(window)s * interval '1 second' - now()),
+                     count(*) FILTER (WHERE source = %(source)s),
+                     extract(epoch from min(attempted) FILTER (WHERE source = %(source)s)
+                                        + %(window)s * interval '1 second' - now())
+              FROM login_failures
+              WHERE (username = %(username)s OR source = %(source)s)
+                AND attempted > now() - %(window)s * interval '1 second'"""
+    val = {'username':username, 'source':source, 'window':settings.LOGIN_WINDOW}
+    try:
+        with dbc.connection('authentication') as conn:
+            cursor = conn.cursor()
+            cursor.execute(psql, val)
+            user_failures, user_left, source_failures, source_left = cursor.fetchone()
+    except psycopg2.Error: # incl. an exhausted connection pool
+        return True
+    limits = (
+        (keys[0], user_failures, user_left, settings.LOGIN_MAX_USERNAME_FAILURES),
+        (keys[1], source_failures, source_left, settings.LOGIN_MAX_SOURCE_FAILURES),
+    )
+    for key, failures, seconds_left, limit in limits:
+        if limit and failures >= limit:
+            _block(key, float(seconds_left))
+            return False
+    return True
+
+
+def record_failure(username:str, source:str) -> int:
+    '''
+    Records a failed login. Returns the number of failures of the username from this source
+    within LOGIN_WINDOW (including this one), or 0 if the failure could not be recorded.
+    '''
+    psql = """WITH failure AS (
+                  INSERT INTO login_failures (username, source) VALUES (%(username)s, %(source)s)
+              )
+              SELECT count(*) + 1 FROM login_failures
+              WHERE username = %(username)s AND source = %(source)s
+                AND attempted > now() - %(window)s * interval '1 second'"""
+    val = {'username':username, 'source':source, 'window':settings.LOGIN_WINDOW}
+    try:
+        with dbc.connection('authentication') as conn:
+            cursor = conn.cursor()
+            cursor.execute(psql, val)
+            failures = cursor.fetchone()[0]
+            conn.commit()
+    except psycopg2.Error:
+        return 0
+    return failures
+
+
+def reset(username:str):
+    '''Removes the failures of a username after a successful login.'''
+    with _lock:
+        _blocked.pop(('username', username), None)
+    try:
+        with dbc.connection('authentication') as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM login_failures WHERE username = %(username)s",
+                           {'username':username})
+            conn.commit()
+    except psycopg2.Error:
+        pass
+
+
+def purge() -> int:
+    '''Removes the failures that have left the window. Returns their number.'''
+    psql = "DELETE FROM login_failures WHERE attempted <= now() - %(window)s * interval '1 second'"
+    with dbc.connection('authentication') as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(psql, {'window':settings.LOGIN_WINDOW})
+            conn.commit()
+        except psycopg2.OperationalError as error:
+            print(RED + 'Issue with purging the login failures on database. Error:', error)
+            return 0
+        return cursor.rowcount
+
+
+def main():
+    '''Purges the old login failures.'''
+    parser = argparse.ArgumentParser(description='Login throttling maintenance.')
+    parser.add_argument('--purge', action='store_true', required=True,
+                        help='remove the failed logins older than LOGIN_WINDOW')
+    parser.parse_args()
+    print(GREEN + f"{purge()} old login failure(s) removed.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Module holding the validation rules for user and source inputs."""
+
+from validator_collection import checkers
+
+
+def is_valid_username(username:str) -> bool:
+    '''
+    Checks if a username follows the validation rules.
+    Validation: >4 characters and may only contain letters, numbers and '.', '_', '-'
+    '''
+    valid_char = ('.','_','-')
+    min_len = 5
+    if len(username) < min_len: # checks the length of the entered username
+        return False
+    for char in username: # checks each character of user input
+        if char.isalnum():
+            continue # continue if current char is either alpha or numerical
+        if char in valid_char:
+            continue # continue if current char is part of the valid characters tuple
+        return False
+    return True
+
+
+def is_valid_name(name:str) -> bool:
+    '''
+    Checks if a first or last name follows the validation rules.
+    Validation: >2 characters and may only contain letters, spaces and '-'
+    '''
+    valid_char = (' ','-')
+    min_len = 3
+    if len(name) < min_len: # checks the length of the entered name
+        return False
+    for char in name: # checks each character of name input
+        if char.isalpha():
+            continue # continue if current char is a letter
+        if char in valid_char:
+            continue # continue if current char is part of the valid characters tuple
+        return False
+    return True
+
+
+def is_valid_email(email:str) -> bool:
+    '''
+    Checks if an email address follows the validation rules.
+    Validation: Must contain exactly 1x '@', atleast 1x '.' and end with a letter.
+    May contain alnum and '-', '.', '_', '+'
+    '''
+    valid_char = ('-', '.', '_', '+')
+    min_len = 7
+    num_at_sign = 0
+    if len(email) < min_len:
+        return False
+    ends_with_letter = email[-1].isalpha() # checks if email ends with a letter
+    contains_dot = '.' in email # checks if email contains atleast one '.'
+    for char in email: # checks each character of name input
+        if char.isalnum():
+            continue # continue if character is a letter or number
+        if char in valid_char:
+            continue # continue if character is part of the valid_char tuple
+        if char == '@':
+            num_at_sign += 1 # counts the number of times the '@' sign appears
+            continue
+        return False
+    return num_at_sign == 1 and contains_dot and ends_with_letter
+
+
+def is_valid_dob(dob:str) -> bool:
+    '''
+    Checks if a date of birth follows the validation rules.
+    Validation: Exactly 10 characters and may only contain numbers and '-'
+    '''
+    valid_char = ('-')
+    exact_len = 10
+    if len(dob) != exact_len:
+        return False
+    for char in dob:
+        if char.isnumeric():
+            continue
+        if char in valid_char:
+            continue
+        return False
+    return True
+
+
+def is_valid_password(password:str) -> bool:
+    '''
+    Checks if a given password is conform to the system's standards.
+    A password must be atleast 12 characters long, include letters and numbers,
+    and atleast one special character. Returns True if conform and False if not.
+    '''
+    min_len = 12
+    includes_letter = False
+    includes_number = False
+    includes_special = False
+
+    valid_special_char = '[@_!#$%^&*()<>?/\}{~:;]-.,' #pylint: disable=anomalous-backslash-in-string
+
+    if len(password) < min_len:
+        return False
+    for char in password:
+        if char.isalpha():
+            includes_letter = True
+        elif char.isnumeric():
+            includes_number = True
+        elif char in valid_special_char:
+            includes_special = True
+    if includes_special and includes_number and includes_letter:
+        return True
+    return False
+
+
+def is_valid_url(url:str) -> bool:
+    '''Checks if a source url is a valid url.'''
+    return checkers.is_url(url) is not False